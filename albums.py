@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Отправка пачки медиа минимальным числом запросов к Bot API.
+Правила Telegram для sendMediaGroup: от 2 до 10 элементов; фото и видео можно
+смешивать в одном альбоме, документы группируются только с документами.
+  - plan_albums() делит элементы (InputMedia) на дорожки — visual (фото и
+    видео) и document — и режет каждую по порядку на ceil(n / 10) альбомов
+    почти равного размера (11 -> 6 + 5, а не 10 + 1); одиночный элемент
+    уходит sendPhoto / sendVideo / sendDocument;
+  - AlbumSender отправляет дорожки параллельно, альбомы внутри дорожки — по
+    порядку. Неудачный альбом повторяется отдельно от остальных: 429 — после
+    retry_after, ошибка сети и 5xx — с растущей паузой; альбом, отклонённый
+    с 400 (например, один битый file_id), досылается по одному элементу.
+При SEND_QUEUE=1 альбомы ставятся в очередь чата (send_queue): порядок,
+лимиты и повторы на 429 обеспечивает она.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from send_queue import _retry_after
+from config import env_int, print_log
+
+
+MEDIA_GROUP_MAX = 10
+ALBUM_SEND_THREADS = env_int("ALBUM_SEND_THREADS", 4)
+ALBUM_SEND_ATTEMPTS = env_int("ALBUM_SEND_ATTEMPTS", 3)
+# Дольше ждать retry_after в потоке обработчика не имеет смысла — альбом считается неотправленным
+ALBUM_MAX_RETRY_WAIT = env_int("ALBUM_MAX_RETRY_WAIT", 30)
+
+_LANES = {"photo": "visual", "video": "visual", "document": "document"}
+_SINGLE_METHODS = {"photo": "send_photo", "video": "send_video", "document": "send_document"}
+
+
+class AlbumChunk:
+    """Один запрос: альбом (2..10 элементов) или одиночный элемент"""
+
+    __slots__ = ("lane", "items")
+
+    def __init__(self, lane: str, items: list):
+        self.lane = lane
+        self.items = items
+
+    @property
+    def method(self) -> str:
+        return "sendMediaGroup" if len(self.items) > 1 else f"send{self.items[0]['type'].capitalize()}"
+
+    def __repr__(self):
+        return f"AlbumChunk({self.lane}, {len(self.items)} items)"
+
+
+def plan_albums(items: list, limit: int = MEDIA_GROUP_MAX) -> list:
+    """InputMedia ({"type", "media", "caption"?, "parse_mode"?}) -> [AlbumChunk]; порядок внутри дорожки сохраняется"""
+    lanes = {}
+    for item in items:
+        lanes.setdefault(_LANES[item["type"]], []).append(item)
+    chunks = []
+    for lane, lane_items in lanes.items():
+        count = -(-len(lane_items) // limit)
+        size, extra = divmod(len(lane_items), count)
+        start = 0
+        for i in range(count):
+            end = start + size + (1 if i < extra else 0)
+            chunks.append(AlbumChunk(lane, lane_items[start:end]))
+            start = end
+    return chunks
+
+
+def chunk_call(client, chat_id, chunk: AlbumChunk, timeout=10):
+    """(fn, args, kwargs) запроса для чанка — для прямого вызова или очереди отправки"""
+    if len(chunk.items) > 1:
+        return client.send_media_group, (chat_id, chunk.items), {"timeout": timeout}
+    item = chunk.items[0]
+    fn = getattr(client, _SINGLE_METHODS[item["type"]])
+    return fn, (chat_id, item["media"]), {"caption": item.get("caption") or None,
+                                          "parse_mode": item.get("parse_mode"), "timeout": timeout}
+
+
+class AlbumSender:
+    """Дорожки — параллельно в общем пуле потоков, альбомы внутри дорожки — по порядку"""
+
+    def __init__(self, client, threads: int = None, attempts: int = None, max_retry_wait: float = None, log=None):
+        self.client = client
+        self.attempts = attempts or ALBUM_SEND_ATTEMPTS
+        self.max_retry_wait = ALBUM_MAX_RETRY_WAIT if max_retry_wait is None else max_retry_wait
+        self.log = log or print_log
+        self._pool = ThreadPoolExecutor(max_workers=threads or ALBUM_SEND_THREADS, thread_name_prefix="album-send")
+        self._lock = threading.Lock()
+        self._counters = {"batches": 0, "requests": 0, "retried": 0, "split": 0, "failed": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def send(self, chat_id, chunks: list) -> bool:
+        """Отправить чанки plan_albums(); False — хотя бы один элемент не доставлен"""
+        lanes = {}
+        for chunk in chunks:
+            lanes.setdefault(chunk.lane, []).append(chunk)
+        if not lanes:
+            return True
+        self._count("batches")
+        first, *rest = lanes.values()
+        futures = [self._pool.submit(self._send_lane, chat_id, lane) for lane in rest]
+        ok = self._send_lane(chat_id, first)
+        for f in futures:
+            ok = f.result() and ok
+        return ok
+
+    def _send_lane(self, chat_id, lane: list) -> bool:
+        ok = True
+        for chunk in lane:
+            # Неудача одного альбома не останавливает следующие
+            ok = self._send_chunk(chat_id, chunk) and ok
+        return ok
+
+    def _send_chunk(self, chat_id, chunk: AlbumChunk) -> bool:
+        fn, args, kwargs = chunk_call(self.client, chat_id, chunk)
+        tag = f"{chunk.method}Fail"
+        for attempt in range(1, self.attempts + 1):
+            self._count("requests")
+            try:
+                r = fn(*args, **kwargs)
+            except Exception as e:
+                reason, pause = str(e), min(2 ** (attempt - 1), self.max_retry_wait)
+            else:
+                if r.ok:
+                    return True
+                if r.status_code == 429:
+                    reason, pause = "429", _retry_after(r)
+                elif r.status_code >= 500:
+                    reason, pause = f"{r.status_code}", min(2 ** (attempt - 1), self.max_retry_wait)
+                else:
+                    self.log(f"{r.status_code} {r.text}", tag)
+                    if r.status_code == 400 and len(chunk.items) > 1:
+                        # Альбом целиком отклонён — остальные элементы доходят по одному
+                        self._count("split")
+                        singles = [AlbumChunk(chunk.lane, [item]) for item in chunk.items]
+                        return all([self._send_chunk(chat_id, single) for single in singles])
+                    self._count("failed")
+                    return False
+            if attempt == self.attempts or pause > self.max_retry_wait:
+                break
+            self._count("retried")
+            time.sleep(pause)
+        self.log(f"{chunk.method} to {chat_id} failed after {attempt} attempts: {reason}", tag)
+        self._count("failed")
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+
+def get_album_sender(client, log=None) -> AlbumSender:
+    """Общий отправитель на процесс (после fork пул потоков создаётся заново)"""
+    pid = os.getpid()
+    sender = _senders.get(pid)
+    if sender is None:
+        with _senders_lock:
+            sender = _senders.get(pid)
+            if sender is None:
+                sender = _senders[pid] = AlbumSender(client, log=log)
+    return sender
+
+
+def album_stats():
+    """Счётчики отправителя текущего процесса; None — альбомы ещё не отправлялись"""
+    sender = _senders.get(os.getpid())
+    return sender.stats() if sender is not None else None
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Уведомления администратора о критичных ошибках.
+report() только записывает событие и сразу возвращается — отправляет
+фоновый поток. Повторы одной ошибки (ключ — тип исключения + контекст)
+в пределах окна ALERT_WINDOW сворачиваются в одну сводку «N повторов»,
+а общий бюджет (ALERT_BUDGET_PER_HOUR, всплеск ALERT_BURST) не даёт
+завалить чат во время аварии: то, что не влезло в бюджет, уйдёт сводкой позже.
+"""
+import time
+import threading
+
+from send_queue import TokenBucket
+from config import env_int, print_log
+
+
+ALERT_WINDOW = env_int("ALERT_WINDOW", 300)
+ALERT_BUDGET_PER_HOUR = env_int("ALERT_BUDGET_PER_HOUR", 20)
+ALERT_BURST = env_int("ALERT_BURST", 5)
+# Сколько разных ключей держать одновременно (остальные только считаются)
+ALERT_MAX_KEYS = env_int("ALERT_MAX_KEYS", 200)
+
+
+class _Group:
+    __slots__ = ("text", "pending", "total", "window_start", "announced")
+
+    def __init__(self, text, now):
+        self.text = text
+        self.pending = 1        # не отправленные повторы
+        self.total = 1
+        self.window_start = now
+        self.announced = False  # первое сообщение уже ушло (или ушло в сводку)
+
+
+class AlertAggregator:
+    """Дедупликация и бюджет уведомлений; send_fn(text) вызывается из фонового потока"""
+
+    def __init__(self, send_fn, window: int = None, budget_per_hour: int = None, burst: int = None,
+                 max_keys: int = None, log=None):
+        self.send_fn = send_fn
+        self.window = window or ALERT_WINDOW
+        rate = (budget_per_hour or ALERT_BUDGET_PER_HOUR) / 3600.0
+        self.budget = TokenBucket(rate, burst or ALERT_BURST)
+        self.max_keys = max_keys or ALERT_MAX_KEYS
+        self.log = log or print_log
+        self._cond = threading.Condition()
+        self._groups = {}
+        self._thread = None
+        self._counters = {"reported": 0, "sent": 0, "digests": 0, "deferred": 0,
+                          "overflow": 0, "send_errors": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="alerts", daemon=True)
+            self._thread.start()
+        return self
+
+    def report(self, key, text: str):
+        """Зарегистрировать ошибку; не блокирует и не ходит в сеть"""
+        now = time.monotonic()
+        with self._cond:
+            self._counters["reported"] += 1
+            g = self._groups.get(key)
+            if g is None:
+                if len(self._groups) >= self.max_keys:
+                    self._counters["overflow"] += 1
+                    return
+                self._groups[key] = _Group(text, now)
+                self._cond.notify()
+            else:
+                g.text = text
+                g.pending += 1
+                g.total += 1
+
+    def _take_due(self, now) -> list:
+        """Сообщения к отправке на этом шаге: [(key, группа, текст), ...]; вызывается под блокировкой"""
+        due = []
+        for key in list(self._groups):
+            g = self._groups[key]
+            expired = now - g.window_start >= self.window
+            if not g.announced or (g.pending and expired):
+                text = g.text
+                if g.pending > 1 or g.announced:
+                    text = f"🔁 {g.pending} повторів за {int(now - g.window_start)} с\n{g.text}"
+                due.append((key, g, text))
+            elif not g.pending and expired:
+                # Тихо всё окно — следующая такая ошибка снова придёт сразу
+                del self._groups[key]
+        return due
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait(1.0)
+                now = time.monotonic()
+                due = self._take_due(now)
+                to_send = []
+                for key, g, text in due:
+                    if self.budget.delay(now) > 0:
+                        # Бюджет исчерпан: повтор остаётся в pending и уйдёт сводкой
+                        g.announced = True
+                        self._counters["deferred"] += 1
+                        continue
+                    self.budget.reserve(now)
+                    self._counters["digests" if g.announced else "sent"] += 1
+                    g.announced = True
+                    g.pending = 0
+                    g.window_start = now
+                    to_send.append(text)
+            for text in to_send:
+                try:
+                    self.send_fn(text)
+                except Exception as e:
+                    with self._cond:
+                        self._counters["send_errors"] += 1
+                    self.log(f"alert delivery failed: {str(e)}", 'WARN')
+
+    def stats(self) -> dict:
+        with self._cond:
+            res = dict(self._counters)
+            res["open_keys"] = len(self._groups)
+        return res
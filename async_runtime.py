@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный режим запуска бота (aiohttp).
+Тот же маршрут /webhook/<TOKEN> и те же обработчики bot.process_update;
+все исходящие вызовы Bot API выполняются неблокирующе в event loop,
+а обработчики (БД, состояние) — в пуле потоков вне event loop.
+
+Ограничения параллельности:
+  - обработчиков одновременно — не больше ASYNC_HANDLER_THREADS: код
+    обработчиков синхронный (БД, блокировки состояния). Остальные апдейты
+    ждут свободный поток, не занимая его, с открытым запросом Telegram;
+  - отправки обработчик только ставит в AsyncDispatcher и не ждёт, поэтому
+    поток не простаивает на ответе Telegram. Ожидающих вызовов Bot API могут
+    быть тысячи, одновременных соединений — не больше TG_POOL_SIZE.
+
+Запуск: python async_runtime.py
+"""
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+from tg_api import BotApiMethods, TELEGRAM_API_URL, TG_POOL_SIZE, JSON_HEADERS
+from codec import encode_body, loads
+from send_queue import (
+    TokenBucket, set_send_queue, _retry_after,
+    SEND_QUEUE_GLOBAL_RATE, SEND_QUEUE_CHAT_RATE, SEND_QUEUE_CHAT_BURST, SEND_QUEUE_MAX_ATTEMPTS,
+)
+from update_workers import update_chat_id
+from metrics import observe_api_call
+from config import print_log
+
+# Потолок одновременно выполняемых обработчиков (см. docstring модуля)
+try:
+    ASYNC_HANDLER_THREADS = max(int(os.getenv("ASYNC_HANDLER_THREADS", "16")), 1)
+except ValueError:
+    ASYNC_HANDLER_THREADS = 16
+
+
+class AsyncResponse:
+    """Минимальный аналог requests.Response для кода, который проверяет .ok/.text"""
+
+    def __init__(self, status_code: int, text: str, headers=None):
+        self.status_code = status_code
+        self.ok = 200 <= status_code < 400
+        self.text = text
+        self.headers = headers or {}
+
+    def json(self):
+        return loads(self.text)
+
+
+class AsyncBotApiClient(BotApiMethods):
+    """Те же типизированные методы, что у tg_api.BotApiClient, но call() — корутина"""
+
+    def __init__(self, token: str, base_url: str = None, pool_size: int = None):
+        self.token = token
+        self.base_url = (base_url or TELEGRAM_API_URL).rstrip("/")
+        self.pool_size = pool_size or TG_POOL_SIZE
+        self.session = None
+        self._requests = 0
+        self._errors = 0
+        self._by_method = {}
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def call(self, method: str, data=None, files=None, timeout=10):
+        self._requests += 1
+        self._by_method[method] = self._by_method.get(method, 0) + 1
+        # Тело JSON, как у BotApiClient: reply_markup / media — объекты, bool — true/false
+        body = encode_body(data or {})
+        started = time.perf_counter()
+        try:
+            async with self.session.post(self.method_url(method), data=body, headers=JSON_HEADERS,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                result = AsyncResponse(resp.status, await resp.text(), dict(resp.headers))
+        except Exception:
+            self._errors += 1
+            observe_api_call(method, started, "error")
+            raise
+        observe_api_call(method, started, result.status_code)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "requests": self._requests,
+            "errors": self._errors,
+            "pool_size": self.pool_size,
+            "by_method": dict(self._by_method),
+        }
+
+
+class AsyncDispatcher:
+    """
+    Замена send_queue.OutboundQueue для асинхронного режима: тот же submit(),
+    но вызов выполняется корутиной в event loop. Порядок внутри чата — через
+    asyncio.Lock (FIFO), лимиты — те же token bucket'ы.
+    """
+
+    def __init__(self, loop, client: AsyncBotApiClient, log=None):
+        self.loop = loop
+        self.client = client
+        self.log = log or print_log
+        self._global = TokenBucket(SEND_QUEUE_GLOBAL_RATE, SEND_QUEUE_GLOBAL_RATE)
+        self._chats = {}
+        self._depth = 0
+        self._counters = {"submitted": 0, "sent": 0, "failed": 0, "retried_429": 0, "retried_error": 0}
+
+    def submit(self, chat_id, fn, args=(), kwargs=None, tag='Помилка надсилання'):
+        """Потокобезопасно: fn — метод BotApiClient, берётся одноимённый метод асинхронного клиента"""
+        method = getattr(self.client, fn.__name__)
+        return asyncio.run_coroutine_threadsafe(self._send(chat_id, method, args, kwargs or {}, tag), self.loop)
+
+    def depth(self) -> int:
+        return self._depth
+
+    def stats(self) -> dict:
+        res = dict(self._counters)
+        res["depth"] = self._depth
+        res["chats_pending"] = len(self._chats)
+        return res
+
+    async def _send(self, chat_id, method, args, kwargs, tag):
+        self._depth += 1
+        self._counters["submitted"] += 1
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            # [lock, bucket, число ожидающих вызовов]
+            entry = self._chats[chat_id] = [asyncio.Lock(), TokenBucket(SEND_QUEUE_CHAT_RATE, SEND_QUEUE_CHAT_BURST), 0]
+        entry[2] += 1
+        try:
+            async with entry[0]:
+                return await self._send_locked(method, args, kwargs, tag, entry[1], chat_id)
+        finally:
+            self._depth -= 1
+            entry[2] -= 1
+            if entry[2] == 0 and self._chats.get(chat_id) is entry:
+                del self._chats[chat_id]
+
+    async def _send_locked(self, method, args, kwargs, tag, bucket, chat_id):
+        attempts = 0
+        while True:
+            attempts += 1
+            wait = bucket.reserve(time.monotonic())
+            wait = max(wait, self._global.reserve(time.monotonic()))
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                resp = await method(*args, **kwargs)
+            except Exception as e:
+                if attempts < SEND_QUEUE_MAX_ATTEMPTS:
+                    self._counters["retried_error"] += 1
+                    await asyncio.sleep(min(2 ** attempts, 30))
+                    continue
+                self._counters["failed"] += 1
+                self.log(str(e), tag)
+                raise
+            if resp.status_code == 429 and attempts < SEND_QUEUE_MAX_ATTEMPTS:
+                pause = _retry_after(resp)
+                self._counters["retried_429"] += 1
+                self.log(f"429 for chat {chat_id}, retry in {pause}s", 'WARN')
+                await asyncio.sleep(pause)
+                continue
+            if resp.ok:
+                self._counters["sent"] += 1
+            else:
+                self._counters["failed"] += 1
+                self.log(f"{resp.status_code} {resp.text}", tag)
+            return resp
+
+
+def build_app(bot) -> web.Application:
+    """aiohttp-приложение поверх обработчиков модуля bot"""
+    executor = ThreadPoolExecutor(max_workers=ASYNC_HANDLER_THREADS, thread_name_prefix="async-handler")
+    chat_locks = {}
+
+    async def on_startup(app):
+        client = AsyncBotApiClient(bot.TOKEN)
+        await client.start()
+        dispatcher = AsyncDispatcher(asyncio.get_running_loop(), client, log=bot.MainProtokol)
+        set_send_queue(dispatcher)
+        # Все отправки из обработчиков идут через dispatcher и не блокируют потоки
+        bot.SEND_QUEUE_ENABLED = True
+        app["client"] = client
+        app["dispatcher"] = dispatcher
+
+    async def on_cleanup(app):
+        await app["client"].close()
+        executor.shutdown(wait=True)
+
+    async def webhook(request):
+        # Тело разбирается в пуле обработчиков, а не в event loop (chat_id — без разбора)
+        update = bot.parse_update(await request.read(), lazy=True)
+        if update is None:
+            return web.Response(text="ok")
+        chat_id = update_chat_id(update)
+        entry = chat_locks.get(chat_id)
+        if entry is None:
+            entry = chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Апдейты одного чата обрабатываются по порядку, разных — параллельно
+            async with entry[0]:
+                await asyncio.get_running_loop().run_in_executor(executor, bot.process_update, update)
+        except Exception as e:
+            bot.cool_error_handler(e, context="async webhook")
+            return web.Response(text="Internal server error.", status=500)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and chat_locks.get(chat_id) is entry:
+                del chat_locks[chat_id]
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(f"/webhook/{bot.TOKEN}", webhook)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main():
+    import bot
+    port = int(os.getenv("PORT", "5000"))
+    print(f"[INFO] Async runtime: up to {ASYNC_HANDLER_THREADS} concurrent handlers, "
+          f"{TG_POOL_SIZE} Bot API connections")
+    web.run_app(build_app(bot), port=port)
+
+
+if __name__ == "__main__":
+    main()
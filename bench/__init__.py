@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный стенд бота без настоящего Telegram.
+  - fake_api.FakeBotApi — локальный HTTP-сервер с методами Bot API
+    (задержка ответа и 429 настраиваются);
+  - scenarios.build_plan() — детерминированный (seed) набор сессий с
+    синтетическими апдейтами: альбомы, спам статистики, ответы админа, addstat_;
+  - loadgen.run_load() — прогон плана через /webhook/<TOKEN>;
+  - replay.replay() — воспроизведение записанного трафика (capture.py)
+    в реальном темпе, в N раз быстрее или без пауз;
+  - report — updates/s, p50/p95/p99, исходящие вызовы на апдейт, сравнение прогонов;
+  - codec_bench — микробенчмарк JSON-кодека на апдейтах разного размера.
+
+Запуск: python -m bench run --sessions 200 --concurrency 8 --out results.json
+        python -m bench replay captures/updates-*.jsonl.gz --speed 10
+"""
+from bench.fake_api import FakeBotApi
+from bench.scenarios import build_plan
+from bench.loadgen import run_load
+from bench.replay import replay, load_records
+from bench.report import summarize, format_report, compare_reports
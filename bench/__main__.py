@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный прогон бота.
+  python -m bench run [--sessions N] [--concurrency N] [--latency-ms X] [--rate-429 P] [--out report.json]
+      поднимает фейковый Bot API, импортирует bot.py с временной SQLite и гонит
+      план через Flask test client (или --url на уже запущенный бот);
+  python -m bench replay FILE [FILE ...] [--speed 1|N|max] [--via webhook|dispatch]
+      воспроизвести записанный трафик (CAPTURE_UPDATES=1, capture.py) в том же окружении;
+  python -m bench fake-api [--port 8081]
+      только фейковый Bot API (для бота под gunicorn: TELEGRAM_API_URL=http://127.0.0.1:8081);
+  python -m bench compare base.json new.json
+  python -m bench codec
+      микробенчмарк JSON-кодека (codec.py) на апдейтах типичных размеров
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from bench.fake_api import FakeBotApi
+from bench.scenarios import build_plan, parse_mix, DEFAULT_MIX
+from bench.loadgen import InProcessTarget, HttpTarget, DispatchTarget, run_load, wait_quiet
+from bench.replay import load_records, replay
+from bench.report import summarize, format_report, compare_reports
+from bench.codec_bench import run_codec_bench, format_codec_report
+from capture import ANON_ADMIN_ID
+
+BENCH_TOKEN = "123456:BENCH"
+
+
+def _prepare_env(args, api_url: str) -> str:
+    """Окружение для import bot: фейковый API, временная БД и логи вне рабочего каталога"""
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    os.environ["TELEGRAM_API_URL"] = api_url
+    os.environ["API_TOKEN"] = args.token or BENCH_TOKEN
+    os.environ["ADMIN_ID"] = str(args.admin_id)
+    # setWebhook при импорте тоже уходит в фейковый API
+    os.environ["WEBHOOK_HOST"] = "bench.local"
+    os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(workdir, "bench.db")
+    # Синтетику и воспроизведение не записываем повторно
+    os.environ["CAPTURE_UPDATES"] = "0"
+    os.environ.setdefault("LOG_FILE", os.path.join(workdir, "log.txt"))
+    os.environ.setdefault("LOG_ERRORS_FILE", os.path.join(workdir, "critical_errors.log"))
+    os.environ.setdefault("LOG_SLOW_FILE", os.path.join(workdir, "slow_updates.log"))
+    os.environ.setdefault("PROFILE_DIR", os.path.join(workdir, "profiles"))
+    return workdir
+
+
+def _fake_api(args) -> FakeBotApi:
+    return FakeBotApi(host=args.api_host, port=args.api_port, latency_ms=args.latency_ms,
+                      jitter_ms=args.jitter_ms, rate_429=args.rate_429, retry_after=args.retry_after,
+                      seed=args.seed)
+
+
+def _target(args, bot):
+    if args.url:
+        return HttpTarget(args.url.rstrip("/") + f"/webhook/{os.environ['API_TOKEN']}")
+    if getattr(args, "via", "webhook") == "dispatch":
+        return DispatchTarget(bot)
+    return InProcessTarget(bot.app, f"/webhook/{bot.TOKEN}")
+
+
+def _finish(args, report) -> int:
+    print(format_report(report))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] report written to {args.out}")
+    return 0
+
+
+def cmd_run(args):
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    api = _fake_api(args).start()
+    workdir = _prepare_env(args, api.url)
+    # bot.py импортируется только после настройки окружения
+    import bot
+    # setWebhook при импорте в отчёт не входит
+    api.reset()
+    target = _target(args, bot)
+    plan = build_plan(args.sessions, seed=args.seed, mix=mix, admin_id=args.admin_id, t=bot.t)
+    print(f"[INFO] fake API {api.url}, workdir {workdir}, "
+          f"{sum(len(s['updates']) for s in plan)} updates in {len(plan)} sessions")
+
+    if args.warmup:
+        run_load(build_plan(args.warmup, seed=args.seed + 1, mix=mix, admin_id=args.admin_id, t=bot.t),
+                 target, concurrency=args.concurrency)
+        wait_quiet(api, timeout=args.drain_timeout)
+        api.reset()
+
+    result = run_load(plan, target, concurrency=args.concurrency, think_ms=args.think_ms)
+    drain = wait_quiet(api, timeout=args.drain_timeout) if not args.url else 0.0
+    params = {
+        "sessions": args.sessions, "seed": args.seed, "concurrency": args.concurrency, "mix": mix,
+        "warmup": args.warmup, "think_ms": args.think_ms, "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms, "rate_429": args.rate_429, "retry_after": args.retry_after,
+        "target": "http" if args.url else "in-process",
+        "database": (os.environ["DATABASE_URL"].split(":", 1)[0]),
+    }
+    # При --url бот может ходить не в этот фейковый API — тогда исходящие вызовы не видны
+    report = summarize(result, api.stats() if not args.url else None, params, drain_seconds=drain)
+    api.stop()
+    return _finish(args, report)
+
+
+def _parse_speed(value: str) -> float:
+    """'1' / '10' / '10x' / 'max' -> множитель (0 — без пауз)"""
+    value = value.strip().lower()
+    if value in ("max", "0", ""):
+        return 0.0
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def cmd_replay(args):
+    records = load_records(args.files, limit=args.limit)
+    if not records:
+        print("[ERROR] no updates in capture files")
+        return 1
+    api = _fake_api(args).start()
+    workdir = _prepare_env(args, api.url)
+    import bot
+    api.reset()
+    target = _target(args, bot)
+    print(f"[INFO] fake API {api.url}, workdir {workdir}, {len(records)} updates, "
+          f"recorded span {records[-1][0] - records[0][0]:.1f} s, speed {args.speed or 'max'}")
+    result = replay(records, target, speed=args.speed, concurrency=args.concurrency, label_fn=bot.update_kind)
+    drain = wait_quiet(api, timeout=args.drain_timeout) if not args.url else 0.0
+    params = {
+        "files": [os.path.basename(p) for p in args.files], "updates": len(records), "speed": args.speed,
+        "concurrency": args.concurrency, "via": "http" if args.url else args.via,
+        "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "rate_429": args.rate_429,
+        "retry_after": args.retry_after, "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+    }
+    report = summarize(result, api.stats() if not args.url else None, params, drain_seconds=drain)
+    api.stop()
+    return _finish(args, report)
+
+
+def cmd_fake_api(args):
+    api = _fake_api(args).start()
+    print(f"[INFO] fake Bot API on {api.url} (latency {args.latency_ms} ms, 429 rate {args.rate_429}); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            print(f"[INFO] {api.stats()}")
+    except KeyboardInterrupt:
+        pass
+    print(f"[INFO] {api.stats()}")
+    api.stop()
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(compare_reports(base, new))
+    return 0
+
+
+def cmd_codec(args):
+    result = run_codec_bench(min_time=args.min_time)
+    print(format_codec_report(result))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] report written to {args.out}")
+    return 0
+
+
+def _add_api_args(p):
+    p.add_argument("--api-host", default="127.0.0.1")
+    p.add_argument("--api-port", type=int, default=0, help="0 — свободный порт")
+    p.add_argument("--latency-ms", type=float, default=20.0, help="задержка ответа фейкового API")
+    p.add_argument("--jitter-ms", type=float, default=5.0)
+    p.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429 (0..1)")
+    p.add_argument("--retry-after", type=int, default=1)
+    p.add_argument("--seed", type=int, default=1)
+
+
+def _add_bot_args(p):
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--admin-id", type=int, default=ANON_ADMIN_ID)
+    p.add_argument("--token", default=None, help="токен бота (путь /webhook/<TOKEN>)")
+    p.add_argument("--database-url", default=None, help="по умолчанию — временная SQLite")
+    p.add_argument("--url", default=None, help="базовый URL запущенного бота вместо прогона в процессе")
+    p.add_argument("--drain-timeout", type=float, default=30.0, help="ждать фоновые отправки не дольше, с")
+    p.add_argument("--out", default=None, help="записать отчёт JSON")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Нагрузочный прогон бота")
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+
+    p = sub.add_parser("run", help="прогнать синтетические апдейты через webhook")
+    _add_api_args(p)
+    _add_bot_args(p)
+    p.add_argument("--sessions", type=int, default=200)
+    p.add_argument("--mix", default=None, help=f"доли сценариев, напр. 'stats_spam=2,media_burst=1' ({', '.join(DEFAULT_MIX)})")
+    p.add_argument("--warmup", type=int, default=20, help="сессий прогрева (не входят в отчёт)")
+    p.add_argument("--think-ms", type=float, default=0.0, help="пауза между апдейтами сессии")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("replay", help="воспроизвести записанные апдейты (capture.py)")
+    _add_api_args(p)
+    _add_bot_args(p)
+    p.add_argument("files", nargs="+", help="файлы updates-*.jsonl.gz (несколько — сливаются по времени)")
+    p.add_argument("--speed", type=_parse_speed, default=1.0, help="1 — исходный темп, N — в N раз быстрее, max — без пауз")
+    p.add_argument("--via", choices=["webhook", "dispatch"], default="webhook",
+                   help="через Flask-маршрут webhook или сразу bot.dispatch_update")
+    p.add_argument("--limit", type=int, default=None, help="только первые N апдейтов")
+    p.set_defaults(func=cmd_replay)
+
+    p = sub.add_parser("fake-api", help="только фейковый Bot API")
+    _add_api_args(p)
+    p.set_defaults(api_port=8081)
+    p.add_argument("--stats-interval", type=float, default=10.0)
+    p.set_defaults(func=cmd_fake_api)
+
+    p = sub.add_parser("compare", help="сравнить два отчёта JSON")
+    p.add_argument("base")
+    p.add_argument("new")
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser("codec", help="микробенчмарк JSON-кодека")
+    p.add_argument("--min-time", type=float, default=0.2, help="секунд на замер")
+    p.add_argument("--out", default=None, help="записать результат JSON")
+    p.set_defaults(func=cmd_codec)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк JSON-кодека (codec.py) на апдейтах типичных размеров.
+Разбор: как было (bytes -> str -> json.loads), loads(bytes) каждого доступного
+бэкенда, lazy_update() + peek_chat_id() без разбора тела (работа webhook
+в режиме ack-first при LAZY_UPDATES) и с полным разбором. Кодирование: тело sendMessage / sendMediaGroup формой с
+json.dumps вложенных полей и urlencode (как было) и encode_body() одним проходом.
+
+Запуск: python -m bench codec [--min-time 0.2]
+"""
+import json
+import random
+import timeit
+from urllib.parse import urlencode
+
+import codec
+from bench.scenarios import _Builder
+
+_LONG_TEXT = ("Сьогодні о 14:30 на перехресті вулиць Шевченка та Франка сталася ДТП за участі двох "
+              "автомобілів, рух ускладнено, на місці працюють рятувальники та поліція. ") * 6
+
+
+def _telegram_body(update: dict) -> bytes:
+    """Тело, как его присылает Telegram: компактный JSON, перенос строки после update_id"""
+    raw = json.dumps(update, ensure_ascii=False, separators=(",", ":"))
+    return raw.replace(",", ",\n", 1).encode("utf-8")
+
+
+def sample_updates(seed: int = 1) -> dict:
+    """{название: тело} — от нажатия кнопки до пачки getUpdates"""
+    b = _Builder(random.Random(seed), lambda key, language: key, admin_id=1000, language="uk")
+    uid = 10_000_001
+    reply = b.text(uid, "Дякую, інформацію отримали")
+    reply["message"]["reply_to_message"] = b.photo(uid, caption=_LONG_TEXT[:300])["message"]
+    samples = {
+        "text (button)": b.text(uid, "📊 Статистика"),
+        "callback": b.callback(1000, f"confirm_addstat|{uid}|42|3"),
+        "photo + caption": b.photo(uid, group="g1", caption="Опис події"),
+        "long text": b.text(uid, _LONG_TEXT),
+        "reply with photo": reply,
+    }
+    bodies = {name: _telegram_body(u) for name, u in samples.items()}
+    batch = [b.photo(uid, group="g2") if i % 3 else b.text(uid, _LONG_TEXT[:200]) for i in range(100)]
+    bodies["getUpdates x100"] = json.dumps({"ok": True, "result": batch}, ensure_ascii=False,
+                                           separators=(",", ":")).encode("utf-8")
+    return bodies
+
+
+def _backends() -> dict:
+    found = {"json": json.loads}
+    try:
+        import orjson
+        found["orjson"] = orjson.loads
+    except ImportError:
+        pass
+    return found
+
+
+def _time(fn, min_time: float) -> float:
+    """Микросекунд на вызов (лучший из трёх замеров)"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(int(number * min_time / max(elapsed, 1e-9)), 1)
+    return min(timer.repeat(3, number)) / number * 1e6
+
+
+def _outbound_samples() -> dict:
+    keyboard = {"inline_keyboard": [[{"text": f"Категорія {i}", "callback_data": f"confirm_addstat|10000001|42|{i}"}
+                                     for i in range(j, j + 2)] for j in range(0, 6, 2)]}
+    media = [{"type": "photo", "media": f"bench-photo-{i:012x}", **({"caption": _LONG_TEXT[:200], "parse_mode": "HTML"} if i == 0 else {})}
+             for i in range(10)]
+    return {
+        "sendMessage + keyboard": ({"chat_id": 1000, "text": _LONG_TEXT[:400], "parse_mode": "HTML"}, "reply_markup", keyboard),
+        "sendMediaGroup x10": ({"chat_id": 1000}, "media", media),
+    }
+
+
+def run_codec_bench(min_time: float = 0.2) -> dict:
+    bodies = sample_updates()
+    backends = _backends()
+    parse = []
+    for name, body in bodies.items():
+        row = {"sample": name, "bytes": len(body),
+               "str+json.loads": _time(lambda: json.loads(body.decode("utf-8")), min_time)}
+        for backend, loads in backends.items():
+            row[f"{backend}(bytes)"] = _time(lambda: loads(body), min_time)
+        if name != "getUpdates x100":
+            # lazy_update на каждом вызове создаёт новый LazyUpdate — разбор тела не кэшируется.
+            # ack-first webhook: конверт + chat_id для шарда, тело разбирает воркер
+            row["lazy envelope"] = _time(lambda: codec.lazy_update(body).peek_chat_id(), min_time)
+            row["lazy + load"] = _time(lambda: codec.lazy_update(body).load(), min_time)
+        parse.append(row)
+
+    encode = []
+    for name, (fields, key, nested) in _outbound_samples().items():
+        encoded = codec.RawJSON(codec.dumps(nested))
+        encode.append({
+            "sample": name,
+            "form (urlencoded)": _time(lambda: urlencode({**fields, key: json.dumps(nested)}), min_time),
+            "encode_body": _time(lambda: codec.encode_body({**fields, key: nested}), min_time),
+            "encode_body(raw)": _time(lambda: codec.encode_body({**fields, key: encoded}), min_time),
+        })
+    return {"backend": codec.BACKEND, "lazy": codec.LAZY_UPDATES, "backends": list(backends),
+            "parse": parse, "encode": encode}
+
+
+def format_codec_report(result: dict) -> str:
+    lines = [f"codec backend: {result['backend']} (available: {', '.join(result['backends'])}), "
+             f"lazy updates: {'on' if result.get('lazy') else 'off'}; us per call"]
+    for section in ("parse", "encode"):
+        rows = result[section]
+        cols = [c for c in rows[0] if c != "sample"]
+        lines.append("")
+        lines.append(f"{section:<24}" + "".join(f"{c:>18}" for c in cols))
+        for row in rows:
+            cells = []
+            for c in cols:
+                value = row.get(c)
+                cells.append(f"{'-':>18}" if value is None else f"{value:>18}" if c == "bytes" else f"{value:>18.2f}")
+            lines.append(f"{row['sample']:<24}" + "".join(cells))
+    return "\n".join(lines)
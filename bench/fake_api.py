@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Локальная замена api.telegram.org для нагрузочных прогонов.
+Понимает POST /bot<token>/<method> с телом form-urlencoded, JSON или multipart
+и отвечает в формате Bot API ({"ok": true, "result": ...}). Задержка ответа
+(latency_ms ± jitter_ms) и доля ответов 429 с retry_after задаются при
+создании; случайность — от seed, чтобы прогоны были сравнимы.
+"""
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SUPPORTED_METHODS = (
+    "sendMessage", "sendPhoto", "sendVideo", "sendDocument", "sendMediaGroup",
+    "sendChatAction", "setWebhook", "getMe",
+)
+
+
+def _parse_body(content_type: str, body: bytes) -> dict:
+    if content_type.startswith("application/json"):
+        try:
+            data = json.loads(body or b"{}")
+            return data if isinstance(data, dict) else {}
+        except ValueError:
+            return {}
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {k: v[-1] for k, v in parse_qs(body.decode("utf-8", "replace")).items()}
+    # multipart (загрузка файлов) не разбираем: для замера достаточно размера тела
+    return {}
+
+
+class FakeBotApi:
+    """with FakeBotApi(latency_ms=30, rate_429=0.01) as api: ... api.url, api.stats()"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, rate_429: float = 0.0, retry_after: int = 1, seed: int = 1):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._calls = {}
+        self._throttled = {}
+        self._bytes_in = 0
+        self._last_call = 0.0
+        self.webhook_url = None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- учёт ----
+
+    def _decide(self, method: str, size: int):
+        """(задержка, ответить ли 429) — под блокировкой, чтобы последовательность не зависела от потоков"""
+        with self._lock:
+            self._calls[method] = self._calls.get(method, 0) + 1
+            self._bytes_in += size
+            self._last_call = time.monotonic()
+            delay = self.latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+            throttle = self.rate_429 > 0 and self._rng.random() < self.rate_429
+            if throttle:
+                self._throttled[method] = self._throttled.get(method, 0) + 1
+            return max(delay, 0.0), throttle
+
+    def _next_message_id(self) -> int:
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._throttled.clear()
+            self._bytes_in = 0
+
+    def idle_for(self) -> float:
+        """Секунд с последнего входящего вызова (для ожидания фоновых отправок)"""
+        with self._lock:
+            last = self._last_call
+        return time.monotonic() - last if last else float("inf")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": sum(self._calls.values()),
+                "by_method": dict(sorted(self._calls.items())),
+                "throttled": sum(self._throttled.values()),
+                "throttled_by_method": dict(sorted(self._throttled.items())),
+                "bytes_in": self._bytes_in,
+            }
+
+    # ---- ответы ----
+
+    def _message(self, params: dict, **extra) -> dict:
+        try:
+            chat_id = int(params.get("chat_id", 0))
+        except (TypeError, ValueError):
+            chat_id = 0
+        msg = {"message_id": self._next_message_id(), "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private"}}
+        if "text" in params:
+            msg["text"] = params["text"]
+        if params.get("caption"):
+            msg["caption"] = params["caption"]
+        msg.update(extra)
+        return msg
+
+    def result_for(self, method: str, params: dict):
+        if method == "sendMessage":
+            return self._message(params)
+        if method == "sendPhoto":
+            return self._message(params, photo=[{"file_id": str(params.get("photo", "")), "width": 1280, "height": 960}])
+        if method == "sendVideo":
+            return self._message(params, video={"file_id": str(params.get("video", ""))})
+        if method == "sendDocument":
+            return self._message(params, document={"file_id": str(params.get("document", ""))})
+        if method == "sendMediaGroup":
+            media = params.get("media") or []
+            if isinstance(media, str):
+                # форма: media — строка JSON; тело JSON — сразу список
+                try:
+                    media = json.loads(media)
+                except ValueError:
+                    media = []
+            return [self._message(params, media_group_id="fake") for _ in media]
+        if method == "sendChatAction":
+            return True
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            return True
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        return None
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, как у настоящего API: клиентский пул переиспользует соединения
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело одним сегментом: иначе Nagle + delayed ACK дают +40 мс на ответ
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, payload: dict, headers=None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parts = self.path.split("?", 1)[0].strip("/").split("/")
+                if len(parts) != 2 or not parts[0].startswith("bot"):
+                    self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                    return
+                method = parts[1]
+                if method not in SUPPORTED_METHODS:
+                    self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"})
+                    return
+                delay, throttle = api._decide(method, len(body))
+                if delay:
+                    time.sleep(delay)
+                if throttle:
+                    self._reply(429, {
+                        "ok": False, "error_code": 429,
+                        "description": f"Too Many Requests: retry after {api.retry_after}",
+                        "parameters": {"retry_after": api.retry_after},
+                    }, headers={"Retry-After": str(api.retry_after)})
+                    return
+                params = _parse_body(self.headers.get("Content-Type", ""), body)
+                self._reply(200, {"ok": True, "result": api.result_for(method, params)})
+
+            do_GET = do_POST
+
+        return Handler
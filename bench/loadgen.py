@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Генератор нагрузки на /webhook/<TOKEN>.
+Цель — Flask-приложение в этом же процессе (InProcessTarget, без сети
+на входе), сразу dispatch_update (DispatchTarget) или работающий бот по HTTP
+(HttpTarget). Каждая сессия плана отправляется одним потоком по порядку;
+concurrency потоков берут сессии из общей очереди. Для каждого апдейта
+замеряется время ответа webhook.
+"""
+import json
+import time
+import queue
+import threading
+
+import requests
+
+
+class InProcessTarget:
+    """POST в app.test_client() — без HTTP-сервера перед приложением"""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self._local = threading.local()
+
+    def post(self, body: bytes) -> int:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client.post(self.path, data=body, content_type="application/json").status_code
+
+
+class HttpTarget:
+    """POST по HTTP на запущенный бот (gunicorn/flask) — keep-alive сессия на поток"""
+
+    def __init__(self, url: str, timeout: float = 30):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def post(self, body: bytes) -> int:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session.post(self.url, data=body, timeout=self.timeout,
+                            headers={"Content-Type": "application/json"}).status_code
+
+
+class DispatchTarget:
+    """Мимо Flask: bot.parse_update + bot.dispatch_update — та же точка входа, что у long polling"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def post(self, body: bytes) -> int:
+        update = self.bot.parse_update(body)
+        if update is None:
+            return 400
+        return 200 if self.bot.dispatch_update(update) else 503
+
+
+def run_load(plan: list, target, concurrency: int = 4, think_ms: float = 0.0) -> dict:
+    """Прогнать план; {"latencies": [(сценарий, секунды)], "statuses": {код: n}, "errors": n, "elapsed": с}"""
+    sessions = queue.Queue()
+    for s in plan:
+        sessions.put(s)
+    # Тела готовим заранее: сериализация генератора не должна попадать в замер
+    bodies = {id(s): [json.dumps(u, ensure_ascii=False).encode("utf-8") for u in s["updates"]] for s in plan}
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    errors = [0]
+
+    def worker():
+        local_lat = []
+        local_status = {}
+        local_errors = 0
+        while True:
+            try:
+                s = sessions.get_nowait()
+            except queue.Empty:
+                break
+            for body in bodies[id(s)]:
+                started = time.perf_counter()
+                try:
+                    code = target.post(body)
+                except Exception:
+                    code = "error"
+                    local_errors += 1
+                local_lat.append((s["scenario"], time.perf_counter() - started))
+                local_status[code] = local_status.get(code, 0) + 1
+                if think_ms:
+                    time.sleep(think_ms / 1000.0)
+        with lock:
+            latencies.extend(local_lat)
+            for k, v in local_status.items():
+                statuses[k] = statuses.get(k, 0) + v
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, name=f"loadgen-{i}", daemon=True) for i in range(max(1, concurrency))]
+    started = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return {
+        "latencies": latencies,
+        "statuses": statuses,
+        "errors": errors[0],
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def wait_quiet(api, quiet: float = 0.5, timeout: float = 30.0) -> float:
+    """Дождаться, пока фоновые отправки (ack-first, очередь) перестанут ходить в API; секунд ожидания"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if api.idle_for() >= quiet:
+            break
+        time.sleep(quiet / 5)
+    return time.monotonic() - started
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Воспроизведение записанного трафика (capture.py) с исходными интервалами.
+speed=1 — как пришло, speed=N — в N раз быстрее, speed=0 — без пауз.
+Апдейты одного чата идут строго по порядку через один поток (как в
+ShardedUpdatePool), разные чаты — параллельно. Кроме времени ответа
+считается отставание от расписания: если оно растёт, бот не успевает за
+исходным темпом.
+"""
+import heapq
+import json
+import time
+import queue
+import threading
+
+from capture import read_capture
+
+
+def load_records(paths, limit: int = None) -> list:
+    """[(ts, update)] из одного или нескольких файлов (воркеры пишут свои) по времени прихода"""
+    merged = heapq.merge(*(read_capture(p) for p in paths), key=lambda r: r[0])
+    records = []
+    for rec in merged:
+        records.append(rec)
+        if limit and len(records) >= limit:
+            break
+    return records
+
+
+def chat_key(update: dict) -> int:
+    """Чат апдейта — ключ шарда; апдейты без чата — в шард 0"""
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if kind in update:
+            return (update[kind].get("chat") or {}).get("id", 0)
+    if "callback_query" in update:
+        return (update["callback_query"].get("from") or {}).get("id", 0)
+    return 0
+
+
+def _default_label(update: dict) -> str:
+    for kind in ("callback_query", "message", "edited_message", "channel_post", "edited_channel_post"):
+        if kind in update:
+            return kind
+    return "other"
+
+
+def replay(records: list, target, speed: float = 1.0, concurrency: int = 8, label_fn=None) -> dict:
+    """Как loadgen.run_load, плюс "lag": [секунды опоздания отправки относительно расписания]"""
+    label_fn = label_fn or _default_label
+    workers = max(1, concurrency)
+    shards = [queue.Queue() for _ in range(workers)]
+    lock = threading.Lock()
+    latencies, lags, statuses, errors = [], [], {}, [0]
+
+    def worker(q):
+        local_lat, local_lag, local_status, local_errors = [], [], {}, 0
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            due, label, body = item
+            sent = time.perf_counter()
+            local_lag.append(max(0.0, sent - due))
+            try:
+                code = target.post(body)
+            except Exception:
+                code = "error"
+                local_errors += 1
+            local_lat.append((label, time.perf_counter() - sent))
+            local_status[code] = local_status.get(code, 0) + 1
+        with lock:
+            latencies.extend(local_lat)
+            lags.extend(local_lag)
+            for k, v in local_status.items():
+                statuses[k] = statuses.get(k, 0) + v
+            errors[0] += local_errors
+
+    # Сериализация и разбор — до старта, чтобы не искажать расписание
+    prepared = [(ts, label_fn(u), chat_key(u) % workers,
+                 json.dumps(u, ensure_ascii=False).encode("utf-8")) for ts, u in records]
+    threads = [threading.Thread(target=worker, args=(q,), name=f"replay-{i}", daemon=True)
+               for i, q in enumerate(shards)]
+    for th in threads:
+        th.start()
+    started = time.perf_counter()
+    t0 = prepared[0][0] if prepared else 0.0
+    for ts, label, shard, body in prepared:
+        due = started + ((ts - t0) / speed if speed else 0.0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        shards[shard].put((due, label, body))
+    for q in shards:
+        q.put(None)
+    for th in threads:
+        th.join()
+    return {
+        "latencies": latencies,
+        "lag": lags,
+        "statuses": statuses,
+        "errors": errors[0],
+        "elapsed": time.perf_counter() - started,
+        "recorded_span": (prepared[-1][0] - t0) if prepared else 0.0,
+    }
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Отчёт нагрузочного прогона: updates/s, p50/p95/p99 времени ответа webhook
+(всего и по сценариям), исходящие вызовы Bot API на апдейт. Отчёт — JSON
+с метаданными (коммит, параметры, ключевые переменные окружения), чтобы
+compare_reports() сравнивал прогоны разных коммитов на одних условиях.
+"""
+import os
+import sys
+import math
+import time
+import platform
+import subprocess
+
+# Переменные окружения, которые меняют путь апдейта и должны попасть в отчёт
+RELEVANT_ENV = (
+    "WEBHOOK_ACK_FIRST", "SEND_QUEUE", "EVENT_WRITE_BEHIND", "STATE_BACKEND",
+    "STATS_CACHE_TTL", "TRACE_ENABLED", "LOG_LEVEL", "DB_POOL_SIZE", "TG_POOL_SIZE",
+)
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank перцентиль по отсортированному списку"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def _latency_block(values: list) -> dict:
+    values = sorted(values)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "count": len(values),
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+    }
+
+
+def git_revision(path: str = None) -> dict:
+    path = path or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=path, capture_output=True,
+                             text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path,
+                               capture_output=True, text=True, timeout=30).stdout.strip() != ""
+        return {"commit": rev or None, "dirty": dirty}
+    except Exception:
+        return {"commit": None, "dirty": None}
+
+
+def summarize(result: dict, api_stats: dict, params: dict, drain_seconds: float = 0.0) -> dict:
+    """Сводка прогона: result — из loadgen.run_load, api_stats — FakeBotApi.stats() (или None)"""
+    total = len(result["latencies"])
+    by_scenario = {}
+    for name, seconds in result["latencies"]:
+        by_scenario.setdefault(name, []).append(seconds)
+    elapsed = result["elapsed"]
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "argv": sys.argv[1:],
+        },
+        "params": params,
+        "env": {k: os.environ[k] for k in RELEVANT_ENV if k in os.environ},
+        "updates": total,
+        "elapsed_s": round(elapsed, 3),
+        "drain_s": round(drain_seconds, 3),
+        "updates_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "statuses": {str(k): v for k, v in sorted(result["statuses"].items(), key=lambda kv: str(kv[0]))},
+        "errors": result["errors"],
+        "latency": _latency_block([s for _, s in result["latencies"]]),
+        "latency_by_scenario": {name: _latency_block(v) for name, v in sorted(by_scenario.items())},
+    }
+    if "lag" in result:
+        # Воспроизведение: опоздание относительно записанного расписания
+        report["recorded_span_s"] = round(result.get("recorded_span", 0.0), 3)
+        report["schedule_lag"] = _latency_block(result["lag"])
+    if api_stats is not None:
+        report["outbound"] = {
+            "calls": api_stats["calls"],
+            "per_update": round(api_stats["calls"] / total, 3) if total else 0.0,
+            "throttled": api_stats["throttled"],
+            "by_method": api_stats["by_method"],
+            "per_update_by_method": {m: round(n / total, 3) for m, n in api_stats["by_method"].items()} if total else {},
+        }
+    return report
+
+
+def format_report(report: dict) -> str:
+    meta = report["meta"]
+    lat = report["latency"]
+    lines = [
+        f"commit {meta.get('commit') or '?'}{' (dirty)' if meta.get('dirty') else ''}  "
+        f"python {meta['python']}  params {report['params']}",
+        f"updates: {report['updates']} in {report['elapsed_s']} s  ->  {report['updates_per_s']} updates/s"
+        f"  (drain {report['drain_s']} s)",
+        f"latency ms: p50 {lat['p50_ms']}  p95 {lat['p95_ms']}  p99 {lat['p99_ms']}  max {lat['max_ms']}",
+        f"statuses: {report['statuses']}  errors: {report['errors']}",
+    ]
+    lag = report.get("schedule_lag")
+    if lag:
+        lines.append(f"schedule lag ms: p50 {lag['p50_ms']}  p99 {lag['p99_ms']}  max {lag['max_ms']}"
+                     f"  (recorded span {report['recorded_span_s']} s)")
+    for name, block in report["latency_by_scenario"].items():
+        lines.append(f"  {name:<24} n={block['count']:<6} p50 {block['p50_ms']:>8}  p95 {block['p95_ms']:>8}  p99 {block['p99_ms']:>8}")
+    out = report.get("outbound")
+    if out:
+        lines.append(f"outbound: {out['calls']} calls, {out['per_update']} per update, 429: {out['throttled']}")
+        for method, n in out["per_update_by_method"].items():
+            lines.append(f"  {method:<16} {n}")
+    return "\n".join(lines)
+
+
+# (путь в отчёте, подпись, больше — лучше)
+_COMPARE_FIELDS = (
+    (("updates_per_s",), "updates/s", True),
+    (("latency", "p50_ms"), "p50 ms", False),
+    (("latency", "p95_ms"), "p95 ms", False),
+    (("latency", "p99_ms"), "p99 ms", False),
+    (("schedule_lag", "p99_ms"), "lag p99 ms", False),
+    (("outbound", "per_update"), "calls/update", False),
+    (("errors",), "errors", False),
+)
+
+
+def _get(report: dict, path: tuple):
+    value = report
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_reports(base: dict, new: dict) -> str:
+    """Таблица «было / стало / изменение» и предупреждение, если условия прогонов различаются"""
+    lines = [f"{'':<14}{(base['meta'].get('commit') or 'base'):>14}{(new['meta'].get('commit') or 'new'):>14}{'change':>10}"]
+    for path, label, higher_is_better in _COMPARE_FIELDS:
+        a, b = _get(base, path), _get(new, path)
+        if a is None or b is None:
+            continue
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+        better = (b > a) == higher_is_better if a != b else None
+        mark = "" if better is None else (" +" if better else " -")
+        lines.append(f"{label:<14}{a:>14}{b:>14}{change:>10}{mark}")
+    if base.get("params") != new.get("params") or base.get("env") != new.get("env"):
+        lines.append("WARNING: runs used different parameters or environment:")
+        lines.append(f"  base: {base.get('params')} {base.get('env')}")
+        lines.append(f"  new:  {new.get('params')} {new.get('env')}")
+    return "\n".join(lines)
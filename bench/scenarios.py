@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Синтетические апдейты Telegram для нагрузочного прогона.
+План — список сессий; сессия — апдейты одного пользователя (или админа),
+которые отправляются строго по порядку, как их прислал бы Telegram.
+Разные сессии идут параллельно. Один и тот же seed даёт один и тот же план,
+поэтому прогоны на разных коммитах сравнимы.
+
+Тексты кнопок берутся из переводов бота: build_plan(..., t=bot.t).
+"""
+import random
+
+# Доли сценариев по умолчанию (сумма не обязана быть 1)
+DEFAULT_MIX = {
+    "stats_spam": 0.35,
+    "menu": 0.20,
+    "media_burst": 0.20,
+    "addstat": 0.15,
+    "admin_reply": 0.10,
+}
+CATEGORY_KEYS = ("cat_technogenic", "cat_natural", "cat_social", "cat_military", "cat_search", "cat_other")
+FIRST_USER_ID = 10_000_000
+BASE_DATE = 1_700_000_000
+
+
+class _Builder:
+    """Нумерация update_id / message_id и общие формы апдейтов"""
+
+    def __init__(self, rng: random.Random, t, admin_id: int, language: str):
+        self.rng = rng
+        self.t = lambda key: t(key, language)
+        self.admin_id = admin_id
+        self.language = language
+        self.update_id = 0
+        self.message_id = 0
+        self.callback_id = 0
+
+    def user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id % 10000}",
+                "username": f"user{user_id}", "language_code": self.language}
+
+    def _next_update(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def message(self, user_id: int, **content) -> dict:
+        self.message_id += 1
+        msg = {
+            "message_id": self.message_id,
+            "from": self.user(user_id),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id % 10000}"},
+            "date": BASE_DATE + self.message_id,
+        }
+        msg.update(content)
+        return {"update_id": self._next_update(), "message": msg}
+
+    def text(self, user_id: int, text: str) -> dict:
+        return self.message(user_id, text=text)
+
+    def callback(self, user_id: int, data: str) -> dict:
+        self.callback_id += 1
+        return {
+            "update_id": self._next_update(),
+            "callback_query": {
+                "id": str(self.callback_id),
+                "from": self.user(user_id),
+                "message": {"message_id": self.message_id, "chat": {"id": user_id, "type": "private"},
+                            "date": BASE_DATE + self.message_id, "text": "…"},
+                "chat_instance": str(user_id),
+                "data": data,
+            },
+        }
+
+    def file_id(self, kind: str) -> str:
+        return f"bench-{kind}-{self.rng.getrandbits(48):012x}"
+
+    def photo(self, user_id: int, group: str = None, caption: str = None) -> dict:
+        fid = self.file_id("photo")
+        content = {"photo": [
+            {"file_id": fid + "-s", "file_unique_id": fid[-12:] + "s", "width": 90, "height": 68, "file_size": 1500},
+            {"file_id": fid, "file_unique_id": fid[-12:], "width": 1280, "height": 960, "file_size": 180_000},
+        ]}
+        if group:
+            content["media_group_id"] = group
+        if caption:
+            content["caption"] = caption
+        return self.message(user_id, **content)
+
+    def video(self, user_id: int, group: str = None) -> dict:
+        content = {"video": {"file_id": self.file_id("video"), "duration": 12, "width": 720, "height": 1280,
+                             "mime_type": "video/mp4", "file_size": 2_400_000}}
+        if group:
+            content["media_group_id"] = group
+        return self.message(user_id, **content)
+
+    def document(self, user_id: int) -> dict:
+        return self.message(user_id, document={"file_id": self.file_id("doc"), "file_name": "report.pdf",
+                                               "mime_type": "application/pdf", "file_size": 350_000})
+
+
+# ---- сценарии: (builder, user_id) -> [апдейты] ----
+
+def scenario_menu(b: _Builder, user_id: int) -> list:
+    """Новый пользователь: /start и несколько пунктов меню"""
+    return [
+        b.text(user_id, "/start"),
+        b.text(user_id, b.t("main_menu_about")),
+        b.text(user_id, b.t("main_menu_schedule")),
+        b.text(user_id, b.t("main_menu_main")),
+    ]
+
+
+def scenario_stats_spam(b: _Builder, user_id: int) -> list:
+    """Многократное нажатие «Статистика» подряд"""
+    return [b.text(user_id, b.t("main_menu_stats")) for _ in range(b.rng.randint(3, 8))]
+
+
+def scenario_media_burst(b: _Builder, user_id: int) -> list:
+    """Сообщение о событии: категория, альбом фото/видео, документ, «Надіслати»"""
+    updates = [
+        b.text(user_id, b.t("main_menu_event")),
+        b.text(user_id, b.t(b.rng.choice(CATEGORY_KEYS))),
+    ]
+    group = f"bench{b.rng.getrandbits(40):x}"
+    for i in range(b.rng.randint(2, 12)):
+        if b.rng.random() < 0.2:
+            updates.append(b.video(user_id, group))
+        else:
+            updates.append(b.photo(user_id, group, caption="Опис події" if i == 0 else None))
+    if b.rng.random() < 0.3:
+        updates.append(b.document(user_id))
+    if b.rng.random() < 0.5:
+        updates.append(b.text(user_id, "Додатковий опис: вулиця, час, кількість людей"))
+    updates.append(b.text(user_id, b.t("btn_send")))
+    return updates
+
+
+def scenario_addstat(b: _Builder, user_id: int) -> list:
+    """Админ добавляет сообщение пользователя в статистику"""
+    orig_msg = b.message_id + 1
+    updates = [b.text(user_id, "Повідомлення для адміністратора")]
+    updates.append(b.callback(b.admin_id, f"addstat_{user_id}_{orig_msg}"))
+    idx = b.rng.randrange(len(CATEGORY_KEYS))
+    updates.append(b.callback(b.admin_id, f"confirm_addstat|{user_id}|{orig_msg}|{idx}"))
+    return updates
+
+
+def scenario_admin_reply(b: _Builder, user_id: int) -> list:
+    """Админ отвечает пользователю через кнопку «Відповісти»"""
+    return [
+        b.callback(b.admin_id, f"reply_{user_id}"),
+        b.text(b.admin_id, f"Дякуємо, інформацію отримано ({user_id})"),
+    ]
+
+
+SCENARIOS = {
+    "menu": scenario_menu,
+    "stats_spam": scenario_stats_spam,
+    "media_burst": scenario_media_burst,
+    "addstat": scenario_addstat,
+    "admin_reply": scenario_admin_reply,
+}
+
+
+def _default_t(key, language=None):
+    return f"[{key}]"
+
+
+def build_plan(sessions: int, seed: int = 1, mix: dict = None, admin_id: int = 1000,
+               t=None, language: str = "uk") -> list:
+    """[{"scenario": имя, "user_id": id, "updates": [...]}, ...] — детерминированно по seed"""
+    mix = {k: v for k, v in (mix or DEFAULT_MIX).items() if v > 0}
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    rng = random.Random(seed)
+    b = _Builder(rng, t or _default_t, admin_id, language)
+    names = sorted(mix)
+    weights = [mix[n] for n in names]
+    plan = []
+    for i in range(sessions):
+        name = rng.choices(names, weights)[0]
+        user_id = FIRST_USER_ID + i
+        plan.append({"scenario": name, "user_id": user_id, "updates": SCENARIOS[name](b, user_id)})
+    return plan
+
+
+def parse_mix(spec: str) -> dict:
+    """'stats_spam=2,media_burst=1' -> {'stats_spam': 2.0, 'media_burst': 1.0}"""
+    mix = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight) if weight else 1.0
+    return mix
@@ -5,8 +5,7 @@ Telegram Bot с поддержкой мультиязычности (UK, RU, EN)
 """
 import os
 import time
-import json
-import requests
+import re
 import threading
 import traceback
 import datetime
@@ -15,10 +14,32 @@ from pathlib import Path
 from flask import Flask, request
 
 # Библиотека для работы с разными БД (Postgres/SQLite)
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, inspect, event
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import ArgumentError
 
+from tg_api import get_client
+from send_queue import get_send_queue
+from update_workers import ShardedUpdatePool
+from state_store import create_state_store, schema_ddl, StateMap, StateSet
+from media_buffer import PendingMediaBuffer
+from locks import StripedLock, TimedLock, lock_stats
+from cache import TTLCache
+from migrations import Migration, MigrationRunner
+from event_writer import BufferedEventWriter
+from retention import RetentionEngine, RETENTION_DAYS
+from db_pool import pool_kwargs, instrument, timed, db_stats
+from structured_log import get_logger
+from alerts import AlertAggregator
+from metrics import REGISTRY
+from tracing import trace, span, traced, set_slow_handler, current_trace_id
+from profiler import SamplingProfiler, clamp_seconds
+from capture import CAPTURE_UPDATES, Anonymizer, UpdateRecorder
+from i18n import compile_translations
+from keyboards import KeyboardRegistry, slot
+from codec import decode_update, LazyUpdate
+from albums import plan_albums, chunk_call, get_album_sender, album_stats
+
 # ===================================
 # ====== СИСТЕМА ЛОКАЛИЗАЦИИ ========
 # ===================================
@@ -285,7 +306,9 @@ TRANSLATIONS = {
 }
 
 DEFAULT_LANGUAGE = 'uk'
-user_languages = {}
+# Таблицы переводов собираются один раз при импорте (см. i18n.py); проблемы пишутся в лог ниже
+I18N = compile_translations(TRANSLATIONS, DEFAULT_LANGUAGE)
+# user_languages — см. раздел «Состояния» (общее хранилище состояния)
 
 def get_user_language(user_id:  int) -> str:
     return user_languages.get(user_id, DEFAULT_LANGUAGE)
@@ -295,30 +318,28 @@ def set_user_language(user_id: int, language: str):
         user_languages[user_id] = language
 
 def t(key: str, language: str = None, **kwargs) -> str:
-    """Получить перевод с поддержкой параметров"""
-    if language is None:
-        language = DEFAULT_LANGUAGE
-    if language not in TRANSLATIONS:
-        language = DEFAULT_LANGUAGE
-    translation = TRANSLATIONS. get(language, {}).get(key, f"[{key}]")
-    try:
-        if kwargs:
-            return translation.format(**kwargs)
-        return translation
-    except KeyError as e:
-        return f"[Missing key: {e}]"
+    """Получить перевод с поддержкой параметров; format() — только для шаблонов с полями"""
+    if kwargs:
+        return I18N.format(key, language, kwargs)
+    return I18N.text(key, language)
 
 # ====== ОСНОВНАЯ ЛОГИКА БОТА ======
 
 NOTIFY_USER_ON_ADD_STAT = True
 
 def MainProtokol(s, ts='Запис'):
-    dt = time.strftime('%d.%m.%Y %H:%M: ') + '00'
-    try:
-        with open('log.txt', 'a', encoding='utf-8') as f:
-            f.write(f"{dt};{ts};{s}\n")
-    except Exception as e:
-        print("Ошибка записи в лог:", e)
+    # Только постановка в очередь; JSON lines пишет фоновый поток (см. structured_log.py)
+    trace_id = current_trace_id()
+    if trace_id:
+        get_logger().log(s, tag=ts, trace_id=trace_id)
+    else:
+        get_logger().log(s, tag=ts)
+
+for _problem in I18N.problems:
+    MainProtokol(_problem, ts='WARN')
+
+# Трассы дольше SLOW_UPDATE_MS — целиком (все фазы) в slow_updates.log
+set_slow_handler(lambda record: get_logger().emit({"level": "warning", **record}, sink="slow"))
 
 def cool_error_handler(exc, context="", send_to_telegram=False):
     exc_type = type(exc).__name__
@@ -333,64 +354,101 @@ def cool_error_handler(exc, context="", send_to_telegram=False):
         f"{tb_str}"
         + "=" * 40 + "\n"
     )
-    try:
-        with open('critical_errors.log', 'a', encoding='utf-8') as f:
-            f.write(readable_msg)
-    except Exception as write_err:
-        print("Не удалось записать в 'critical_errors.log':", write_err)
+    get_logger().emit({"level": "critical", "type": exc_type, "context": context, "msg": str(exc), "traceback": tb_str}, sink="errors")
     try:
         MainProtokol(f"{exc_type}: {str(exc)}", ts='ERROR')
     except Exception as log_err:
         print("MainProtokol вернул ошибку:", log_err)
     print(readable_msg)
     if send_to_telegram:
+        # Только регистрация: отправка, склейка повторов и бюджет — в фоновом потоке
         try:
-            admin_id = int(os.getenv("ADMIN_ID", "0"))
-            token = os.getenv("API_TOKEN")
-            if admin_id and token:
-                try:
-                    r = requests.post(
-                        f"https://api.telegram.org/bot{token}/sendMessage",
-                        data={
-                            "chat_id": admin_id,
-                            "text": f"⚠️ Критична помилка!\nТип:  {exc_type}\nКонтекст: {context}\n\n{str(exc)}",
-                            "disable_web_page_preview": True
-                        },
-                        timeout=5
-                    )
-                    if not r.ok:
-                        MainProtokol(f"Telegram notify failed: {r.status_code} {r.text}", ts='WARN')
-                except Exception as telegram_err:
-                    print("Не удалось отправить уведомление в Telegram:", telegram_err)
-        except Exception as env_err:
-            print("Ошибка при подготовке уведомления в Telegram:", env_err)
+            get_alerts().report(
+                (exc_type, context),
+                f"⚠️ Критична помилка!\nТип:  {exc_type}\nКонтекст: {context}\n\n{str(exc)}",
+            )
+        except Exception as alert_err:
+            print("Ошибка при подготовке уведомления в Telegram:", alert_err)
+
+def _send_admin_alert(text: str):
+    admin_id = int(os.getenv("ADMIN_ID", "0"))
+    token = os.getenv("API_TOKEN")
+    if not (admin_id and token):
+        return
+    r = get_client(token).send_message(admin_id, text, disable_web_page_preview=True, timeout=5)
+    if not r.ok:
+        MainProtokol(f"Telegram notify failed: {r.status_code} {r.text}", ts='WARN')
+
+_alerts = {}
+_alerts_lock = threading.Lock()
+
+def get_alerts() -> AlertAggregator:
+    """Агрегатор уведомлений процесса (свой поток на каждый pid)"""
+    pid = os.getpid()
+    with _alerts_lock:
+        agg = _alerts.get(pid)
+        if agg is None:
+            agg = _alerts[pid] = AlertAggregator(_send_admin_alert, log=MainProtokol).start()
+        return agg
 
 def time_debugger():
     while True:
         print("[DEBUG]", time.strftime('%Y-%m-%d %H:%M:%S'))
         time.sleep(300)
 
+MAIN_MENU_KEYS = (
+    'main_menu_main',
+    'main_menu_about',
+    'main_menu_schedule',
+    'main_menu_event',
+    'main_menu_stats',
+    'main_menu_ads',
+)
+
 def get_main_menu(language:  str = 'uk'):
-    return [
-        t('main_menu_main', language),
-        t('main_menu_about', language),
-        t('main_menu_schedule', language),
-        t('main_menu_event', language),
-        t('main_menu_stats', language),
-        t('main_menu_ads', language),
-    ]
+    """Пункты меню (кортеж, один на язык)"""
+    return I18N.rendered("main_menu", language, lambda lang: tuple(t(key, lang) for key in MAIN_MENU_KEYS))
+
+# Канонические коды категорий: в БД хранится индекс в этом кортеже, подпись на языке — только при выводе
+CATEGORY_KEYS = (
+    'cat_technogenic',
+    'cat_natural',
+    'cat_social',
+    'cat_military',
+    'cat_search',
+    'cat_other',
+)
+CATEGORY_OTHER = CATEGORY_KEYS.index('cat_other')
+# Подпись на любом языке -> код
+_CATEGORY_CODES = {
+    TRANSLATIONS[lang][key]: code
+    for lang in TRANSLATIONS
+    for code, key in enumerate(CATEGORY_KEYS)
+    if key in TRANSLATIONS[lang]
+}
+
+def category_code(category):
+    """Код категории по подписи (на любом языке), ключу перевода или коду; None — неизвестная"""
+    if isinstance(category, int):
+        return category if 0 <= category < len(CATEGORY_KEYS) else None
+    if category in _CATEGORY_CODES:
+        return _CATEGORY_CODES[category]
+    if category in CATEGORY_KEYS:
+        return CATEGORY_KEYS.index(category)
+    return None
+
+def category_label(code: int, language: str = 'uk') -> str:
+    return t(CATEGORY_KEYS[code], language)
 
 def get_admin_subcategories(language: str = 'uk'):
-    return [
-        t('cat_technogenic', language),
-        t('cat_natural', language),
-        t('cat_social', language),
-        t('cat_military', language),
-        t('cat_search', language),
-        t('cat_other', language),
-    ]
+    """Подписи категорий в порядке кодов (кортеж, один на язык)"""
+    return I18N.rendered("categories", language, lambda lang: tuple(t(key, lang) for key in CATEGORY_KEYS))
 
-def get_reply_buttons(language: str = 'uk'):
+# Клавиатуры кодируются в JSON один раз на язык (см. keyboards.py)
+KEYBOARDS = KeyboardRegistry(normalize_language=I18N.language)
+
+@KEYBOARDS.static("reply_buttons")
+def _kb_reply_buttons(language: str) -> dict:
     menu = get_main_menu(language)
     return {
         "keyboard": [
@@ -402,7 +460,49 @@ def get_reply_buttons(language: str = 'uk'):
         "one_time_keyboard": False
     }
 
+@KEYBOARDS.static("media_collection")
+def _kb_media_collection(language: str) -> dict:
+    return {
+        "keyboard": [
+            [{"text": t('btn_send', language)}],
+            [{"text": t('btn_cancel', language)}]
+        ],
+        "resize_keyboard": True,
+        "one_time_keyboard": False
+    }
+
+@KEYBOARDS.template("admin_reply")
+def _kb_admin_reply(language: str) -> dict:
+    return {"inline_keyboard": [[{"text": t('btn_reply', language), "callback_data": f"reply_{slot('user')}"}]]}
+
+@KEYBOARDS.template("admin_reply_addstat")
+def _kb_admin_reply_addstat(language: str) -> dict:
+    return {"inline_keyboard": [[
+        {"text": t('btn_reply', language), "callback_data": f"reply_{slot('user')}"},
+        {"text": t('btn_add_stat', language), "callback_data": f"addstat_{slot('chat')}_{slot('msg')}"},
+    ]]}
+
+@KEYBOARDS.template("addstat_categories")
+def _kb_addstat_categories(language: str) -> dict:
+    kb = {"inline_keyboard": []}
+    row = []
+    for idx, cat in enumerate(get_admin_subcategories(language)):
+        row.append({"text": cat, "callback_data": f"confirm_addstat|{slot('chat')}|{slot('msg')}|{idx}"})
+        if len(row) == 2:
+            kb["inline_keyboard"].append(row)
+            row = []
+    if row:
+        kb["inline_keyboard"].append(row)
+    return kb
+
+def get_reply_buttons(language: str = 'uk'):
+    """Главное меню — готовый JSON (EncodedMarkup)"""
+    return KEYBOARDS.get("reply_buttons", language)
+
 def build_about_company_detailed(language: str = 'uk') -> str:
+    return I18N.rendered("about", language, _render_about_company)
+
+def _render_about_company(language: str) -> str:
     sep = t('separator', language)
     parts = [
         f"<pre>{sep}</pre>",
@@ -426,14 +526,35 @@ def build_about_company_detailed(language: str = 'uk') -> str:
     return "\n".join(parts)
 
 # Состояния
-waiting_for_admin_message = set()
-user_admin_category = {}
-waiting_for_ad_message = set()
-pending_mode = {}
-pending_media = {}
-waiting_for_admin = {}
-admin_adding_event = {}
-GLOBAL_LOCK = threading.Lock()
+# STATE_BACKEND=memory — в памяти процесса (один воркер); sql — общая БД для N воркеров gunicorn
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").strip().lower()
+try:
+    STATE_TTL = int(os.getenv("STATE_TTL", str(24 * 3600)))
+except ValueError:
+    STATE_TTL = 24 * 3600
+# Таблицы SQL-бэкенда создаёт миграция 0006 (см. init_db)
+STATE_STORE = create_state_store(STATE_BACKEND, lambda: get_engine(), manage_schema=False)
+
+user_languages = StateMap(STATE_STORE, "user_languages")
+waiting_for_admin_message = StateSet(STATE_STORE, "waiting_for_admin_message", ttl=STATE_TTL)
+user_admin_category = StateMap(STATE_STORE, "user_admin_category", ttl=STATE_TTL)
+waiting_for_ad_message = StateSet(STATE_STORE, "waiting_for_ad_message", ttl=STATE_TTL)
+pending_mode = StateMap(STATE_STORE, "pending_mode", ttl=STATE_TTL)
+waiting_for_admin = StateMap(STATE_STORE, "waiting_for_admin", ttl=STATE_TTL)
+admin_adding_event = StateMap(STATE_STORE, "admin_adding_event", ttl=STATE_TTL)
+# Состояние чата — под блокировкой своей полосы (разные чаты не ждут друг друга),
+# состояние администратора — под отдельной блокировкой; ожидание пишется в гистограммы locks.lock_stats()
+CHAT_LOCKS = StripedLock(name="chat")
+ADMIN_LOCK = TimedLock(name="admin")
+
+def _on_pending_media_evicted(chat_id, reason):
+    # Брошенная пачка вытеснена — сбрасываем и режим, чтобы следующее медиа не попало «в никуда»
+    pending_mode.pop(chat_id, None)
+    user_admin_category.pop(chat_id, None)
+
+# Лимиты на чат (элементы/байты), вытеснение по простою и глобальный LRU — см. media_buffer.py
+pending_media = PendingMediaBuffer(STATE_STORE, "pending_media", locks=CHAT_LOCKS, on_evict=_on_pending_media_evicted, log=MainProtokol)
+pending_media.start_sweeper()
 
 # БД
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
@@ -445,6 +566,32 @@ else:
 
 _engine:  Engine = None
 
+# SQLite: WAL — читатели не блокируют писателя; synchronous=NORMAL — fsync только
+# на контрольных точках WAL; busy_timeout — ждать блокировку вместо "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").strip()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").strip()
+try:
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+except ValueError:
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+
+def _create_sqlite_engine(url: str) -> Engine:
+    engine = create_engine(url, connect_args={"check_same_thread": False}, future=True, **pool_kwargs(url))
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, conn_record):
+        cur = dbapi_conn.cursor()
+        try:
+            if SQLITE_JOURNAL_MODE:
+                cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            if SQLITE_SYNCHRONOUS:
+                cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        finally:
+            cur.close()
+
+    return instrument(engine, log=MainProtokol)
+
 def get_engine():
     global _engine
     if _engine is None:
@@ -452,12 +599,13 @@ def get_engine():
             if not db_url: 
                 raise ValueError("DATABASE_URL is empty")
             if db_url.startswith("sqlite:///"):
-                _engine = create_engine(db_url, connect_args={"check_same_thread": False}, future=True)
+                _engine = _create_sqlite_engine(db_url)
                 print(f"[DEBUG] Using SQLite DB URL: {db_url}")
             else:
                 if '://' not in db_url:
                     raise ArgumentError(f"Invalid DB URL (missing scheme): {db_url}")
-                _engine = create_engine(db_url, future=True)
+                # Размер пула, overflow, recycle и pre-ping — DB_POOL_* (см. db_pool.py)
+                _engine = instrument(create_engine(db_url, future=True, **pool_kwargs(db_url)), log=MainProtokol)
                 print(f"[DEBUG] Using DB URL: {db_url}")
         except ArgumentError as e: 
             cool_error_handler(e, "get_engine (ArgumentError)")
@@ -465,7 +613,7 @@ def get_engine():
             try:
                 fallback_sqlite = os.path.join(os.path.dirname(os.path.abspath(__file__)), "events.db")
                 fallback_url = f"sqlite:///{fallback_sqlite}"
-                _engine = create_engine(fallback_url, connect_args={"check_same_thread": False}, future=True)
+                _engine = _create_sqlite_engine(fallback_url)
                 print(f"[WARN] Fallback to SQLite at {fallback_sqlite} due to invalid DATABASE_URL.")
                 MainProtokol("Fallback to SQLite due to invalid DATABASE_URL", ts='WARN')
             except Exception as e2:
@@ -477,7 +625,7 @@ def get_engine():
             try:
                 fallback_sqlite = os.path.join(os. path.dirname(os.path. abspath(__file__)), "events.db")
                 fallback_url = f"sqlite:///{fallback_sqlite}"
-                _engine = create_engine(fallback_url, connect_args={"check_same_thread": False}, future=True)
+                _engine = _create_sqlite_engine(fallback_url)
                 print(f"[WARN] Fallback to SQLite at {fallback_sqlite} due to engine creation error.")
                 MainProtokol("Fallback to SQLite due to engine creation error", ts='WARN')
             except Exception as e2:
@@ -485,96 +633,268 @@ def get_engine():
                 raise
     return _engine
 
-def init_db():
+# ---- миграции схемы (версии в schema_version, см. migrations.py) ----
+# Базы, созданные до появления миграций, проходят все шаги: каждый шаг
+# проверяет фактическую схему и пропускает то, что уже сделано.
+
+def _columns(conn, table: str) -> dict:
+    insp = inspect(conn)
+    if not insp.has_table(table):
+        return {}
+    return {c['name']: c['type'] for c in insp.get_columns(table)}
+
+def _m0001_baseline(conn, dialect):
+    """Исходная схема бота (как её создавал init_db)"""
+    if dialect == "sqlite":
+        conn.execute(text("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT NOT NULL, dt TEXT NOT NULL)"))
+    else:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS events (id SERIAL PRIMARY KEY, category TEXT NOT NULL, dt TIMESTAMP NOT NULL)"))
+
+def _category_case_sql(labels):
+    """CASE category WHEN <подпись> THEN <код> ... для переноса старых строк"""
+    params = {"other": CATEGORY_OTHER}
+    whens = []
+    for i, label in enumerate(labels):
+        code = category_code(label)
+        if code is None:
+            MainProtokol(f"Unknown legacy category '{label}' -> other", ts='WARN')
+            continue
+        params[f"l{i}"] = label
+        params[f"c{i}"] = code
+        whens.append(f"WHEN :l{i} THEN :c{i}")
+    if not whens:
+        # Пустая таблица: CASE без WHEN — синтаксическая ошибка
+        return ":other", params
+    return f"CASE category {' '.join(whens)} ELSE :other END", params
+
+def _m0002_category_codes(conn, dialect):
+    """events.category (подпись на языке) -> events.category_id"""
+    if 'category' not in _columns(conn, 'events'):
+        return
+    labels = [r[0] for r in conn.execute(text("SELECT DISTINCT category FROM events")).all()]
+    case_sql, params = _category_case_sql(labels)
+    if dialect == "sqlite":
+        # SQLite не меняет колонки на месте — пересоздаём таблицу
+        conn.execute(text("CREATE TABLE events_new (id INTEGER PRIMARY KEY AUTOINCREMENT, category_id INTEGER NOT NULL, dt TEXT NOT NULL)"))
+        conn.execute(text(f"INSERT INTO events_new (id, category_id, dt) SELECT id, {case_sql}, dt FROM events"), params)
+        conn.execute(text("DROP TABLE events"))
+        conn.execute(text("ALTER TABLE events_new RENAME TO events"))
+    else:
+        conn.execute(text("ALTER TABLE events ADD COLUMN IF NOT EXISTS category_id SMALLINT"))
+        conn.execute(text(f"UPDATE events SET category_id = {case_sql}"), params)
+        conn.execute(text("ALTER TABLE events ALTER COLUMN category_id SET NOT NULL"))
+        conn.execute(text("ALTER TABLE events DROP COLUMN category"))
+
+def _m0003_dt_type(conn, dialect):
+    """SQLite: dt TEXT -> INTEGER (unix epoch, UTC); Postgres: TIMESTAMP -> TIMESTAMPTZ"""
+    dt_type = _columns(conn, 'events').get('dt')
+    if dialect == "sqlite":
+        if dt_type is None or 'INT' in str(dt_type).upper():
+            return
+        # Сравнение чисел дешевле сравнения ISO-строк и не зависит от формата записи
+        conn.execute(text("CREATE TABLE events_new (id INTEGER PRIMARY KEY AUTOINCREMENT, category_id INTEGER NOT NULL, dt INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO events_new (id, category_id, dt) SELECT id, category_id, CAST(strftime('%s', dt) AS INTEGER) FROM events"))
+        conn.execute(text("DROP TABLE events"))
+        conn.execute(text("ALTER TABLE events_new RENAME TO events"))
+    elif not getattr(dt_type, 'timezone', False):
+        # Старые значения записаны через utcnow()
+        conn.execute(text("ALTER TABLE events ALTER COLUMN dt TYPE TIMESTAMPTZ USING dt AT TIME ZONE 'UTC'"))
+
+def _m0004_event_daily(conn, dialect):
+    """Суточные счётчики по коду категории; пересобираются из events"""
+    if 'category' in _columns(conn, 'event_daily'):
+        conn.execute(text("DROP TABLE event_daily"))
+    day_type = "TEXT" if dialect == "sqlite" else "DATE"
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS event_daily (category_id SMALLINT NOT NULL, day {day_type} NOT NULL, "
+        f"cnt INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (category_id, day))"
+    ))
+    _rebuild_rollup(conn, dialect)
+
+def _m0005_events_dt_index(conn, dialect):
+    # Покрывающий индекс для выборок/очистки по дате
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_events_dt_category ON events (dt, category_id)"))
+
+def _m0006_session_tables(conn, dialect):
+    for stmt in schema_ddl(dialect):
+        conn.execute(text(stmt))
+
+MIGRATIONS = MigrationRunner([
+    Migration(1, "baseline", _m0001_baseline),
+    Migration(2, "events_category_codes", _m0002_category_codes),
+    Migration(3, "events_dt_type", _m0003_dt_type),
+    Migration(4, "event_daily_rollup", _m0004_event_daily),
+    Migration(5, "ix_events_dt_category", _m0005_events_dt_index),
+    Migration(6, "session_tables", _m0006_session_tables),
+], log=MainProtokol)
+
+# AUTO_MIGRATE=0 — не трогать схему при импорте (manage.py migrate, ручной запуск)
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1").strip() == "1"
+
+def init_db(dry_run: bool = False):
+    """Применить ожидающие миграции; возвращает [(Migration, [SQL, ...]), ...]"""
     try:
-        engine = get_engine()
-        create_sql = """
-        CREATE TABLE IF NOT EXISTS events (
-            id SERIAL PRIMARY KEY,
-            category TEXT NOT NULL,
-            dt TIMESTAMP NOT NULL
-        );
-        """
-        if engine.dialect.name == "sqlite":
-            create_sql = """
-            CREATE TABLE IF NOT EXISTS events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category TEXT NOT NULL,
-                dt TEXT NOT NULL
-            );
-            """
-        with engine.begin() as conn:
-            conn. execute(text(create_sql))
+        return MIGRATIONS.run(get_engine(), dry_run=dry_run)
     except Exception as e:
         cool_error_handler(e, "init_db")
+        if dry_run:
+            raise
+        return []
+
+ROLLUP_UPSERT_SQL = (
+    "INSERT INTO event_daily (category_id, day, cnt) VALUES (:cat, :day, :n) "
+    "ON CONFLICT (category_id, day) DO UPDATE SET cnt = event_daily.cnt + excluded.cnt"
+)
+# Строк в одном INSERT ... VALUES: 2 параметра на строку, старые SQLite — не больше 999
+EVENT_INSERT_CHUNK = 400
+
+def _dt_param(engine, dt: datetime.datetime):
+    """Момент времени (aware, UTC) в формате колонки events.dt"""
+    if engine.dialect.name == "sqlite":
+        return int(dt.timestamp())
+    return dt
+
+def _day_param(engine, day: datetime.date):
+    # SQLite хранит день строкой 'YYYY-MM-DD', Postgres — DATE
+    return day.isoformat() if engine.dialect.name == "sqlite" else day
+
+def _insert_events(rows):
+    """Записать пачку [(category_id, aware datetime UTC), ...] одной транзакцией:
+    многострочный INSERT в events и по одному upsert на (категория, день)"""
+    if not rows:
+        return
+    engine = get_engine()
+    daily = {}
+    for code, dt in rows:
+        key = (code, dt.date())
+        daily[key] = daily.get(key, 0) + 1
+    with timed("save_event", log=MainProtokol), engine.begin() as conn:
+        for start in range(0, len(rows), EVENT_INSERT_CHUNK):
+            chunk = rows[start:start + EVENT_INSERT_CHUNK]
+            values = ", ".join(f"(:c{i}, :d{i})" for i in range(len(chunk)))
+            params = {}
+            for i, (code, dt) in enumerate(chunk):
+                params[f"c{i}"] = code
+                params[f"d{i}"] = _dt_param(engine, dt)
+            conn.execute(text(f"INSERT INTO events (category_id, dt) VALUES {values}"), params)
+        conn.execute(text(ROLLUP_UPSERT_SQL), [
+            {"cat": code, "day": _day_param(engine, day), "n": n} for (code, day), n in daily.items()
+        ])
+    STATS_CACHE.invalidate()
+
+# EVENT_WRITE_BEHIND=1 — события копятся в памяти и пишутся пачками (см. event_writer.py)
+EVENT_WRITE_BEHIND = os.getenv("EVENT_WRITE_BEHIND", "0").strip() == "1"
+EVENT_WRITER = BufferedEventWriter(_insert_events, log=MainProtokol).start() if EVENT_WRITE_BEHIND else None
 
 def save_event(category):
+    """category — подпись на любом языке или код из CATEGORY_KEYS"""
     try:
-        engine = get_engine()
-        now = datetime.datetime.utcnow()
-        if engine.dialect.name == "sqlite": 
-            dt_val = now.isoformat()
-            insert_sql = "INSERT INTO events (category, dt) VALUES (:cat, :dt)"
-            with engine.begin() as conn:
-                conn.execute(text(insert_sql), {"cat": category, "dt": dt_val})
-        else:
-            insert_sql = "INSERT INTO events (category, dt) VALUES (:cat, :dt)"
-            with engine.begin() as conn:
-                conn.execute(text(insert_sql), {"cat": category, "dt": now})
+        code = category_code(category)
+        if code is None:
+            MainProtokol(f"Unknown category '{category}', saved as other", ts='WARN')
+            code = CATEGORY_OTHER
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if EVENT_WRITER is not None:
+            EVENT_WRITER.add((code, now))
+            return
+        # Событие и суточный счётчик — в одной транзакции
+        _insert_events([(code, now)])
     except Exception as e: 
         cool_error_handler(e, "save_event")
 
+# Кэш статистики: счётчики и готовая таблица <pre> по языкам.
+# Сбрасывается в save_event / очистке; TTL — чтобы сменились границы дней
+# (и чтобы подтянулись записи других воркеров).
+try:
+    STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "60"))
+except ValueError:
+    STATS_CACHE_TTL = 60
+STATS_CACHE = TTLCache(STATS_CACHE_TTL, name="stats")
+
+def _query_stats():
+    """Счётчики по кодам категорий за 7 и 30 календарных дней (включая сегодня, UTC) из event_daily"""
+    res = {code: {'week': 0, 'month': 0} for code in range(len(CATEGORY_KEYS))}
+    engine = get_engine()
+    today = datetime.datetime.utcnow().date()
+    week_day = _day_param(engine, today - datetime.timedelta(days=6))
+    month_day = _day_param(engine, today - datetime.timedelta(days=29))
+    q = text(
+        "SELECT category_id, SUM(CASE WHEN day >= :week THEN cnt ELSE 0 END) AS wk, SUM(cnt) AS mo "
+        "FROM event_daily WHERE day >= :month GROUP BY category_id"
+    )
+    with timed("get_stats", log=MainProtokol), engine.connect() as conn:
+        rows = conn.execute(q, {"week": week_day, "month": month_day}).all()
+    for row in rows:
+        code = int(row[0])
+        if code in res:
+            res[code]['week'] = int(row[1] or 0)
+            res[code]['month'] = int(row[2] or 0)
+    return res
+
 def get_stats(language: str = 'uk'):
+    """{подпись категории на языке: {'week', 'month'}}; подписи подставляются только здесь"""
     categories = get_admin_subcategories(language)
-    res = {cat: {'week': 0, 'month':  0} for cat in categories}
     try:
-        engine = get_engine()
-        now = datetime.datetime.utcnow()
-        week_threshold = now - datetime.timedelta(days=7)
-        month_threshold = now - datetime.timedelta(days=30)
-        with engine.connect() as conn:
-            if engine.dialect.name == "sqlite":
-                week_ts = week_threshold.isoformat()
-                month_ts = month_threshold.isoformat()
-                q_week = text("SELECT category, COUNT(*) as cnt FROM events WHERE dt >= :week GROUP BY category")
-                q_month = text("SELECT category, COUNT(*) as cnt FROM events WHERE dt >= :month GROUP BY category")
-                wk = conn.execute(q_week, {"week": week_ts}).all()
-                mo = conn.execute(q_month, {"month": month_ts}).all()
-            else:
-                q_week = text("SELECT category, COUNT(*) as cnt FROM events WHERE dt >= : week GROUP BY category")
-                q_month = text("SELECT category, COUNT(*) as cnt FROM events WHERE dt >= :month GROUP BY category")
-                wk = conn.execute(q_week, {"week":  week_threshold}).all()
-                mo = conn. execute(q_month, {"month": month_threshold}).all()
-            for row in wk:
-                cat = row[0]
-                cnt = int(row[1])
-                if cat in res:
-                    res[cat]['week'] = cnt
-            for row in mo: 
-                cat = row[0]
-                cnt = int(row[1])
-                if cat in res:
-                    res[cat]['month'] = cnt
-        return res
+        # Счётчики не зависят от языка — один запрос к БД на все языки
+        res = STATS_CACHE.get_or_set("counts", _query_stats)
+        return {categories[code]: dict(v) for code, v in res.items()}
     except Exception as e:
         cool_error_handler(e, "get_stats")
         MainProtokol(str(e), 'get_stats_exception')
         return {cat: {'week': 0, 'month': 0} for cat in categories}
 
-def clear_stats_if_month_passed():
+def get_stats_message(language: str = 'uk') -> str:
+    """Готовая таблица статистики; повторные нажатия не обращаются к БД"""
+    def render():
+        counts = STATS_CACHE.get_or_set("counts", _query_stats)
+        categories = get_admin_subcategories(language)
+        return format_stats_message({categories[code]: v for code, v in counts.items()}, language)
+    try:
+        return STATS_CACHE.get_or_set(("message", language), render)
+    except Exception as e:
+        cool_error_handler(e, "get_stats_message")
+        return t('stats_unavailable', language)
+
+# Старые события удаляются пачками по id (см. retention.py), а не одним DELETE
+EVENTS_RETENTION = RetentionEngine(
+    get_engine, table="events", key="id", ts="dt", columns=("id", "category_id", "dt"),
+    dt_param=lambda dt: _dt_param(get_engine(), dt), log=MainProtokol,
+)
+
+def clear_stats_if_month_passed(days: int = None):
+    """Удалить события старше RETENTION_DAYS и суточные счётчики вне окна статистики; возвращает отчёт"""
     try:
         engine = get_engine()
-        now = datetime.datetime.utcnow()
-        month_threshold = now - datetime.timedelta(days=30)
-        with engine.begin() as conn:
-            if engine.dialect.name == "sqlite": 
-                month_ts = month_threshold.isoformat()
-                conn.execute(text("DELETE FROM events WHERE dt < :month"), {"month": month_ts})
-            else:
-                conn.execute(text("DELETE FROM events WHERE dt < :month"), {"month": month_threshold})
+        days = days or RETENTION_DAYS
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with timed("cleanup", log=MainProtokol):
+            report = EVENTS_RETENTION.run(now - datetime.timedelta(days=days))
+            # Счётчики нужны за 30 дней статистики, даже если события хранятся меньше
+            month_day = _day_param(engine, now.date() - datetime.timedelta(days=max(days, 30) - 1))
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM event_daily WHERE day < :day"), {"day": month_day})
+        STATS_CACHE.invalidate()
+        return report
     except Exception as e:
         cool_error_handler(e, "clear_stats_if_month_passed")
 
+def backfill_event_rollup() -> int:
+    """Пересобрать event_daily из строк events; возвращает число суточных строк"""
+    engine = get_engine()
+    with engine.begin() as conn:
+        rows = _rebuild_rollup(conn, engine.dialect.name)
+    STATS_CACHE.invalidate()
+    return rows
+
+def _rebuild_rollup(conn, dialect: str) -> int:
+    day_expr = "date(dt, 'unixepoch')" if dialect == "sqlite" else "CAST(dt AT TIME ZONE 'UTC' AS DATE)"
+    conn.execute(text("DELETE FROM event_daily"))
+    conn.execute(text(
+        f"INSERT INTO event_daily (category_id, day, cnt) "
+        f"SELECT category_id, {day_expr}, COUNT(*) FROM events GROUP BY category_id, {day_expr}"
+    ))
+    return int(conn.execute(text("SELECT COUNT(*) FROM event_daily")).scalar() or 0)
+
 def stats_autoclear_daemon():
     while True:
         try:
@@ -583,7 +903,8 @@ def stats_autoclear_daemon():
             cool_error_handler(e, "stats_autoclear_daemon")
         time.sleep(3600)
 
-init_db()
+if AUTO_MIGRATE:
+    init_db()
 
 TOKEN = os.getenv("API_TOKEN")
 try:
@@ -602,14 +923,10 @@ def set_webhook():
         print("[WARN] TOKEN is not set, webhook not initialized.")
         return
     if not WEBHOOK_URL:
-        print("[INFO] WEBHOOK_HOST not set; skip setting webhook.")
+        print("[INFO] WEBHOOK_HOST not set; skip setting webhook (use `python polling.py` for long polling).")
         return
     try:
-        r = requests.get(
-            f"https://api.telegram.org/bot{TOKEN}/setWebhook",
-            params={"url":  WEBHOOK_URL},
-            timeout=5
-        )
+        r = get_client(TOKEN).set_webhook(WEBHOOK_URL, timeout=5)
         if r.ok:
             print("Webhook успешно установлен!")
         else:
@@ -624,11 +941,7 @@ def send_chat_action(chat_id, action='typing'):
     if not TOKEN:
         return
     try:
-        requests.post(
-            f'https://api.telegram.org/bot{TOKEN}/sendChatAction',
-            data={'chat_id': chat_id, 'action': action},
-            timeout=3
-        )
+        get_client(TOKEN).send_chat_action(chat_id, action, timeout=3)
     except Exception: 
         pass
 
@@ -640,39 +953,56 @@ def build_welcome_message(user:  dict, language: str = 'uk') -> str:
         is_premium = user.get('is_premium', False)
         vip_badge = " ✨" if is_premium else ""
         name_html = escape(display)
-        
-        sep = t('separator', language)
-        msg = (
-            f"<pre>{sep}</pre>\n"
-            f"<b>{t('welcome_title', language, name=name_html, vip=vip_badge)}</b>\n\n"
-            f"<i>{t('welcome_subtitle', language)}</i>\n\n"
-            f"<b>{t('welcome_available', language)}</b>\n"
-            f"{t('welcome_quick_report', language)}\n"
-            f"{t('welcome_stats', language)}\n"
-            f"{t('welcome_ads', language)}\n\n"
-            f"<i>{t('welcome_footer', language)}</i>\n"
-            f"<pre>{sep}</pre>"
-        )
-        return msg
+
+        head, tail = I18N.rendered("welcome", language, _render_welcome_frame)
+        return head + t('welcome_title', language, name=name_html, vip=vip_badge) + tail
     except Exception as e:
         cool_error_handler(e, "build_welcome_message")
         return t('welcome_footer', language)
 
+def _render_welcome_frame(language: str):
+    """Приветствие без строки с именем: (до заголовка, после заголовка)"""
+    sep = t('separator', language)
+    head = f"<pre>{sep}</pre>\n<b>"
+    tail = (
+        f"</b>\n\n"
+        f"<i>{t('welcome_subtitle', language)}</i>\n\n"
+        f"<b>{t('welcome_available', language)}</b>\n"
+        f"{t('welcome_quick_report', language)}\n"
+        f"{t('welcome_stats', language)}\n"
+        f"{t('welcome_ads', language)}\n\n"
+        f"<i>{t('welcome_footer', language)}</i>\n"
+        f"<pre>{sep}</pre>"
+    )
+    return head, tail
+
+# Очередь исходящих сообщений (лимиты Telegram, 429/retry_after); без неё — синхронная отправка
+SEND_QUEUE_ENABLED = os.getenv("SEND_QUEUE", "0").strip() == "1"
+
+def _call_api(chat_id, tag, fn, *args, **kwargs):
+    """Вызов Bot API: при SEND_QUEUE=1 ставится в очередь и возвращает Future, иначе Response/None"""
+    if SEND_QUEUE_ENABLED:
+        return get_send_queue(log=MainProtokol).submit(chat_id, fn, args, kwargs, tag=tag)
+    try:
+        r = fn(*args, **kwargs)
+        if not r.ok:
+            MainProtokol(f"{r.status_code} {r.text}", tag)
+        return r
+    except Exception as e:
+        MainProtokol(str(e), tag)
+        return None
+
 def send_message(chat_id, text, reply_markup=None, parse_mode=None, timeout=8):
+    """reply_markup — dict или уже закодированный JSON (str/EncodedMarkup из KEYBOARDS)"""
     if not TOKEN:
         print("[WARN] Попытка отправки сообщения без TOKEN")
         return None
-    url = f'https://api.telegram.org/bot{TOKEN}/sendMessage'
-    payload = {
-        'chat_id': chat_id,
-        'text': text
-    }
-    if reply_markup:
-        payload['reply_markup'] = json.dumps(reply_markup)
-    if parse_mode:
-        payload['parse_mode'] = parse_mode
+    client = get_client(TOKEN)
+    if SEND_QUEUE_ENABLED:
+        return _call_api(chat_id, 'Помилка надсилання', client.send_message, chat_id, text,
+                         reply_markup=reply_markup, parse_mode=parse_mode, timeout=timeout)
     try:
-        resp = requests.post(url, data=payload, timeout=timeout)
+        resp = client.send_message(chat_id, text, reply_markup=reply_markup, parse_mode=parse_mode, timeout=timeout)
         if not resp.ok:
             MainProtokol(resp.text, 'Помилка надсилання')
         return resp
@@ -682,14 +1012,35 @@ def send_message(chat_id, text, reply_markup=None, parse_mode=None, timeout=8):
         return None
 
 def _get_reply_markup_for_admin(user_id: int, orig_chat_id: int = None, orig_msg_id: int = None, language: str = 'uk'):
-    kb = {
-        "inline_keyboard": [
-            [{"text": t('btn_reply', language), "callback_data": f"reply_{user_id}"}]
-        ]
-    }
+    if user_id is None:
+        # Сообщение без from (канал): отвечать в исходный чат
+        user_id = orig_chat_id if orig_chat_id is not None else 0
     if orig_chat_id is not None and orig_msg_id is not None:
-        kb["inline_keyboard"][0]. append({"text": t('btn_add_stat', language), "callback_data": f"addstat_{orig_chat_id}_{orig_msg_id}"})
-    return kb
+        return KEYBOARDS.render("admin_reply_addstat", language, user=user_id, chat=orig_chat_id, msg=orig_msg_id)
+    return KEYBOARDS.render("admin_reply", language, user=user_id)
+
+def _render_admin_info_labels(language: str) -> dict:
+    """Постоянные части карточки для админа — готовые фрагменты HTML"""
+    sep_line = f"<pre>{t('separator', language)}</pre>"
+    label = lambda key: f"<b>{t(key, language)}:</b> "
+    return {
+        'title': {
+            'event': f"{sep_line}\n<b>{t('admin_new_event', language)}</b>\n",
+            'ad': f"{sep_line}\n<b>{t('admin_new_ad', language)}</b>\n",
+            'message': f"{sep_line}\n<b>{t('admin_new_message', language)}</b>\n",
+        },
+        'profile_name': t('admin_profile', language),
+        'write_admin': escape(t('btn_write_admin', language)),
+        'profile': label('admin_profile'),
+        'id': label('admin_id'),
+        'phone': label('admin_phone'),
+        'location': label('admin_location'),
+        'category': label('admin_category'),
+        'message_id': label('admin_message_id'),
+        'date': label('admin_date'),
+        'text': f"<b>{t('admin_text', language)}:</b>",
+        'footer': f"\n<i>{t('formatted_message', language)}</i>\n{sep_line}",
+    }
 
 def build_admin_info(message:  dict, category: str = None, msg_type: str = None, language: str = 'uk') -> str:
     try:
@@ -697,14 +1048,8 @@ def build_admin_info(message:  dict, category: str = None, msg_type: str = None,
         if final_type is None:
             final_type = 'event' if category else 'message'
 
-        if final_type == 'event': 
-            title = t('admin_new_event', language)
-        elif final_type == 'ad':
-            title = t('admin_new_ad', language)
-        else:
-            title = t('admin_new_message', language)
-        
-        sep = t('separator', language)
+        labels = I18N.rendered("admin_info", language, _render_admin_info_labels)
+        title = labels['title'].get(final_type, labels['title']['message'])
 
         user = message.get('from', {}) or {}
         first = (user.get('first_name') or "").strip()
@@ -713,7 +1058,7 @@ def build_admin_info(message:  dict, category: str = None, msg_type: str = None,
         user_id = user.get('id')
         is_premium = user.get('is_premium', None)
 
-        display_name = (first + (" " + last if last else "")).strip() or t('admin_profile', language)
+        display_name = (first + (" " + last if last else "")).strip() or labels['profile_name']
         display_html = escape(display_name)
 
         if username:
@@ -722,8 +1067,7 @@ def build_admin_info(message:  dict, category: str = None, msg_type: str = None,
             profile_html = f"<a href=\"{profile_url}\">{profile_label}</a>"
         else:
             profile_url = f"tg://user?id={user_id}"
-            profile_label = t('btn_write_admin', language)
-            profile_html = f"<a href=\"{profile_url}\">{escape(profile_label)}</a>"
+            profile_html = f"<a href=\"{profile_url}\">{labels['write_admin']}</a>"
 
         contact = message.get('contact')
         contact_html = ""
@@ -757,52 +1101,51 @@ def build_admin_info(message:  dict, category: str = None, msg_type: str = None,
         category_html = escape(category) if category else None
 
         parts = []
-        parts.append(f"<pre>{sep}</pre>")
-        parts.append(f"<b>{title}</b>")
-        parts.append("")
+        parts.append(title)
 
         name_line = f"<b>{display_html}</b>"
         if is_premium:
             name_line += " ✨"
         parts.append(name_line)
-        parts.append(f"<b>{t('admin_profile', language)}:</b> {profile_html}")
-        parts.append(f"<b>{t('admin_id', language)}:</b> {escape(str(user_id)) if user_id is not None else '-'}")
+        parts.append(labels['profile'] + profile_html)
+        parts.append(labels['id'] + (escape(str(user_id)) if user_id is not None else '-'))
 
         if contact_html:
-            parts.append(f"<b>{t('admin_phone', language)}:</b> {contact_html}")
+            parts.append(labels['phone'] + contact_html)
         if location_html:
-            parts.append(f"<b>{t('admin_location', language)}:</b> {escape(location_html)}")
+            parts.append(labels['location'] + escape(location_html))
 
         if category_html:
-            parts. append(f"<b>{t('admin_category', language)}:</b> {category_html}")
+            parts.append(labels['category'] + category_html)
 
         parts.append("")
-        parts.append(f"<b>{t('admin_message_id', language)}:</b> {escape(str(msg_id))}")
-        parts.append(f"<b>{t('admin_date', language)}:</b> {escape(str(date_str))}")
+        parts.append(labels['message_id'] + escape(str(msg_id)))
+        parts.append(labels['date'] + escape(str(date_str)))
 
         if text:
             display_text = text if len(text) <= 2000 else text[:1997] + "..."
-            parts. append("")
-            parts.append(f"<b>{t('admin_text', language)}:</b>")
+            parts.append("")
+            parts.append(labels['text'])
             parts.append("<pre>{}</pre>".format(escape(display_text)))
 
-        parts.append("")
-        parts.append(f"<i>{t('formatted_message', language)}</i>")
-        parts.append(f"<pre>{sep}</pre>")
+        parts.append(labels['footer'])
 
-        return "\n". join(parts)
+        return "\n".join(parts)
     except Exception as e:
         cool_error_handler(e, "build_admin_info")
         return t('admin_new_message', language)
 
-def _post_request(url, data=None, files=None, timeout=10):
+def _post_request(method, data=None, files=None, timeout=10):
+    if SEND_QUEUE_ENABLED:
+        chat_id = (data or {}).get("chat_id")
+        return _call_api(chat_id, 'WARN', get_client(TOKEN).call, method, data=data, files=files, timeout=timeout)
     try:
-        r = requests.post(url, data=data, files=files, timeout=timeout)
+        r = get_client(TOKEN).call(method, data=data, files=files, timeout=timeout)
         if not r.ok:
-            MainProtokol(f"Request failed: {url} -> {r.status_code} {r.text}", ts='WARN')
+            MainProtokol(f"Request failed: {method} -> {r.status_code} {r.text}", ts='WARN')
         return r
     except Exception as e:
-        MainProtokol(f"Network error for {url}: {str(e)}", ts='ERROR')
+        MainProtokol(f"Network error for {method}: {str(e)}", ts='ERROR')
         return None
 
 def forward_admin_message_to_user(user_id: int, admin_msg:  dict, language: str = 'uk'):
@@ -814,36 +1157,33 @@ def forward_admin_message_to_user(user_id: int, admin_msg:  dict, language: str
 
         if 'photo' in admin_msg:
             file_id = admin_msg['photo'][-1]. get('file_id')
-            url = f"https://api.telegram.org/bot{TOKEN}/sendPhoto"
             payload = {"chat_id": user_id, "photo": file_id}
             if safe_caption:
                 payload["caption"] = f"{t('user_response_header', language)}\n<pre>{safe_caption}</pre>"
                 payload["parse_mode"] = "HTML"
             else:
                 payload["caption"] = t('user_response_no_text', language)
-            _post_request(url, data=payload)
+            _post_request("sendPhoto", data=payload)
             return True
 
         if 'video' in admin_msg:
             file_id = admin_msg['video'].get('file_id')
-            url = f"https://api.telegram.org/bot{TOKEN}/sendVideo"
             payload = {"chat_id": user_id, "video": file_id}
             if safe_caption: 
                 payload["caption"] = f"{t('user_response_header', language)}\n<pre>{safe_caption}</pre>"
                 payload["parse_mode"] = "HTML"
             else:
                 payload["caption"] = t('user_response_no_text', language)
-            _post_request(url, data=payload)
+            _post_request("sendVideo", data=payload)
             return True
 
         if 'document' in admin_msg:
             file_id = admin_msg['document'].get('file_id')
-            url = f"https://api.telegram.org/bot{TOKEN}/sendDocument"
             payload = {"chat_id": user_id, "document": file_id}
             if safe_caption: 
                 payload["caption"] = f"{t('user_response_header', language)}\n<pre>{safe_caption}</pre>"
                 payload["parse_mode"] = "HTML"
-            _post_request(url, data=payload)
+            _post_request("sendDocument", data=payload)
             return True
 
         if caption: 
@@ -857,18 +1197,10 @@ def forward_admin_message_to_user(user_id: int, admin_msg:  dict, language: str
         return False
 
 def send_media_collection_keyboard(chat_id, language: str = 'uk'):
-    kb = {
-        "keyboard": [
-            [{"text":  t('btn_send', language)}],
-            [{"text": t('btn_cancel', language)}]
-        ],
-        "resize_keyboard": True,
-        "one_time_keyboard": False
-    }
     send_message(
         chat_id,
         t('event_instructions', language),
-        reply_markup=kb
+        reply_markup=KEYBOARDS.get("media_collection", language)
     )
 
 def _collect_media_summary_and_payloads(msgs):
@@ -917,15 +1249,44 @@ def _collect_media_summary_and_payloads(msgs):
     leftover_texts = other_texts
     return media_items, doc_msgs, leftover_texts
 
+@traced()
+def _send_albums_to_admin(media_items, doc_msgs):
+    """Фото/видео и документы пачки — альбомами до 10 штук (albums.py)"""
+    items = []
+    for mi in media_items:
+        obj = {"type": mi["type"], "media": mi["media"]}
+        if mi.get("caption"):
+            # Текст пользователя при parse_mode=HTML экранируется, иначе «<» ломает весь альбом
+            obj["caption"] = escape(mi["caption"])
+            obj["parse_mode"] = "HTML"
+        items.append(obj)
+    for d in doc_msgs:
+        if not d.get("file_id"):
+            continue
+        obj = {"type": "document", "media": d["file_id"]}
+        if d.get("text"):
+            obj["caption"] = d["text"] if len(d["text"]) <= 1000 else d["text"][: 997] + "..."
+        items.append(obj)
+    chunks = plan_albums(items)
+    client = get_client(TOKEN)
+    if SEND_QUEUE_ENABLED:
+        # Очередь чата сама держит порядок, лимиты и повторы на 429
+        for chunk in chunks:
+            fn, args, kwargs = chunk_call(client, ADMIN_ID, chunk)
+            _call_api(ADMIN_ID, f"{chunk.method}Fail", fn, *args, **kwargs)
+        return
+    get_album_sender(client, log=MainProtokol).send(ADMIN_ID, chunks)
+
+@traced()
 def send_compiled_media_to_admin(chat_id, language: str = 'uk'):
-    with GLOBAL_LOCK:
-        msgs = list(pending_media.get(chat_id, []))
+    # Атомарно забираем пачку: повторное «Надіслати» (в т.ч. на другом воркере) её уже не увидит
+    msgs = pending_media.pop(chat_id, [])
     if not msgs:
         send_message(chat_id, t('event_no_media', language))
         return
     
     m_category = None
-    with GLOBAL_LOCK:
+    with CHAT_LOCKS.for_key(chat_id):
         if pending_mode.get(chat_id) == "event":
             m_category = user_admin_category.get(chat_id, t('cat_other', language))
         current_mode = pending_mode.get(chat_id)
@@ -953,70 +1314,33 @@ def send_compiled_media_to_admin(chat_id, language: str = 'uk'):
     send_message(ADMIN_ID, admin_info, reply_markup=reply_markup, parse_mode="HTML")
 
     try:
-        if media_items:
-            if len(media_items) > 1:
-                sendmedia = []
-                for mi in media_items:
-                    obj = {"type": mi["type"], "media": mi["media"]}
-                    if mi.get("caption"):
-                        obj["caption"] = mi["caption"]
-                        obj["parse_mode"] = "HTML"
-                    sendmedia. append(obj)
-                url = f"https://api.telegram.org/bot{TOKEN}/sendMediaGroup"
-                payload = {"chat_id":  ADMIN_ID, "media":  json.dumps(sendmedia)}
-                try:
-                    r = requests.post(url, data=payload, timeout=10)
-                    if not r. ok:
-                        MainProtokol(f"sendMediaGroup failed: {r.status_code} {r.text}", "MediaGroupFail")
-                except Exception as e: 
-                    MainProtokol(f"sendMediaGroup error: {str(e)}", "MediaGroupFail")
-            else:
-                mi = media_items[0]
-                if mi["type"] == "photo":
-                    url = f"https://api.telegram.org/bot{TOKEN}/sendPhoto"
-                    payload = {"chat_id": ADMIN_ID, "photo": mi["media"]}
-                    if mi.get("caption"):
-                        payload["caption"] = mi["caption"]
-                        payload["parse_mode"] = "HTML"
-                    try:
-                        r = requests. post(url, data=payload, timeout=10)
-                        if not r.ok:
-                            MainProtokol(f"sendPhoto failed: {r.status_code} {r.text}", "PhotoFail")
-                    except Exception as e:
-                        MainProtokol(f"sendPhoto error: {str(e)}", "PhotoFail")
+        _send_albums_to_admin(media_items, doc_msgs)
     except Exception as e:
         cool_error_handler(e, "send_compiled_media_to_admin:  media send")
 
-    for d in doc_msgs:
-        try:
-            payload = {
-                "chat_id":  ADMIN_ID,
-                "document": d["file_id"]
-            }
-            if d. get("text"):
-                payload["caption"] = d["text"] if len(d["text"]) <= 1000 else d["text"][: 997] + "..."
-            r = requests.post(f"https://api.telegram.org/bot{TOKEN}/sendDocument", data=payload, timeout=10)
-        except Exception as e:
-            MainProtokol(f"sendDocument error: {str(e)}", "DocumentFail")
-
-    with GLOBAL_LOCK:
-        pending_media.pop(chat_id, None)
+    with CHAT_LOCKS.for_key(chat_id):
         pending_mode.pop(chat_id, None)
 
-def format_stats_message(stats: dict, language: str = 'uk') -> str:
+def _render_stats_layout(language: str):
+    """Шапка, выровненные подписи категорий и низ таблицы статистики"""
     categories = get_admin_subcategories(language)
     max_cat_len = max(len(escape(c)) for c in categories) + 1
-    col1 = f"{t('stats_category', language)}". ljust(max_cat_len)
+    col1 = f"{t('stats_category', language)}".ljust(max_cat_len)
     header = f"{col1}  {t('stats_week', language):>6}  {t('stats_month', language):>6}"
-    lines = [header, "-" * (max_cat_len + 16)]
-    for cat in categories:
-        name = escape(cat)
+    sep = t('separator', language)
+    head = f"<pre>{sep}\n{header}\n{'-' * (max_cat_len + 16)}"
+    rows = tuple((cat, escape(cat).ljust(max_cat_len)) for cat in categories)
+    return head, rows, f"{sep}</pre>"
+
+def format_stats_message(stats: dict, language: str = 'uk') -> str:
+    head, rows, tail = I18N.rendered("stats_layout", language, _render_stats_layout)
+    lines = [head]
+    for cat, name in rows:
         week = stats.get(cat, {}).get('week', 0)
         month = stats.get(cat, {}).get('month', 0)
-        lines.append(f"{name. ljust(max_cat_len)}  {str(week):>6}  {str(month):>6}")
-    content = "\n".join(lines)
-    sep = t('separator', language)
-    return f"<pre>{sep}\n{content}\n{sep}</pre>"
+        lines.append(f"{name}  {str(week):>6}  {str(month):>6}")
+    lines.append(tail)
+    return "\n".join(lines)
 
 app = Flask(__name__)
 
@@ -1025,13 +1349,245 @@ def flask_global_error_handler(e):
     cool_error_handler(e, context="Flask global error handler")
     return "Internal server error.", 500
 
+# Ack-first: webhook только валидирует апдейт и ставит его в очередь пула воркеров
+WEBHOOK_ACK_FIRST = os.getenv("WEBHOOK_ACK_FIRST", "0").strip() == "1"
+_update_pool: ShardedUpdatePool = None
+_update_pool_lock = threading.Lock()
+
+def get_update_pool() -> ShardedUpdatePool:
+    global _update_pool
+    if _update_pool is None:
+        with _update_pool_lock:
+            if _update_pool is None:
+                _update_pool = ShardedUpdatePool(process_update, log=MainProtokol)
+    return _update_pool
+
+def parse_update(data_raw, lazy: bool = None):
+    """Тело апдейта (bytes без декодирования) -> dict / LazyUpdate; None для битых апдейтов (повтор от Telegram их не исправит)"""
+    if lazy is None:
+        # Ленивый разбор выгоден, только если тело читают не в этом потоке (ack-first):
+        # синхронный обработчик сразу читает всё тело
+        lazy = WEBHOOK_ACK_FIRST
+    try:
+        update = decode_update(data_raw, lazy=lazy)
+    except Exception as e:
+        MainProtokol(f"Invalid update: {str(e)}", ts='WARN')
+        return None
+    if not isinstance(update, dict) or 'update_id' not in update:
+        MainProtokol("Update without update_id", ts='WARN')
+        return None
+    return update
+
+def dispatch_update(update: dict) -> bool:
+    """Общая точка входа для апдейта (webhook, long polling); False — очередь ack-first заполнена"""
+    if WEBHOOK_ACK_FIRST:
+        return get_update_pool().submit(update)
+    process_update(update)
+    return True
+
+# ---- метрики (/metrics, формат Prometheus; см. metrics.py) ----
+
+WEBHOOK_REQUESTS = REGISTRY.counter("bot_webhook_requests_total", "Webhook requests by update kind and response status", ("kind", "status"))
+WEBHOOK_DURATION = REGISTRY.histogram("bot_webhook_duration_seconds", "Webhook request latency", ("kind",))
+UPDATE_DURATION = REGISTRY.histogram("bot_update_processing_seconds", "process_update latency", ("kind",))
+UPDATE_ERRORS = REGISTRY.counter("bot_update_errors_total", "Unhandled exceptions in process_update", ("kind",))
+# Токен для /metrics (?token=... или Authorization: Bearer ...); пусто — без проверки
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+_CALLBACK_PREFIX = re.compile(r"[a-z]+(?:_[a-z]+)*")
+_MESSAGE_KINDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+
+def update_kind(update) -> str:
+    """Тип апдейта для меток: message, edited_message, callback:<префикс data> ..."""
+    if not isinstance(update, dict):
+        return "invalid"
+    if isinstance(update, LazyUpdate) and not update.loaded:
+        # Тело ещё не разобрано (ack-first): тип и префикс data — без разбора, его сделает воркер
+        if update.kind == 'callback_query':
+            return _callback_kind(update.peek_callback_data())
+        return update.kind if update.kind in _MESSAGE_KINDS else "other"
+    call = update.get('callback_query')
+    if call is not None:
+        return _callback_kind(call.get('data'))
+    for kind in _MESSAGE_KINDS:
+        if kind in update:
+            return kind
+    return "other"
+
+def _callback_kind(data) -> str:
+    # Префикс без id: reply_123 -> reply, confirm_addstat|1|2|3 -> confirm_addstat
+    m = _CALLBACK_PREFIX.match(data or '')
+    return f"callback:{m.group(0)[:32] if m else 'other'}"
+
+def _collect_runtime_metrics():
+    """Размеры состояния, очередей и пулов — считаются в момент запроса /metrics"""
+    families = []
+    states = [("pending_mode", pending_mode), ("user_admin_category", user_admin_category),
+              ("waiting_for_admin_message", waiting_for_admin_message), ("waiting_for_ad_message", waiting_for_ad_message),
+              ("waiting_for_admin", waiting_for_admin), ("admin_adding_event", admin_adding_event)]
+    families.append(("bot_state_entries", "gauge", "Entries in session-state maps",
+                     [({"name": name}, len(m)) for name, m in states]))
+    media = pending_media.stats()
+    families.append(("bot_pending_media", "gauge", "Pending media batches",
+                     [({"field": k}, media[k]) for k in ("sessions", "items", "bytes")]))
+    families.append(("bot_pending_media_events_total", "counter", "Pending media buffer events",
+                     [({"event": k}, media[k]) for k in ("appended", "rejected_items", "rejected_bytes", "evicted_idle", "evicted_lru")]))
+    if SEND_QUEUE_ENABLED:
+        q = get_send_queue().stats()
+        families.append(("bot_send_queue_depth", "gauge", "Outbound messages waiting", [({}, q["depth"])]))
+        families.append(("bot_send_queue_jobs_total", "counter", "Outbound queue jobs",
+                         [({"result": k}, v) for k, v in q.items() if k in ("submitted", "sent", "failed", "retried_429", "retried_error")]))
+    if _update_pool is not None:
+        u = _update_pool.stats()
+        families.append(("bot_update_queue_depth", "gauge", "Updates waiting for a worker", [({}, u["depth"])]))
+    db = db_stats()
+    pool_samples = []
+    for i, p in enumerate(db["pools"]):
+        for k in ("size", "checked_out", "overflow"):
+            if k in p:
+                pool_samples.append(({"pool": str(i), "field": k}, p[k]))
+    families.append(("bot_db_pool", "gauge", "DB connection pool state", pool_samples))
+    families.append(("bot_db_checkout_wait_seconds_total", "counter", "Time spent waiting for a DB connection", [({}, db["checkout"]["seconds_total"])]))
+    families.append(("bot_db_checkouts_total", "counter", "DB connection checkouts", [({}, db["checkout"]["count"])]))
+    families.append(("bot_db_slow_queries_total", "counter", "Queries slower than DB_SLOW_QUERY_MS", [({}, db["queries"]["slow"])]))
+    lock_samples = []
+    for name, st in lock_stats().items():
+        for bound, n in st["histogram"]:
+            lock_samples.append(("bot_lock_wait_seconds_bucket", {"lock": name, "le": "+Inf" if bound == float("inf") else str(bound)}, n))
+        lock_samples.append(("bot_lock_wait_seconds_count", {"lock": name}, st["acquisitions"]))
+        lock_samples.append(("bot_lock_wait_seconds_sum", {"lock": name}, st["wait_seconds_total"]))
+    families.append(("bot_lock_wait_seconds", "histogram", "Time spent waiting for named locks", lock_samples))
+    cache = STATS_CACHE.stats()
+    families.append(("bot_stats_cache_total", "counter", "Stats cache lookups",
+                     [({"result": k}, cache[k]) for k in ("hits", "misses", "invalidations")]))
+    log_stats = get_logger().stats()
+    families.append(("bot_log_records_total", "counter", "Log records",
+                     [({"result": k}, log_stats[k]) for k in ("written", "dropped", "filtered")]))
+    if EVENT_WRITER is not None:
+        families.append(("bot_event_writer_pending", "gauge", "Events buffered for write-behind", [({}, EVENT_WRITER.pending())]))
+    albums = album_stats()
+    if albums is not None:
+        families.append(("bot_album_events_total", "counter", "Album pipeline: batches, requests, retries, split albums, failures",
+                         [({"event": k}, v) for k, v in albums.items()]))
+    rec = _recorders.get(os.getpid())
+    if rec is not None:
+        c = rec.stats()
+        families.append(("bot_capture_updates_total", "counter", "Captured updates",
+                         [({"result": k}, c[k]) for k in ("written", "dropped", "write_errors")]))
+    return families
+
+REGISTRY.register_callback(_collect_runtime_metrics)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if request.args.get("token") != METRICS_TOKEN and auth != f"Bearer {METRICS_TOKEN}":
+            return "forbidden", 403
+    return REGISTRY.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# Запись входящих апдейтов для bench replay (CAPTURE_UPDATES=1, см. capture.py)
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+def get_recorder() -> UpdateRecorder:
+    """Запись апдейтов процесса (свой поток на каждый pid); None, если запись выключена"""
+    if not CAPTURE_UPDATES:
+        return None
+    pid = os.getpid()
+    with _recorders_lock:
+        rec = _recorders.get(pid)
+        if rec is None:
+            # Тексты кнопок и меню не личные — сохраняем, чтобы при воспроизведении сработали те же ветки
+            keep = {v for texts in TRANSLATIONS.values() for v in texts.values()}
+            rec = _recorders[pid] = UpdateRecorder(Anonymizer(admin_id=ADMIN_ID, keep_texts=keep)).start()
+        return rec
+
 @app.route(f"/webhook/{TOKEN}", methods=["POST"])
 def webhook():
-    global pending_media, pending_mode, admin_adding_event
+    started = time.perf_counter()
+    arrived = time.time()
+    with trace("webhook") as tr:
+        with span("parse"):
+            update = parse_update(request.get_data())
+        if update is not None and CAPTURE_UPDATES:
+            get_recorder().record(update, arrived)
+        kind = update_kind(update)
+        if tr is not None:
+            tr.attrs.update({"kind": kind, "update_id": (update or {}).get("update_id")})
+        status = 200
+        try:
+            if update is None:
+                return "ok", 200
+            if not WEBHOOK_ACK_FIRST:
+                result = process_update(update)
+                return result if result is not None else ("ok", 200)
+            if not dispatch_update(update):
+                # Очередь заполнена: Telegram повторит доставку позже
+                MainProtokol(f"Update queue full, update {update.get('update_id')} deferred", ts='WARN')
+                status = 503
+                return "busy", 503
+            return "ok", 200
+        except Exception:
+            status = 500
+            raise
+        finally:
+            WEBHOOK_DURATION.observe(time.perf_counter() - started, kind=kind)
+            WEBHOOK_REQUESTS.inc(kind=kind, status=status)
+
+# Сэмплирующий профилировщик по команде администратора: /profile [секунды]
+PROFILER = SamplingProfiler()
+
+def _handle_profile_command(update: dict) -> bool:
+    msg = update.get('message') or {}
+    parts = (msg.get('text') or '').split()
+    # /profile или /profile@имя_бота, но не /profileXYZ
+    if not ADMIN_ID or not parts or parts[0].split('@', 1)[0] != '/profile' \
+            or (msg.get('chat') or {}).get('id') != ADMIN_ID:
+        return False
     try:
-        data_raw = request.get_data(as_text=True)
-        update = json.loads(data_raw)
+        seconds = int(parts[1]) if len(parts) > 1 else 30
+    except ValueError:
+        seconds = 30
+    seconds = clamp_seconds(seconds)
+
+    def done(result):
+        top = "\n".join(f"{pct:5.1f}%  {escape(name)}" for name, pct in result["top"])
+        send_message(
+            ADMIN_ID,
+            f"🔬 Профіль: {result['samples']} знімків за {result['seconds']:.0f} с, "
+            f"очікування {result['idle']:.1f}%\n"
+            f"Файл: {escape(result['path'])}\n<pre>{top}</pre>",
+            parse_mode="HTML",
+        )
 
+    if PROFILER.start(seconds, on_done=done):
+        send_message(ADMIN_ID, f"🔬 Профілювання запущено на {seconds:.0f} с")
+    else:
+        send_message(ADMIN_ID, "🔬 Профілювання вже триває")
+    return True
+
+def process_update(update: dict):
+    """Обработка одного апдейта (синхронно из webhook или в воркере ack-first)"""
+    if isinstance(update, LazyUpdate) and not update.load():
+        # Тело разбирается при первом обращении: битый JSON виден только здесь
+        MainProtokol(f"Invalid update {update.get('update_id')}: {update.error}", ts='WARN')
+        return None
+    kind = update_kind(update)
+    started = time.perf_counter()
+    try:
+        # В синхронном режиме — спан трассы webhook, в воркере ack-first — своя трасса
+        with trace("update", kind=kind, update_id=update.get('update_id')):
+            if _handle_profile_command(update):
+                return None
+            return _handle_update(update)
+    except Exception:
+        UPDATE_ERRORS.inc(kind=kind)
+        raise
+    finally:
+        UPDATE_DURATION.observe(time.perf_counter() - started, kind=kind)
+
+def _handle_update(update: dict):
+    try:
         if 'callback_query' in update:
             call = update['callback_query']
             chat_id = call['from']['id']
@@ -1041,7 +1597,7 @@ def webhook():
             if data. startswith("reply_") and chat_id == ADMIN_ID: 
                 try:
                     user_id = int(data.split("_", 1)[1])
-                    with GLOBAL_LOCK:
+                    with ADMIN_LOCK:
                         waiting_for_admin[ADMIN_ID] = user_id
                     send_message(
                         ADMIN_ID,
@@ -1056,16 +1612,7 @@ def webhook():
                     if len(parts) == 3:
                         orig_chat_id = int(parts[1])
                         orig_msg_id = int(parts[2])
-                        categories = get_admin_subcategories(user_lang)
-                        kb = {"inline_keyboard": []}
-                        row = []
-                        for idx, cat in enumerate(categories):
-                            row.append({"text": cat, "callback_data": f"confirm_addstat|{orig_chat_id}|{orig_msg_id}|{idx}"})
-                            if len(row) == 2:
-                                kb["inline_keyboard"]. append(row)
-                                row = []
-                        if row: 
-                            kb["inline_keyboard"].append(row)
+                        kb = KEYBOARDS.render("addstat_categories", user_lang, chat=orig_chat_id, msg=orig_msg_id)
                         send_message(ADMIN_ID, t('admin_category_select', user_lang), reply_markup=kb)
                 except Exception as e:
                     cool_error_handler(e, context="webhook: addstat callback")
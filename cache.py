@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Небольшой потокобезопасный кэш с TTL и счётчиками попаданий/промахов.
+get_or_set() не даёт одновременным промахам по одному ключу выполнить
+загрузку несколько раз (защита от «набега» на БД).
+"""
+import time
+import threading
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl: float, name: str = "cache"):
+        self.ttl = ttl
+        self.name = name
+        self._data = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._generation = 0
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._counters["hits"] += 1
+                return entry[0]
+            self._counters["misses"] += 1
+            return default
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            # Значение, посчитанное до invalidate(), не кладём — оно уже устарело
+            if generation is not None and generation != self._generation:
+                return
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (value, expires)
+
+    def get_or_set(self, key, loader):
+        """Значение из кэша или loader(); исключения loader() пробрасываются и не кэшируются"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # Пока ждали, другой поток мог уже загрузить значение
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                    self._counters["hits"] += 1
+                    self._counters["misses"] -= 1
+                    return entry[0]
+                generation = self._generation
+            value = loader()
+            self.set(key, value, generation=generation)
+            return value
+
+    def invalidate(self, key=_MISSING):
+        """Сбросить один ключ или весь кэш"""
+        with self._lock:
+            self._generation += 1
+            self._counters["invalidations"] += 1
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            res = dict(self._counters)
+            res.update({"name": self.name, "size": len(self._data), "ttl": self.ttl})
+        return res
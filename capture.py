@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Запись входящих апдейтов для последующего воспроизведения (bench replay).
+Включается CAPTURE_UPDATES=1. webhook() только кладёт апдейт с временем
+прихода в ограниченную очередь; фоновый поток обезличивает его и дописывает
+пачками в файл .jsonl.gz — каждая пачка отдельным gzip-членом, поэтому файл
+только растёт, а оборванная при падении последняя пачка не портит остальные.
+
+Строка файла: {"ts": 1700000000.123, "u": {...обезличенный апдейт...}};
+первая строка каждого файла — заголовок {"capture": 1, ...}.
+
+Обезличивание: id пользователей и чатов -> стабильные псевдо-id (HMAC с
+CAPTURE_SALT; id администратора -> ANON_ADMIN_ID), имена, телефоны, ссылки,
+file_id -> маски или хэши, текст и подписи -> «xxxx» той же длины, кроме
+текстов кнопок бота (keep_texts) и имени команды (/start).
+"""
+import os
+import re
+import hmac
+import gzip
+import json
+import time
+import zlib
+import queue
+import atexit
+import hashlib
+import threading
+
+from config import env_int
+
+
+CAPTURE_UPDATES = os.getenv("CAPTURE_UPDATES", "0").strip() == "1"
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "captures")
+# Общая соль для всех воркеров: без неё у каждого процесса свои псевдо-id
+CAPTURE_SALT = os.getenv("CAPTURE_SALT", "").strip()
+CAPTURE_MAX_BYTES = env_int("CAPTURE_MAX_BYTES", 64 * 1024 * 1024)
+CAPTURE_QUEUE_SIZE = env_int("CAPTURE_QUEUE_SIZE", 10000)
+try:
+    CAPTURE_FLUSH_INTERVAL = float(os.getenv("CAPTURE_FLUSH_INTERVAL", "5"))
+except ValueError:
+    CAPTURE_FLUSH_INTERVAL = 5.0
+
+FORMAT_VERSION = 1
+# Псевдо-id администратора в записи; bench replay запускает бота с ADMIN_ID=ANON_ADMIN_ID
+ANON_ADMIN_ID = 1000
+
+_ID_KEYS = frozenset(("id", "user_id", "chat_id", "sender_chat_id", "migrate_to_chat_id", "migrate_from_chat_id"))
+_TEXT_KEYS = frozenset(("text", "caption", "quote"))
+_FILE_KEYS = frozenset(("file_id", "file_unique_id"))
+_PII_KEYS = frozenset((
+    "first_name", "last_name", "username", "title", "phone_number", "vcard", "bio", "email",
+    "invite_link", "url", "address", "foursquare_id", "google_place_id", "description", "file_name",
+))
+_GEO_KEYS = frozenset(("latitude", "longitude"))
+# Id пользователя/чата в callback_data бота — сразу после префикса: reply_<user>,
+# addstat_<chat>_<msg>, confirm_addstat|<chat>|<msg>|<cat>. message_id остаются как есть,
+# как и поля message_id, иначе повтор ссылался бы на сообщения, которых нет в записи
+_CALLBACK_ID = re.compile(r"(reply_|addstat_|confirm_addstat\|)(-?\d+)")
+_ID_CACHE_MAX = 100_000
+
+
+def _mask(value: str) -> str:
+    """Та же длина и те же пробелы/переводы строк — объём и форма сообщения сохраняются"""
+    return "".join(c if c.isspace() else "x" for c in value)
+
+
+class Anonymizer:
+    """Обезличивание апдейта; одинаковые id дают одинаковые псевдо-id в пределах соли"""
+
+    def __init__(self, salt: str = None, admin_id: int = 0, keep_texts=()):
+        self.salt = (salt or CAPTURE_SALT or os.urandom(16).hex()).encode("utf-8")
+        self.admin_id = admin_id
+        self.keep_texts = frozenset(keep_texts)
+        self._ids = {}
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self.salt, value.encode("utf-8"), hashlib.sha256).digest()
+
+    def anon_id(self, value: int) -> int:
+        if self.admin_id and value == self.admin_id:
+            return ANON_ADMIN_ID
+        res = self._ids.get(value)
+        if res is None:
+            if len(self._ids) >= _ID_CACHE_MAX:
+                self._ids.clear()
+            n = 10 ** 9 + int.from_bytes(self._digest(str(abs(value)))[:8], "big") % (9 * 10 ** 9)
+            res = self._ids[value] = -n if value < 0 else n
+        return res
+
+    def token(self, value: str) -> str:
+        return "anon-" + self._digest(value).hex()[:24]
+
+    def text(self, value: str) -> str:
+        if value in self.keep_texts:
+            return value
+        if value.startswith("/"):
+            command, sep, rest = value.partition(" ")
+            return command + sep + _mask(rest)
+        return _mask(value)
+
+    def callback_data(self, value: str) -> str:
+        m = _CALLBACK_ID.match(value)
+        if m is None:
+            return value
+        return m.group(1) + str(self.anon_id(int(m.group(2)))) + value[m.end():]
+
+    def _field(self, key, value):
+        if isinstance(value, (dict, list)):
+            return self.walk(value)
+        if key in _ID_KEYS:
+            if isinstance(value, int) and not isinstance(value, bool):
+                return self.anon_id(value)
+            return self.token(str(value))
+        if not isinstance(value, str):
+            return 0.0 if key in _GEO_KEYS else value
+        if key in _TEXT_KEYS:
+            return self.text(value)
+        if key in ("data", "callback_data"):
+            # data нажатой кнопки и callback_data кнопок клавиатуры в message.reply_markup
+            return self.callback_data(value)
+        if key in _FILE_KEYS:
+            return self.token(value)
+        if key in _PII_KEYS:
+            return _mask(value)
+        return value
+
+    def walk(self, obj):
+        if isinstance(obj, dict):
+            return {k: self._field(k, v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self.walk(v) for v in obj]
+        return obj
+
+
+class UpdateRecorder:
+    """Очередь апдейтов + поток, который обезличивает их и дописывает пачками в CAPTURE_DIR"""
+
+    def __init__(self, anonymizer: Anonymizer, directory: str = None, max_bytes: int = None,
+                 queue_size: int = None, flush_interval: float = None, batch_size: int = 1000):
+        self.anonymizer = anonymizer
+        self.directory = directory or CAPTURE_DIR
+        self.max_bytes = max_bytes or CAPTURE_MAX_BYTES
+        self.flush_interval = flush_interval or CAPTURE_FLUSH_INTERVAL
+        self.batch_size = batch_size
+        self._q = queue.Queue(maxsize=queue_size or CAPTURE_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._counters = {"recorded": 0, "written": 0, "dropped": 0, "write_errors": 0, "files": 0}
+        self._path = None
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="update-capture", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def record(self, update: dict, arrived: float = None):
+        """Поставить апдейт в очередь записи; не блокирует и не копирует апдейт"""
+        if self._closed:
+            return
+        try:
+            self._q.put_nowait((arrived or time.time(), update))
+            self._count("recorded")
+        except queue.Full:
+            self._count("dropped")
+
+    @property
+    def path(self):
+        return self._path
+
+    def _target(self) -> str:
+        """Текущий файл; новый — при первом вызове и после превышения max_bytes"""
+        if self._path is not None:
+            try:
+                if os.path.getsize(self._path) < self.max_bytes:
+                    return self._path
+            except OSError:
+                pass
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.directory, f"updates-{stamp}-{os.getpid()}")
+        path, n = base + ".jsonl.gz", 1
+        while os.path.exists(path):
+            path, n = f"{base}-{n}.jsonl.gz", n + 1
+        self._path = path
+        self._count("files")
+        header = {"capture": FORMAT_VERSION, "started": round(time.time(), 3), "pid": os.getpid(),
+                  "anon_admin_id": ANON_ADMIN_ID}
+        self._append([json.dumps(header) + "\n"])
+        return path
+
+    def _append(self, lines: list):
+        data = gzip.compress("".join(lines).encode("utf-8"), compresslevel=6)
+        with open(self._path, "ab") as f:
+            f.write(data)
+
+    def _write(self, items: list):
+        lines = []
+        for arrived, update in items:
+            try:
+                anon = self.anonymizer.walk(update)
+                lines.append(json.dumps({"ts": round(arrived, 3), "u": anon}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            except Exception:
+                self._count("write_errors")
+        if not lines:
+            return
+        try:
+            self._target()
+            self._append(lines)
+            self._count("written", len(lines))
+        except Exception as e:
+            self._count("write_errors")
+            print("Ошибка записи апдейтов:", e)
+
+    def _loop(self):
+        pending = []
+        deadline = None
+        while not self._closed:
+            timeout = self.flush_interval if not pending else max(0.0, deadline - time.monotonic())
+            try:
+                pending.append(self._q.get(timeout=timeout))
+                if len(pending) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            if pending and (len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(pending)
+                pending = []
+        if pending:
+            self._write(pending)
+
+    def close(self):
+        """Дописать очередь (вызывается и из atexit)"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 1)
+        rest = []
+        while not self._q.empty():
+            rest.append(self._q.get_nowait())
+        if rest:
+            self._write(rest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            res = dict(self._counters)
+        res["queued"] = self._q.qsize()
+        res["path"] = self._path
+        return res
+
+
+def read_capture(path: str):
+    """(ts, update) из файла записи по порядку; оборванный хвост (падение процесса) пропускается"""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(rec, dict) and "u" in rec:
+                    yield rec["ts"], rec["u"]
+    except (EOFError, OSError, zlib.error):
+        return
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+JSON-кодек бота: разбор входящих апдейтов и кодирование исходящих тел Bot API.
+  - бэкенд — orjson, если установлен (pip install orjson), иначе стандартный
+    json (JSON_BACKEND=auto|orjson|json);
+  - loads() принимает bytes как есть: тело webhook не декодируется в str;
+  - encode_body() кодирует тело запроса к Bot API за один проход: вложенные
+    reply_markup / media идут объектами, а не строкой JSON внутри формы,
+    готовый JSON (RawJSON, keyboards.EncodedMarkup) вклеивается без повторного
+    кодирования;
+  - decode_update(raw, lazy=True) со стандартным json возвращает LazyUpdate:
+    update_id и тип апдейта читаются из начала тела, остальное разбирается
+    при первом обращении к содержимому (в режиме ack-first — уже в потоке
+    воркера). С orjson полный разбор дешевле чтения конверта, и апдейт
+    разбирается сразу (LAZY_UPDATES=auto|1|0).
+"""
+import os
+import re
+import json
+import threading
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").strip().lower()
+
+_orjson = None
+if JSON_BACKEND in ("auto", "orjson"):
+    try:
+        import orjson as _orjson
+    except ImportError:
+        if JSON_BACKEND == "orjson":
+            print("[WARN] JSON_BACKEND=orjson, but orjson is not installed; using json")
+
+BACKEND = "orjson" if _orjson is not None else "json"
+
+# auto — ленивый разбор только со стандартным json: orjson разбирает апдейт целиком
+# быстрее, чем регулярка читает конверт (python -m bench codec); 1 — всегда, 0 — никогда
+_LAZY = os.getenv("LAZY_UPDATES", "auto").strip().lower()
+LAZY_UPDATES = _LAZY == "1" or (_LAZY == "auto" and BACKEND == "json")
+
+if _orjson is not None:
+    loads = _orjson.loads
+
+    def dumps_bytes(obj) -> bytes:
+        if isinstance(obj, LazyUpdate):
+            # orjson читает dict напрямую, мимо переопределённых методов
+            obj.load()
+        return _orjson.dumps(obj)
+
+    def dumps(obj) -> str:
+        """Компактный JSON без \\u-экранирования (как json.dumps(ensure_ascii=False, separators=(',', ':')))"""
+        return dumps_bytes(obj).decode("utf-8")
+else:
+    _json_loads = json.loads
+
+    def loads(data):
+        """bytes | str -> объект; json.loads(bytes) сам угадывает кодировку — медленнее decode('utf-8')"""
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode("utf-8")
+        return _json_loads(data)
+
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj) -> str:
+        """Компактный JSON без \\u-экранирования (как json.dumps(ensure_ascii=False, separators=(',', ':')))"""
+        if isinstance(obj, LazyUpdate):
+            obj.load()
+        return _encoder.encode(obj)
+
+    def dumps_bytes(obj) -> bytes:
+        return dumps(obj).encode("utf-8")
+
+
+class RawJSON(str):
+    """Уже готовый JSON: в encode_body() вклеивается как значение поля без кодирования"""
+    __slots__ = ()
+
+
+def encode_body(payload: dict) -> bytes:
+    """Тело POST application/json для Bot API; поля со значением None пропускаются (как в форме requests)"""
+    plain = {}
+    raw = []
+    for key, value in payload.items():
+        if isinstance(value, RawJSON):
+            raw.append(dumps(str(key)) + ":" + value)
+        elif value is not None:
+            plain[key] = value
+    body = dumps_bytes(plain)
+    if not raw:
+        return body
+    # Готовые фрагменты дописываются перед закрывающей скобкой
+    tail = ",".join(raw).encode("utf-8")
+    return body[:-1] + (b"," if len(body) > 2 else b"") + tail + b"}"
+
+
+# Telegram присылает update_id первым полем и не больше одного поля с содержимым:
+# {"update_id":1,\n"message":{...}}
+_ENVELOPE = re.compile(rb'\s*\{\s*"update_id"\s*:\s*(\d+)\s*,\s*"([a-z_]+)"\s*:\s*\{')
+# Первый объект "chat" в сообщении — message.chat (from идёт раньше, но без chat; sender_chat
+# не совпадает), первый "from" в callback_query — нажавший кнопку
+_PEEK_ID = {
+    kind: re.compile(rb'"chat"\s*:\s*\{\s*"id"\s*:\s*(-?\d+)')
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post")
+}
+_PEEK_ID["callback_query"] = re.compile(rb'"from"\s*:\s*\{\s*"id"\s*:\s*(-?\d+)')
+# data — последнее поле callback_query (после message); начало строки до первой кавычки
+# или escape-последовательности, не длиннее 64 байт (лимит callback_data)
+_PEEK_CALLBACK_DATA = re.compile(rb'"data"\s*:\s*"([^"\\]{0,64})')
+
+
+class LazyUpdate(dict):
+    """
+    Апдейт, разобранный только до update_id и типа (kind).
+    Проверка 'message' in update и update.get('update_id') не трогают тело;
+    первое обращение к содержимому разбирает его целиком. Битое тело даёт
+    пустой апдейт (только update_id) и текст ошибки в error.
+    """
+
+    __slots__ = ("_raw", "_lock", "kind", "error")
+
+    def __init__(self, raw: bytes, update_id: int, kind: str):
+        dict.__init__(self, update_id=update_id)
+        self._raw = raw
+        self._lock = threading.Lock()
+        self.kind = kind
+        self.error = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._raw is None
+
+    def peek_chat_id(self):
+        """chat_id (для callback_query — id пользователя) поиском по телу без разбора; None — не найден"""
+        raw = self._raw
+        pattern = _PEEK_ID.get(self.kind)
+        if raw is None or pattern is None:
+            return None
+        m = pattern.search(raw)
+        return int(m.group(1)) if m is not None else None
+
+    def peek_callback_data(self):
+        """Начало callback_query.data без разбора тела (для меток метрик); None — не найдено"""
+        raw = self._raw
+        if raw is None or self.kind != "callback_query":
+            return None
+        found = None
+        for found in _PEEK_CALLBACK_DATA.finditer(raw):
+            pass
+        return found.group(1).decode("utf-8", "replace") if found is not None else None
+
+    def load(self) -> bool:
+        """Разобрать тело (один раз); False — тело битое"""
+        if self._raw is not None:
+            # Обработчик и запись capture могут обратиться к апдейту одновременно: второй
+            # поток ждёт первый разбор, иначе dict.update заменил бы вложенные dict,
+            # на которые обработчик уже держит ссылки
+            with self._lock:
+                raw = self._raw
+                if raw is not None:
+                    try:
+                        payload = loads(raw)
+                        if not isinstance(payload, dict) or payload.get("update_id") != dict.__getitem__(self, "update_id"):
+                            raise ValueError("update envelope mismatch")
+                        dict.update(self, payload)
+                    except ValueError as e:
+                        self.error = str(e)
+                    self._raw = None
+        return self.error is None
+
+    def __getitem__(self, key):
+        if key == self.kind and self._raw is not None:
+            self.load()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == self.kind and self._raw is not None:
+            self.load()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        if self._raw is not None:
+            return key == "update_id" or key == self.kind
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return dict.__len__(self)
+
+    def keys(self):
+        self.load()
+        return dict.keys(self)
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
+
+    def __setitem__(self, key, value):
+        self.load()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.load()
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self.load()
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self.load()
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self.load()
+        dict.update(self, *args, **kwargs)
+
+    def __eq__(self, other):
+        self.load()
+        if isinstance(other, LazyUpdate):
+            other.load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def copy(self) -> dict:
+        return dict(self.items())
+
+    def __reduce__(self):
+        # pickle / copy.deepcopy получают обычный dict
+        return (dict, (dict(self.items()),))
+
+    def __repr__(self):
+        if self._raw is not None:
+            return f"LazyUpdate(update_id={dict.__getitem__(self, 'update_id')}, kind={self.kind!r}, {len(self._raw)} bytes)"
+        return dict.__repr__(self)
+
+
+def lazy_update(raw):
+    """LazyUpdate по конверту тела (bytes) независимо от LAZY_UPDATES; None — конверт не распознан"""
+    if isinstance(raw, (bytes, bytearray)):
+        m = _ENVELOPE.match(raw)
+        if m is not None and raw.rstrip().endswith(b"}"):
+            return LazyUpdate(bytes(raw), int(m.group(1)), m.group(2).decode("ascii"))
+    return None
+
+
+def decode_update(raw, lazy: bool = True):
+    """Тело webhook (bytes или str) -> LazyUpdate (lazy и LAZY_UPDATES) или результат loads(); ValueError — не JSON"""
+    if lazy and LAZY_UPDATES:
+        update = lazy_update(raw)
+        if update is not None:
+            return update
+    return loads(raw)
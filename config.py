@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Общие помощники модулей бота: настройки из переменных окружения и журнал по
+умолчанию для компонентов, которым не передали log (bot передаёт MainProtokol).
+"""
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """Целое из окружения; нет переменной или не число — default"""
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Число из окружения; нет переменной или не число — default"""
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def print_log(msg, ts='Запис'):
+    """Журнал по умолчанию: та же сигнатура, что у bot.MainProtokol"""
+    print(f"[{ts}] {msg}")
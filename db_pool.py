@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Настройки пула соединений БД и метрики.
+  - pool_kwargs(url) — аргументы create_engine из переменных окружения
+    (размер, overflow, timeout, recycle, pre-ping; для SQLite — свой класс пула);
+  - TimedQueuePool — QueuePool, который замеряет ожидание соединения;
+  - instrument(engine) — лог медленных SQL-запросов;
+  - timed(name) — замер операции (save_event, get_stats) с логом медленных;
+  - db_stats() — снимок всех счётчиков.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from metrics import DB_OPERATION_DURATION
+from tracing import span
+from config import env_int, print_log
+
+
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = env_int("DB_POOL_TIMEOUT", 30)
+# Переподключаться раньше, чем сервер/прокси закроет простаивающее соединение
+DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").strip() == "1"
+DB_SLOW_QUERY_MS = env_int("DB_SLOW_QUERY_MS", 200)
+
+
+class _Counter:
+    """Число, сумма и максимум длительностей"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+
+    def observe(self, seconds: float, slow: bool = False):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if slow:
+            self.slow += 1
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "seconds_total": self.total, "seconds_max": self.max, "slow": self.slow}
+
+
+_lock = threading.Lock()
+_checkout = _Counter()
+_pool_counters = {"checkout_timeouts": 0, "overflow_peak": 0}
+_queries = _Counter()
+_operations = {}
+_pools = []
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool с замером ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            with _lock:
+                _pool_counters["checkout_timeouts"] += 1
+            raise
+        wait = time.perf_counter() - started
+        overflow = max(self.overflow(), 0)
+        with _lock:
+            _checkout.observe(wait)
+            if overflow > _pool_counters["overflow_peak"]:
+                _pool_counters["overflow_peak"] = overflow
+        return conn
+
+
+def pool_kwargs(url: str) -> dict:
+    """Аргументы create_engine для пула по URL и переменным DB_POOL_*"""
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # Одна база в памяти — одно соединение на всех
+            return {"poolclass": StaticPool}
+        # Файловая SQLite: держим открытые соединения (PRAGMA выполняются один раз
+        # на соединение); пишет всё равно один — размер пула небольшой
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        }
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def instrument(engine, log=None, slow_ms: int = None):
+    """Замер всех SQL-запросов движка; медленные пишутся в лог"""
+    log = log or print_log
+    threshold = (DB_SLOW_QUERY_MS if slow_ms is None else slow_ms) / 1000.0
+    _pools.append(engine.pool)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        # Одно время начала, а не стек: после упавшего запроса (after_cursor_execute не
+        # вызывается) следующий просто перезапишет его
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        slow = threshold > 0 and elapsed >= threshold
+        with _lock:
+            _queries.observe(elapsed, slow)
+        if slow:
+            sql = " ".join(statement.split())
+            log(f"slow query {elapsed * 1000:.0f} ms: {sql[:300]}", 'WARN')
+
+    return engine
+
+
+@contextmanager
+def timed(name: str, log=None, slow_ms: int = None):
+    """with timed("save_event"): ... — счётчик операции и лог, если дольше порога"""
+    threshold = (DB_SLOW_QUERY_MS if slow_ms is None else slow_ms) / 1000.0
+    started = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        slow = threshold > 0 and elapsed >= threshold
+        with _lock:
+            _operations.setdefault(name, _Counter()).observe(elapsed, slow)
+        DB_OPERATION_DURATION.observe(elapsed, op=name)
+        if slow and log:
+            log(f"slow {name}: {elapsed * 1000:.0f} ms", 'WARN')
+
+
+def db_stats() -> dict:
+    """Снимок: состояние пулов, ожидание соединений, запросы и операции"""
+    pools = []
+    for pool in list(_pools):
+        info = {"class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            info.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+            })
+        pools.append(info)
+    with _lock:
+        return {
+            "pools": pools,
+            "checkout": _checkout.snapshot(),
+            **_pool_counters,
+            "queries": _queries.snapshot(),
+            "operations": {name: c.snapshot() for name, c in _operations.items()},
+        }
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Отложенная запись событий (write-behind) с групповым коммитом.
+save_event() кладёт строку в буфер; фоновый поток сбрасывает буфер одной
+транзакцией, когда набралось batch_size строк или самая старая ждёт дольше
+flush_interval. На SQLite это один fsync на пачку вместо одного на событие.
+При выходе процесса (atexit) остаток сбрасывается синхронно.
+
+Цена: статистика видит событие с задержкой до flush_interval, а при
+аварийном завершении (SIGKILL) теряется не сброшенный хвост буфера.
+"""
+import time
+import atexit
+import threading
+
+from config import env_int, env_float, print_log
+
+
+EVENT_BATCH_SIZE = env_int("EVENT_BATCH_SIZE", 200)
+EVENT_FLUSH_INTERVAL = env_float("EVENT_FLUSH_INTERVAL", 1.0)
+EVENT_MAX_PENDING = env_int("EVENT_MAX_PENDING", 50000)
+
+
+class BufferedEventWriter:
+    """Буфер строк + поток, вызывающий flush_fn(rows) пачками"""
+
+    def __init__(self, flush_fn, batch_size: int = None, flush_interval: float = None,
+                 max_pending: int = None, log=None):
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size or EVENT_BATCH_SIZE
+        self.flush_interval = flush_interval or EVENT_FLUSH_INTERVAL
+        self.max_pending = max_pending or EVENT_MAX_PENDING
+        self.log = log or print_log
+        self._cond = threading.Condition()
+        # Пачки сбрасываются строго по очереди, чтобы не перепутать порядок
+        self._flush_lock = threading.Lock()
+        self._buf = []
+        self._oldest = None
+        self._closed = False
+        self._thread = None
+        self._counters = {"added": 0, "flushed": 0, "batches": 0, "errors": 0, "dropped": 0,
+                          "flush_seconds": 0.0}
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._loop, name="event-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def add(self, row):
+        with self._cond:
+            if not self._closed:
+                if not self._buf:
+                    self._oldest = time.monotonic()
+                self._buf.append(row)
+                self._counters["added"] += 1
+                if len(self._buf) >= self.batch_size:
+                    self._cond.notify()
+                return
+        # После close() пишем сразу — событие не должно пропасть
+        self._write([row])
+
+    def _take(self) -> list:
+        batch, self._buf = self._buf, []
+        self._oldest = None
+        return batch
+
+    def _write(self, batch) -> bool:
+        started = time.perf_counter()
+        try:
+            self.flush_fn(batch)
+        except Exception as e:
+            self.log(f"event writer flush failed ({len(batch)} rows): {str(e)}", 'ERROR')
+            with self._cond:
+                self._counters["errors"] += 1
+            return False
+        with self._cond:
+            self._counters["flushed"] += len(batch)
+            self._counters["batches"] += 1
+            self._counters["flush_seconds"] += time.perf_counter() - started
+        return True
+
+    def _requeue(self, batch):
+        """Вернуть не записанную пачку в начало буфера (с ограничением объёма)"""
+        with self._cond:
+            self._buf = batch + self._buf
+            overflow = len(self._buf) - self.max_pending
+            if overflow > 0:
+                del self._buf[:overflow]
+                self._counters["dropped"] += overflow
+                self.log(f"event writer buffer overflow: {overflow} oldest rows dropped", 'WARN')
+            if self._buf and self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def flush(self) -> int:
+        """Сбросить всё накопленное; возвращает число записанных строк"""
+        with self._flush_lock:
+            with self._cond:
+                batch = self._take()
+            if not batch:
+                return 0
+            if self._write(batch):
+                return len(batch)
+            self._requeue(batch)
+            return 0
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._buf) >= self.batch_size:
+                        break
+                    if self._buf:
+                        left = self._oldest + self.flush_interval - time.monotonic()
+                        if left <= 0:
+                            break
+                        self._cond.wait(left)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            if not self.flush() and self.pending():
+                # БД недоступна — не крутимся в цикле, ждём интервал
+                time.sleep(self.flush_interval)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._buf)
+
+    def close(self, timeout: float = 10.0):
+        """Остановить поток и синхронно сбросить остаток (вызывается и из atexit)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            if not self.flush():
+                time.sleep(0.2)
+        left = self.pending()
+        if left:
+            self.log(f"event writer closed with {left} unsaved rows", 'ERROR')
+
+    def stats(self) -> dict:
+        with self._cond:
+            res = dict(self._counters)
+            res["pending"] = len(self._buf)
+        res.update({"batch_size": self.batch_size, "flush_interval": self.flush_interval})
+        return res
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Скомпилированные таблицы переводов.
+compile_translations() один раз при старте превращает словарь TRANSLATIONS в
+неизменяемые таблицы по языкам:
+  - недостающий в языке ключ получает текст языка по умолчанию;
+  - поля шаблонов ({name}, {count}) разбираются заранее — текст без полей
+    отдаётся как есть, без str.format;
+  - расхождения (нет ключа, разные поля в языках, битый шаблон) собираются
+    в problems — их пишет в лог вызывающий код.
+rendered() кэширует готовые тексты, которые зависят только от языка
+(меню, «Про нас», рамки сообщений): они строятся один раз на язык.
+"""
+from string import Formatter
+from types import MappingProxyType
+
+_formatter = Formatter()
+
+
+def template_fields(text: str) -> frozenset:
+    """Имена полей шаблона; ValueError — битый шаблон (непарные скобки)"""
+    return frozenset(name for _, name, _, _ in _formatter.parse(text) if name is not None)
+
+
+class CompiledTranslations:
+    """Таблицы {язык: {ключ: текст}} и поля шаблонов по ключам; наружу — только для чтения"""
+
+    __slots__ = ("tables", "fields", "default", "problems", "_tables", "_default_table", "_fields", "_rendered")
+
+    def __init__(self, tables: dict, fields: dict, default: str, problems: list):
+        # Горячий путь читает обычные dict; MappingProxyType — для внешнего кода
+        self._tables = tables
+        self._default_table = tables[default]
+        self._fields = fields
+        self.tables = MappingProxyType({lang: MappingProxyType(tbl) for lang, tbl in tables.items()})
+        self.fields = MappingProxyType(fields)
+        self.default = default
+        self.problems = tuple(problems)
+        self._rendered = {}
+
+    def language(self, language: str = None) -> str:
+        """Поддерживаемый язык или язык по умолчанию"""
+        return language if language in self._tables else self.default
+
+    def text(self, key: str, language: str = None) -> str:
+        """Текст без подстановки полей"""
+        text = (self._tables.get(language) or self._default_table).get(key)
+        return f"[{key}]" if text is None else text
+
+    def format(self, key: str, language: str, kwargs: dict) -> str:
+        text = (self._tables.get(language) or self._default_table).get(key)
+        if text is None:
+            return f"[{key}]"
+        if not kwargs or key not in self._fields:
+            return text
+        try:
+            return text.format(**kwargs)
+        except KeyError as e:
+            return f"[Missing key: {e}]"
+        except (ValueError, IndexError):
+            return text
+
+    def rendered(self, name: str, language: str, build):
+        """build(язык) один раз на (name, язык); результат не должен меняться вызывающим кодом"""
+        key = (name, self.language(language))
+        value = self._rendered.get(key)
+        if value is None:
+            # Гонка двух потоков безвредна: оба построят одно и то же
+            value = self._rendered[key] = build(key[1])
+        return value
+
+
+def compile_translations(translations: dict, default: str) -> CompiledTranslations:
+    base = translations[default]
+    problems = []
+    fields = {}
+    tables = {}
+    for lang, texts in translations.items():
+        table = {}
+        for key, text in texts.items():
+            try:
+                names = template_fields(text)
+            except ValueError as e:
+                # Битый шаблон отдаётся как есть, без format()
+                problems.append(f"i18n {lang}.{key}: bad template ({e})")
+                names = frozenset()
+            if key not in base:
+                problems.append(f"i18n {lang}.{key}: key missing in default language '{default}'")
+            if names:
+                fields[key] = fields.get(key, frozenset()) | names
+            table[key] = text
+        for key in sorted(base.keys() - texts.keys()):
+            problems.append(f"i18n {lang}.{key}: missing, using '{default}' text")
+            table[key] = base[key]
+        tables[lang] = table
+    # Одни и те же поля во всех языках — иначе format() в каком-то языке упадёт
+    for key, names in fields.items():
+        for lang, table in tables.items():
+            if key not in table:
+                continue
+            try:
+                own = template_fields(table[key])
+            except ValueError:
+                continue
+            if own != names:
+                problems.append(f"i18n {lang}.{key}: placeholders {sorted(own)} != {sorted(names)}")
+    return CompiledTranslations(tables, fields, default, problems)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Клавиатуры (reply_markup), сериализованные заранее.
+Статичная клавиатура (меню, «Надіслати/Скасувати») строится и кодируется в
+JSON один раз на язык. Клавиатура с id в callback_data — шаблон: JSON тоже
+кодируется один раз, а при отправке в готовую строку подставляются только
+числа (slot("chat") -> 12345).
+
+Результат — EncodedMarkup (подкласс codec.RawJSON): tg_api вклеивает его в
+тело запроса как есть, без повторного кодирования.
+"""
+import re
+import threading
+
+from codec import RawJSON, dumps
+
+# Метка поля в шаблоне: невидимый разделитель U+2063 вокруг имени (в переводах его нет,
+# codec.dumps оставляет его как есть, без \u-экранирования)
+_MARK = "\u2063"
+_SLOT_RE = re.compile(_MARK + r"(\w+)" + _MARK)
+
+
+class EncodedMarkup(RawJSON):
+    """Готовый JSON reply_markup"""
+    __slots__ = ()
+
+
+def encode_markup(markup: dict) -> EncodedMarkup:
+    return EncodedMarkup(dumps(markup))
+
+
+def slot(name: str) -> str:
+    """Поле шаблона внутри callback_data: f"addstat_{slot('chat')}_{slot('msg')}" """
+    return f"{_MARK}{name}{_MARK}"
+
+
+class MarkupTemplate:
+    """JSON, разрезанный по полям: render(chat=1, msg=2) — только склейка строк"""
+
+    __slots__ = ("chunks", "names")
+
+    def __init__(self, markup: dict):
+        encoded = encode_markup(markup)
+        parts = _SLOT_RE.split(encoded)
+        # split с группой: [текст, поле, текст, поле, ..., текст]
+        self.chunks = tuple(parts[0::2])
+        self.names = tuple(parts[1::2])
+
+    def render(self, **values) -> EncodedMarkup:
+        out = [self.chunks[0]]
+        for name, chunk in zip(self.names, self.chunks[1:]):
+            # Только целые числа (id чатов и сообщений) — в JSON-строку ничего лишнего не попадёт
+            out.append(str(int(values[name])))
+            out.append(chunk)
+        return EncodedMarkup("".join(out))
+
+
+class KeyboardRegistry:
+    """Именованные клавиатуры; build(language) -> dict вызывается один раз на (имя, язык)"""
+
+    def __init__(self, normalize_language=None):
+        self.normalize = normalize_language or (lambda language: language)
+        self._builders = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def static(self, name: str):
+        """Декоратор: клавиатура без параметров"""
+        def deco(build):
+            self._builders[name] = (build, encode_markup)
+            return build
+        return deco
+
+    def template(self, name: str):
+        """Декоратор: клавиатура с полями slot(...) в callback_data"""
+        def deco(build):
+            self._builders[name] = (build, MarkupTemplate)
+            return build
+        return deco
+
+    def _compiled(self, name: str, language: str):
+        key = (name, self.normalize(language))
+        value = self._cache.get(key)
+        if value is None:
+            build, compile_fn = self._builders[name]
+            value = compile_fn(build(key[1]))
+            with self._lock:
+                value = self._cache.setdefault(key, value)
+        return value
+
+    def get(self, name: str, language: str) -> EncodedMarkup:
+        return self._compiled(name, language)
+
+    def render(self, name: str, language: str, **values) -> EncodedMarkup:
+        return self._compiled(name, language).render(**values)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        return {"registered": len(self._builders), "compiled": len(self._cache)}
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Блокировки с замером ожидания.
+StripedLock — таблица из N блокировок, ключ (chat_id) -> полоса: разные чаты
+почти никогда не ждут друг друга. TimedLock — одиночная блокировка (например,
+для состояния администратора). Время ожидания копится в гистограммах по имени.
+"""
+import os
+import time
+import threading
+
+from tracing import add_span
+
+try:
+    LOCK_STRIPES = int(os.getenv("LOCK_STRIPES", "64"))
+except ValueError:
+    LOCK_STRIPES = 64
+
+# Границы корзин гистограммы ожидания, секунды
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class LockStats:
+    """Гистограмма времени ожидания блокировки"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self.count = 0
+        self.contended = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, wait: float, contended: bool):
+        idx = len(WAIT_BUCKETS)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if wait <= bound:
+                idx = i
+                break
+        with self._lock:
+            self.buckets[idx] += 1
+            self.count += 1
+            self.total += wait
+            if contended:
+                self.contended += 1
+            if wait > self.max:
+                self.max = wait
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative = []
+            acc = 0
+            for bound, n in zip(list(WAIT_BUCKETS) + [float("inf")], self.buckets):
+                acc += n
+                cumulative.append((bound, acc))
+            return {
+                "name": self.name,
+                "acquisitions": self.count,
+                "contended": self.contended,
+                "wait_seconds_total": self.total,
+                "wait_seconds_max": self.max,
+                "histogram": cumulative,
+            }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_lock_stats(name: str) -> LockStats:
+    with _registry_lock:
+        st = _registry.get(name)
+        if st is None:
+            st = _registry[name] = LockStats(name)
+        return st
+
+
+def lock_stats() -> dict:
+    """Снимок гистограмм всех именованных блокировок"""
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: st.snapshot() for name, st in items}
+
+
+class TimedLock:
+    """Реентерабельная блокировка (RLock), которая записывает время ожидания при входе"""
+
+    def __init__(self, name: str = "lock", stats: LockStats = None):
+        self._lock = threading.RLock()
+        self.stats = stats or get_lock_stats(name)
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self.stats.observe(0.0, False)
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        ok = self._lock.acquire(True, timeout)
+        if ok:
+            self.stats.observe(time.perf_counter() - started, True)
+            # Ожидание видно в трассе апдейта (без конкуренции спан не пишется)
+            add_span(f"lock:{self.stats.name}", started)
+        return ok
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class StripedLock:
+    """N блокировок; ключ попадает в полосу hash(key) % N"""
+
+    def __init__(self, stripes: int = None, name: str = "chat"):
+        self.stripes = stripes or LOCK_STRIPES
+        self.stats = get_lock_stats(name)
+        self._locks = [TimedLock(stats=self.stats) for _ in range(self.stripes)]
+
+    def for_key(self, key) -> TimedLock:
+        return self._locks[hash(key) % self.stripes]
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Служебные команды бота.
+Использование: python manage.py <команда> [параметры]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+
+def cmd_backfill_rollup(args):
+    import bot
+    rows = bot.backfill_event_rollup()
+    print(f"[INFO] event_daily rebuilt from events: {rows} rows")
+
+
+def cmd_migrate(args):
+    # Схему меняет только эта команда, а не импорт bot.py
+    os.environ["AUTO_MIGRATE"] = "0"
+    import bot
+    engine = bot.get_engine()
+    status = bot.MIGRATIONS.status(engine)
+    print(f"[INFO] schema version: {status['current']}, pending: {len(status['pending'])}")
+    if args.status or not status['pending']:
+        for m in status['pending']:
+            print(f"  {m.version:04d} {m.name}")
+        return 0
+    done = bot.init_db(dry_run=args.dry_run)
+    for m, statements in done:
+        print(f"-- {m.version:04d} {m.name}")
+        if args.dry_run or args.verbose:
+            for stmt in statements:
+                print(f"   {stmt};")
+    print(f"[INFO] {'dry run, rolled back' if args.dry_run else 'applied'}: {len(done)} migration(s)")
+    return 0
+
+
+def cmd_bench_events(args):
+    """Скорость save_event: по транзакции на событие против пачек write-behind"""
+    if not args.database_url:
+        args.database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench_events_"), "events.db")
+    # Замер не должен попасть в рабочую статистику
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["EVENT_WRITE_BEHIND"] = "0"
+    import bot
+    from event_writer import BufferedEventWriter
+    print(f"[INFO] DB: {args.database_url}, events: {args.count}, threads: {args.threads}")
+
+    def run(label):
+        per_thread = args.count // args.threads
+        started = time.perf_counter()
+        threads = [threading.Thread(target=lambda: [bot.save_event(i % len(bot.CATEGORY_KEYS)) for i in range(per_thread)])
+                   for _ in range(args.threads)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        if bot.EVENT_WRITER is not None:
+            bot.EVENT_WRITER.flush()
+        elapsed = time.perf_counter() - started
+        total = per_thread * args.threads
+        print(f"{label:<10} {total:>8} events  {elapsed:8.3f} s  {total / elapsed:10.1f} inserts/s")
+
+    modes = ["direct", "buffered"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        if mode == "buffered":
+            bot.EVENT_WRITER = BufferedEventWriter(bot._insert_events, batch_size=args.batch_size, log=bot.MainProtokol).start()
+        else:
+            bot.EVENT_WRITER = None
+        run(mode)
+        if bot.EVENT_WRITER is not None:
+            print(f"           {bot.EVENT_WRITER.stats()}")
+            bot.EVENT_WRITER.close()
+    return 0
+
+
+def cmd_retention(args):
+    import bot
+    if args.batch_size:
+        bot.EVENTS_RETENTION.batch_size = args.batch_size
+    if args.archive_dir is not None:
+        bot.EVENTS_RETENTION.archive_dir = args.archive_dir
+    report = bot.clear_stats_if_month_passed(days=args.days)
+    if report is None:
+        print("[ERROR] retention failed, see log.txt")
+        return 1
+    print(f"[INFO] {report}")
+    return 0
+
+
+def cmd_partition_events(args):
+    import bot
+    engine = bot.get_engine()
+    if engine.dialect.name != "postgresql":
+        print("[ERROR] monthly partitions are supported on Postgres only")
+        return 1
+    parts = bot.EVENTS_RETENTION.partitions
+    with engine.begin() as conn:
+        if parts.is_partitioned(conn):
+            created = parts.ensure(conn)
+            print(f"[INFO] events already partitioned; created: {created or '-'}")
+            return 0
+        created = parts.convert(
+            conn,
+            "id BIGINT NOT NULL, category_id SMALLINT NOT NULL, dt TIMESTAMPTZ NOT NULL",
+            ("id", "category_id", "dt"),
+            indexes=[("ix_events_dt_category", "dt, category_id")],
+        )
+    print(f"[INFO] events converted to monthly partitions: {', '.join(created)}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="manage.py", description="Служебные команды бота")
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+
+    p = sub.add_parser("backfill-rollup", help="пересобрать суточные счётчики event_daily из таблицы events")
+    p.set_defaults(func=cmd_backfill_rollup)
+
+    p = sub.add_parser("migrate", help="применить ожидающие миграции схемы БД")
+    p.add_argument("--dry-run", action="store_true", help="выполнить шаги и откатить транзакцию, показать SQL")
+    p.add_argument("--status", action="store_true", help="только показать текущую версию и ожидающие шаги")
+    p.add_argument("-v", "--verbose", action="store_true", help="показать SQL применённых шагов")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("retention", help="удалить старые события пачками (и заархивировать)")
+    p.add_argument("--days", type=int, default=None, help="хранить N дней (по умолчанию RETENTION_DAYS)")
+    p.add_argument("--batch-size", type=int, default=None)
+    p.add_argument("--archive-dir", default=None, help="каталог для архива .csv.gz ('' — без архива)")
+    p.set_defaults(func=cmd_retention)
+
+    p = sub.add_parser("partition-events", help="Postgres: разбить events на помесячные секции")
+    p.set_defaults(func=cmd_partition_events)
+
+    p = sub.add_parser("bench-events", help="замерить скорость записи событий (inserts/s)")
+    p.add_argument("--count", type=int, default=2000)
+    p.add_argument("--threads", type=int, default=4)
+    p.add_argument("--mode", choices=["direct", "buffered", "both"], default="both")
+    p.add_argument("--batch-size", type=int, default=None)
+    p.add_argument("--database-url", default=None, help="по умолчанию — временная SQLite")
+    p.set_defaults(func=cmd_bench_events)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
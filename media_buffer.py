@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Ограниченный буфер пачек медиа (pending_media).
+Лимиты на чат (число элементов и байты), вытеснение брошенных пачек по
+простою (TTL) и глобальный LRU-лимит на число открытых пачек — чтобы память
+долго живущего воркера не росла от пользователей, которые не нажали «Надіслати».
+API совместим с StateListMap: append / get / pop / in / keys / len.
+"""
+import json
+import time
+import threading
+
+from state_store import StateMap
+from locks import StripedLock
+from config import env_int, print_log
+
+
+PENDING_MEDIA_MAX_ITEMS = env_int("PENDING_MEDIA_MAX_ITEMS", 50)
+PENDING_MEDIA_MAX_BYTES = env_int("PENDING_MEDIA_MAX_BYTES", 256 * 1024)
+PENDING_MEDIA_IDLE_TTL = env_int("PENDING_MEDIA_IDLE_TTL", 1800)
+PENDING_MEDIA_MAX_SESSIONS = env_int("PENDING_MEDIA_MAX_SESSIONS", 5000)
+PENDING_MEDIA_SWEEP_INTERVAL = env_int("PENDING_MEDIA_SWEEP_INTERVAL", 60)
+
+
+def _message_size(msg) -> int:
+    """Примерный объём сообщения в буфере (байты JSON)"""
+    try:
+        return len(json.dumps(msg, ensure_ascii=False).encode('utf-8'))
+    except Exception:
+        return len(str(msg))
+
+
+class PendingMediaBuffer:
+    """Пачки медиа по chat_id с лимитами и вытеснением"""
+
+    def __init__(self, store, ns="pending_media", max_items: int = None, max_bytes: int = None,
+                 idle_ttl: int = None, max_sessions: int = None, locks: StripedLock = None,
+                 on_evict=None, log=None):
+        self.store = store
+        self.ns = ns
+        self.max_items = max_items or PENDING_MEDIA_MAX_ITEMS
+        self.max_bytes = max_bytes or PENDING_MEDIA_MAX_BYTES
+        self.idle_ttl = idle_ttl or PENDING_MEDIA_IDLE_TTL
+        self.max_sessions = max_sessions or PENDING_MEDIA_MAX_SESSIONS
+        self.on_evict = on_evict
+        self.log = log or print_log
+        # {chat_id: {"items", "bytes", "last_seen"}} — в том же хранилище, что и сами пачки.
+        # Живут дольше пачки, чтобы sweep() успел увидеть простой и вызвать on_evict
+        self._meta = StateMap(store, ns + "_meta", ttl=self.idle_ttl * 2)
+        # Пачка чата меняется под блокировкой его полосы; счётчики — под своей
+        self._locks = locks or StripedLock(name=ns)
+        self._counters_lock = threading.Lock()
+        self._counters = {"appended": 0, "rejected_items": 0, "rejected_bytes": 0,
+                          "evicted_idle": 0, "evicted_lru": 0}
+        self._sweeper = None
+
+    # ---- API как у StateListMap ----
+
+    def append(self, chat_id, msg) -> bool:
+        """Добавить сообщение в пачку; False — превышен лимит чата (сообщение не добавлено)"""
+        size = _message_size(msg)
+        with self._locks.for_key(chat_id):
+            meta = self._meta.get(chat_id)
+            if not meta or time.time() - meta.get("last_seen", 0) >= self.idle_ttl:
+                # Список в хранилище уже истёк (TTL продлевается каждым append): считаем заново
+                meta = {"items": 0, "bytes": 0}
+            if meta["items"] >= self.max_items:
+                self._count("rejected_items")
+                return False
+            if meta["bytes"] + size > self.max_bytes:
+                self._count("rejected_bytes")
+                return False
+            count = self.store.append(self.ns, str(chat_id), msg, ttl=self.idle_ttl)
+            # count == 1 — пачка началась заново (истекла или её забрал другой воркер)
+            is_new = count == 1
+            self._meta[chat_id] = {"items": count, "bytes": size if is_new else meta["bytes"] + size,
+                                   "last_seen": time.time()}
+        self._count("appended")
+        if is_new:
+            self._enforce_session_limit()
+        return True
+
+    def get(self, chat_id, default=None):
+        items = self.store.get_list(self.ns, str(chat_id))
+        return items if items else default
+
+    def pop(self, chat_id, default=None):
+        with self._locks.for_key(chat_id):
+            self._meta.pop(chat_id, None)
+            items = self.store.pop_list(self.ns, str(chat_id))
+        return items if items else default
+
+    def __contains__(self, chat_id):
+        return chat_id in self._meta
+
+    def keys(self):
+        return self._meta.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._meta)
+
+    # ---- вытеснение ----
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def _evict(self, chat_id, reason):
+        with self._locks.for_key(chat_id):
+            self._meta.pop(chat_id, None)
+            dropped = self.store.pop_list(self.ns, str(chat_id))
+        self._count("evicted_" + reason)
+        self.log(f"pending_media evicted ({reason}): chat {chat_id}, {len(dropped)} items", 'WARN')
+        if self.on_evict:
+            try:
+                self.on_evict(chat_id, reason)
+            except Exception as e:
+                self.log(f"on_evict error: {str(e)}", 'ERROR')
+
+    def _enforce_session_limit(self):
+        items = self._meta.items()
+        overflow = len(items) - self.max_sessions
+        if overflow <= 0:
+            return
+        # Самые давно неактивные пачки
+        oldest = sorted(items, key=lambda kv: (kv[1] or {}).get("last_seen", 0))[:overflow]
+        for chat_id, _ in oldest:
+            self._evict(chat_id, "lru")
+
+    def sweep(self) -> int:
+        """Вытеснить пачки без активности дольше idle_ttl; возвращает число вытесненных"""
+        cutoff = time.time() - self.idle_ttl
+        stale = [cid for cid, meta in self._meta.items() if (meta or {}).get("last_seen", 0) < cutoff]
+        for chat_id in stale:
+            self._evict(chat_id, "idle")
+        # Списки без метаданных (например, после падения воркера) истекают по TTL хранилища
+        self.store.purge_expired()
+        return len(stale)
+
+    def start_sweeper(self, interval: int = None):
+        if self._sweeper is not None:
+            return
+        interval = interval or PENDING_MEDIA_SWEEP_INTERVAL
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    self.log(f"pending_media sweep error: {str(e)}", 'ERROR')
+
+        self._sweeper = threading.Thread(target=loop, name="pending-media-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stats(self) -> dict:
+        metas = [m or {} for _, m in self._meta.items()]
+        with self._counters_lock:
+            res = dict(self._counters)
+        res.update({
+            "sessions": len(metas),
+            "items": sum(m.get("items", 0) for m in metas),
+            "bytes": sum(m.get("bytes", 0) for m in metas),
+            "max_items_per_chat": self.max_items,
+            "max_bytes_per_chat": self.max_bytes,
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+        })
+        return res
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики в текстовом формате Prometheus (без внешних зависимостей).
+Counter / Gauge / Histogram с метками регистрируются в REGISTRY; значения,
+которые дешевле считать в момент запроса (размеры очередей, состояние пула),
+добавляются через REGISTRY.register_callback(fn). render() — тело /metrics.
+
+Значения живут в памяти процесса: при нескольких воркерах gunicorn каждый
+отдаёт свои числа.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Имя счётчика — с суффиксом _total"""
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, dict(zip(self.labelnames, key)), v
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, dict(zip(self.labelnames, key)), v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(e[0]), e[1], e[2])) for k, e in self._values.items()]
+        for key, (counts, count, total) in items:
+            labels = dict(zip(self.labelnames, key))
+            acc = 0
+            for bound, n in zip(self.buckets, counts):
+                acc += n
+                yield self.name + "_bucket", {**labels, "le": _fmt_value(float(bound))}, acc
+            yield self.name + "_bucket", {**labels, "le": "+Inf"}, count
+            yield self.name + "_count", labels, count
+            yield self.name + "_sum", labels, total
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._callbacks = []
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def register_callback(self, fn):
+        """fn() -> [(имя, тип, help, [(метки, значение) | (имя_ряда, метки, значение), ...]), ...];
+        вызывается при каждом render()"""
+        with self._lock:
+            self._callbacks.append(fn)
+        return fn
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            callbacks = list(self._callbacks)
+        lines = []
+        for m in metrics:
+            lines.extend(m.header())
+            for name, labels, value in m.samples():
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+        for fn in callbacks:
+            try:
+                families = fn() or []
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', 'callback')} failed: {_escape(e)}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for sample in samples:
+                    # Ряды гистограммы (_bucket/_count/_sum) передаются с собственным именем
+                    sample_name, labels, value = sample if len(sample) == 3 else (name, *sample)
+                    lines.append(f"{sample_name}{_fmt_labels(labels)} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---- общие метрики модулей ----
+
+BOT_API_REQUESTS = REGISTRY.counter("bot_api_requests_total", "Bot API calls by method and HTTP status", ("method", "status"))
+BOT_API_DURATION = REGISTRY.histogram("bot_api_request_duration_seconds", "Bot API call latency", ("method",))
+DB_OPERATION_DURATION = REGISTRY.histogram("bot_db_operation_duration_seconds", "DB operation latency", ("op",))
+
+
+def observe_api_call(method: str, started: float, status):
+    """Учёт одного вызова Bot API (status — HTTP-код или 'error')"""
+    BOT_API_DURATION.observe(time.perf_counter() - started, method=method)
+    BOT_API_REQUESTS.inc(method=method, status=status)
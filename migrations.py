@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Версионные миграции схемы БД.
+Шаги (Migration) пронумерованы; применённые записываются в schema_version.
+Все ожидающие шаги выполняются в одной транзакции под блокировкой строки
+schema_lock, поэтому несколько воркеров, стартующих одновременно, не
+применят один шаг дважды. Шаг получает соединение и имя диалекта и сам
+выбирает DDL для SQLite / Postgres.
+
+dry_run=True выполняет шаги и откатывает транзакцию — так видно реальный SQL
+и ошибки, а схема не меняется.
+"""
+import datetime
+import threading
+
+from sqlalchemy import event, text
+
+from config import print_log
+
+BOOTSTRAP_SQL = (
+    "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS schema_lock (id INTEGER PRIMARY KEY, locked_at TEXT)",
+)
+
+
+class Migration:
+    """Шаг миграции: up(conn, dialect) выполняет изменения в переданной транзакции"""
+
+    def __init__(self, version: int, name: str, up):
+        self.version = version
+        self.name = name
+        self.up = up
+
+    def __repr__(self):
+        return f"<Migration {self.version:04d} {self.name}>"
+
+
+class MigrationRunner:
+    def __init__(self, migrations, log=None):
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        versions = [m.version for m in self.migrations]
+        if len(set(versions)) != len(versions):
+            raise ValueError(f"Duplicate migration versions: {versions}")
+        self.log = log or print_log
+        # Внутри процесса — без лишних ожиданий на блокировке БД
+        self._lock = threading.Lock()
+
+    def _bootstrap(self, engine):
+        with engine.begin() as conn:
+            for stmt in BOOTSTRAP_SQL:
+                conn.execute(text(stmt))
+            if conn.execute(text("SELECT COUNT(*) FROM schema_lock WHERE id = 1")).scalar() == 0:
+                conn.execute(text("INSERT INTO schema_lock (id, locked_at) VALUES (1, NULL)"))
+
+    @staticmethod
+    def _applied(conn) -> set:
+        return {int(r[0]) for r in conn.execute(text("SELECT version FROM schema_version")).all()}
+
+    def status(self, engine) -> dict:
+        """{'current': последняя применённая версия, 'pending': [Migration, ...]}"""
+        self._bootstrap(engine)
+        with engine.connect() as conn:
+            applied = self._applied(conn)
+        return {
+            "current": max(applied) if applied else 0,
+            "pending": [m for m in self.migrations if m.version not in applied],
+        }
+
+    def run(self, engine, dry_run: bool = False) -> list:
+        """Применить ожидающие шаги; возвращает [(Migration, [SQL, ...]), ...]"""
+        with self._lock:
+            self._bootstrap(engine)
+            dialect = engine.dialect.name
+            done = []
+            conn = engine.connect()
+            trans = conn.begin()
+            try:
+                # Первая запись в транзакции: в Postgres — блокировка строки,
+                # в SQLite — блокировка записи всей БД до COMMIT
+                conn.execute(text("UPDATE schema_lock SET locked_at = :now WHERE id = 1"),
+                             {"now": datetime.datetime.utcnow().isoformat()})
+                # Перечитываем под блокировкой: другой воркер мог успеть всё применить
+                applied = self._applied(conn)
+                pending = [m for m in self.migrations if m.version not in applied]
+                for m in pending:
+                    statements = []
+
+                    def record(c, cursor, statement, parameters, context, executemany, _s=statements):
+                        _s.append(statement.strip())
+
+                    event.listen(conn, "before_cursor_execute", record)
+                    try:
+                        m.up(conn, dialect)
+                    finally:
+                        event.remove(conn, "before_cursor_execute", record)
+                    conn.execute(
+                        text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :at)"),
+                        {"v": m.version, "n": m.name, "at": datetime.datetime.utcnow().isoformat()},
+                    )
+                    done.append((m, statements))
+                    self.log(f"migration {m.version:04d} {m.name} {'checked (dry run)' if dry_run else 'applied'}", 'INFO')
+                if dry_run:
+                    trans.rollback()
+                else:
+                    trans.commit()
+            except Exception:
+                trans.rollback()
+                raise
+            finally:
+                conn.close()
+            return done
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Получение апдейтов через long polling (getUpdates) — для хостов без публичного
+HTTPS и для быстрого разбора накопившейся очереди после простоя.
+Апдейты идут в ту же логику, что и webhook() (bot.dispatch_update).
+
+Запуск: python polling.py
+"""
+import os
+import queue
+import threading
+
+from tg_api import get_client
+from codec import loads
+from config import print_log
+
+try:
+    POLLING_LIMIT = min(max(int(os.getenv("POLLING_LIMIT", "100")), 1), 100)
+except ValueError:
+    POLLING_LIMIT = 100
+try:
+    POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "50"))
+except ValueError:
+    POLLING_TIMEOUT = 50
+# Параллельно тянуть следующую пачку, пока обрабатывается текущая.
+# Telegram считает апдейты подтверждёнными при следующем getUpdates, поэтому
+# при падении процесса может потеряться одна пачка в обработке.
+POLLING_PIPELINE = os.getenv("POLLING_PIPELINE", "1").strip() == "1"
+POLLING_OFFSET_FILE = os.getenv(
+    "POLLING_OFFSET_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "updates_offset.txt"),
+)
+
+
+class FileOffsetStore:
+    """Смещение getUpdates в файле; запись атомарная (tmp + fsync + rename)"""
+
+    def __init__(self, path: str = None):
+        self.path = path or POLLING_OFFSET_FILE
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0) or None
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, offset: int):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class LongPollingRunner:
+    """getUpdates пачками до 100 штук; смещение сохраняется после обработки пачки"""
+
+    def __init__(self, handler, client=None, offset_store=None, limit: int = None,
+                 timeout: int = None, pipeline: bool = None, log=None):
+        self.handler = handler
+        self.client = client or get_client()
+        self.offset_store = offset_store or FileOffsetStore()
+        self.limit = limit or POLLING_LIMIT
+        self.timeout = POLLING_TIMEOUT if timeout is None else timeout
+        self.pipeline = POLLING_PIPELINE if pipeline is None else pipeline
+        self.log = log or print_log
+        self._stop = threading.Event()
+        self._counters = {"batches": 0, "updates": 0, "skipped": 0, "failed": 0, "fetch_errors": 0}
+
+    def stats(self) -> dict:
+        res = dict(self._counters)
+        res["offset"] = self.offset_store.load()
+        return res
+
+    def stop(self):
+        self._stop.set()
+
+    def fetch(self, offset):
+        """Одна пачка апдейтов; при ошибке — пустой список и пауза"""
+        data = {"limit": self.limit, "timeout": self.timeout}
+        if offset:
+            data["offset"] = offset
+        try:
+            r = self.client.call("getUpdates", data=data, timeout=self.timeout + 10)
+            # Пачка до 100 апдейтов: разбор bytes без промежуточного str
+            body = loads(r.content)
+            if r.ok and body.get("ok"):
+                return body.get("result") or []
+            self.log(f"getUpdates failed: {r.status_code} {r.text}", 'WARN')
+            retry = (body.get("parameters") or {}).get("retry_after") or 3
+        except Exception as e:
+            self.log(f"getUpdates error: {str(e)}", 'ERROR')
+            retry = 3
+        self._counters["fetch_errors"] += 1
+        self._stop.wait(retry)
+        return []
+
+    def _hand_over(self, upd) -> bool:
+        # Очередь воркеров переполнена — ждём, а не теряем апдейт
+        while True:
+            try:
+                if self.handler(upd):
+                    return True
+            except Exception as e:
+                # Апдейт, на котором падает обработчик, считается обработанным: иначе после
+                # перезапуска он придёт снова и процесс будет падать на нём по кругу
+                self.log(f"Update {upd.get('update_id')} handler error: {str(e)}", 'ERROR')
+                self._counters["failed"] += 1
+                return True
+            if self._stop.wait(0.2):
+                return False
+
+    def process(self, updates, offset):
+        """Передать пачку в обработчик и зафиксировать смещение"""
+        last = None
+        for upd in updates:
+            uid = upd.get("update_id", 0)
+            if offset and uid < offset:
+                # Уже обработан до перезапуска
+                self._counters["skipped"] += 1
+                continue
+            if not self._hand_over(upd):
+                break
+            last = uid
+            self._counters["updates"] += 1
+        if last is not None:
+            self.offset_store.save(last + 1)
+        self._counters["batches"] += 1
+
+    def run(self):
+        try:
+            # getUpdates не работает при установленном webhook
+            self.client.call("deleteWebhook", data={"drop_pending_updates": False}, timeout=10)
+        except Exception as e:
+            self.log(f"deleteWebhook error: {str(e)}", 'WARN')
+        offset = self.offset_store.load()
+        if not self.pipeline:
+            while not self._stop.is_set():
+                updates = self.fetch(offset)
+                if updates:
+                    self.process(updates, offset)
+                    offset = updates[-1]["update_id"] + 1
+            return
+
+        batches = queue.Queue(maxsize=1)
+
+        def fetcher():
+            next_offset = offset
+            while not self._stop.is_set():
+                updates = self.fetch(next_offset)
+                if updates:
+                    batches.put(updates)
+                    next_offset = updates[-1]["update_id"] + 1
+            batches.put(None)
+
+        th = threading.Thread(target=fetcher, name="polling-fetcher", daemon=True)
+        th.start()
+        committed = offset
+        while True:
+            updates = batches.get()
+            if updates is None:
+                break
+            self.process(updates, committed)
+            committed = updates[-1]["update_id"] + 1
+
+    def start(self) -> threading.Thread:
+        th = threading.Thread(target=self.run, name="long-polling", daemon=True)
+        th.start()
+        return th
+
+
+def main():
+    import bot
+    runner = LongPollingRunner(bot.dispatch_update, client=get_client(bot.TOKEN), log=bot.MainProtokol)
+    print(f"[INFO] Long polling started (limit={runner.limit}, timeout={runner.timeout}s, pipeline={runner.pipeline})")
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+if __name__ == "__main__":
+    main()
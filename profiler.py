@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Сэмплирующий профилировщик для работающего процесса.
+Поток раз в interval снимает стеки всех потоков (sys._current_frames) и
+считает одинаковые стеки. Результат — файл в формате collapsed stacks
+(«f1;f2;f3 N», понимают flamegraph.pl и speedscope) и топ функций по
+собственному времени без потоков, которые ждут на блокировке, очереди или сокете. Накладные расходы есть только пока идёт замер.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+try:
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+except ValueError:
+    PROFILE_INTERVAL_MS = 5.0
+try:
+    PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "120"))
+except ValueError:
+    PROFILE_MAX_SECONDS = 120
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+# Кадры, в которых поток не работает, а ждёт (блокировка, очередь, сокет, select):
+# у пула воркеров, очереди отправки и прочих фоновых потоков это почти всё время
+_WAIT_FRAMES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"), ("thread.py", "_worker"),
+    ("selectors.py", "select"), ("socket.py", "accept"), ("socket.py", "readinto"),
+    ("ssl.py", "read"), ("ssl.py", "recv_into"),
+}
+
+
+def _is_wait(leaf: str) -> bool:
+    """Имя кадра «файл:функция:строка» — ожидание, а не работа"""
+    parts = leaf.rsplit(":", 2)
+    return len(parts) == 3 and (parts[0], parts[1]) in _WAIT_FRAMES
+
+
+def clamp_seconds(seconds: float) -> float:
+    """Длительность замера, которую реально выполнит start(): от 1 до PROFILE_MAX_SECONDS"""
+    return max(1.0, min(float(seconds), PROFILE_MAX_SECONDS))
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    """Один замер за раз; start() возвращает False, если замер уже идёт"""
+
+    def __init__(self, interval_ms: float = None, out_dir: str = None):
+        self.interval = (interval_ms or PROFILE_INTERVAL_MS) / 1000.0
+        self.out_dir = out_dir or PROFILE_DIR
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, on_done=None) -> bool:
+        """Запустить замер на seconds (не больше PROFILE_MAX_SECONDS); on_done(result) по окончании"""
+        with self._lock:
+            if self.running():
+                return False
+            seconds = clamp_seconds(seconds)
+            self._thread = threading.Thread(target=self._run, args=(seconds, on_done),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, seconds, on_done):
+        result = self.sample(seconds)
+        if on_done is not None:
+            on_done(result)
+
+    def sample(self, seconds: float) -> dict:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                chain = []
+                while frame is not None:
+                    chain.append(_frame_name(frame))
+                    frame = frame.f_back
+                chain.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(chain))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return self._dump(stacks, samples, seconds)
+
+    def _dump(self, stacks: Counter, samples: int, seconds: float) -> dict:
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        # Собственное время: последний кадр стека. Стеки ждущих потоков в топ не входят,
+        # их доля от всех снятых стеков — в idle (в файле они остаются)
+        own = Counter()
+        idle = 0
+        for stack, n in stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            if _is_wait(leaf):
+                idle += n
+            else:
+                own[leaf] += n
+        busy = sum(own.values())
+        return {
+            "path": path,
+            "seconds": seconds,
+            "samples": samples,
+            "idle": round(idle * 100.0 / ((busy + idle) or 1), 1),
+            "top": [(name, round(n * 100.0 / (busy or 1), 1)) for name, n in own.most_common(15)],
+        }
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Очистка старых строк (retention) небольшими транзакциями.
+Вместо одного DELETE на всю таблицу строки удаляются диапазонами первичного
+ключа по batch_size с паузой между пачками: блокировки держатся недолго,
+WAL не раздувается, а save_event успевает писать между пачками.
+
+Перед удалением пачку можно дописать в архив (CSV в gzip, файл на запуск).
+На Postgres таблицу можно разбить на помесячные секции
+(PostgresMonthlyPartitions): тогда целые месяцы удаляются DROP TABLE секции,
+а пачками чистится только граничный месяц.
+"""
+import os
+import csv
+import gzip
+import time
+import datetime
+
+from sqlalchemy import text
+
+from config import env_int, env_float, print_log
+
+
+RETENTION_DAYS = env_int("RETENTION_DAYS", 30)
+RETENTION_BATCH = env_int("RETENTION_BATCH", 5000)
+RETENTION_PAUSE = env_float("RETENTION_PAUSE", 0.05)
+# Пусто — без архива
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "").strip()
+
+
+def _month_start(d: datetime.date) -> datetime.date:
+    return d.replace(day=1)
+
+
+def _next_month(d: datetime.date) -> datetime.date:
+    return (d.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+class PostgresMonthlyPartitions:
+    """Секции <table>_pYYYY_MM по диапазону <ts> (месяц UTC) + секция DEFAULT"""
+
+    def __init__(self, table: str = "events", ts: str = "dt"):
+        self.table = table
+        self.ts = ts
+
+    def name_for(self, month: datetime.date) -> str:
+        return f"{self.table}_p{month.year:04d}_{month.month:02d}"
+
+    def is_partitioned(self, conn) -> bool:
+        if conn.dialect.name != "postgresql":
+            return False
+        return bool(conn.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"),
+            {"t": self.table},
+        ).first())
+
+    def partitions(self, conn) -> dict:
+        """{начало месяца: имя секции} для помесячных секций"""
+        rows = conn.execute(
+            text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                 "WHERE i.inhparent = to_regclass(:t)"),
+            {"t": self.table},
+        ).all()
+        prefix = f"{self.table}_p"
+        res = {}
+        for (name,) in rows:
+            if not name.startswith(prefix):
+                continue
+            try:
+                year, month = name[len(prefix):].split("_")
+                res[datetime.date(int(year), int(month), 1)] = name
+            except ValueError:
+                continue
+        return res
+
+    def create(self, conn, month: datetime.date) -> str:
+        name = self.name_for(month)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {self.table} "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_next_month(month).isoformat()} 00:00:00+00')"
+        ))
+        return name
+
+    def ensure(self, conn, months_ahead: int = 2) -> list:
+        """Секции на текущий и months_ahead следующих месяцев; возвращает созданные"""
+        existing = self.partitions(conn)
+        month = _month_start(datetime.datetime.now(datetime.timezone.utc).date())
+        created = []
+        for _ in range(months_ahead + 1):
+            if month not in existing:
+                created.append(self.create(conn, month))
+            month = _next_month(month)
+        return created
+
+    def drop_older_than(self, conn, cutoff: datetime.datetime) -> list:
+        """Удалить секции, целиком лежащие раньше cutoff (мгновенно, без DELETE)"""
+        dropped = []
+        for month, name in sorted(self.partitions(conn).items()):
+            upper = datetime.datetime.combine(_next_month(month), datetime.time(), tzinfo=datetime.timezone.utc)
+            if upper <= cutoff:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+        return dropped
+
+    def convert(self, conn, columns_ddl: str, columns, key: str = "id", indexes=()) -> list:
+        """Перестроить обычную таблицу в секционированную (в транзакции conn).
+        columns_ddl — колонки новой таблицы без PRIMARY KEY; ключ становится (key, ts);
+        indexes — [(имя, колонки), ...] для пересоздания на новой таблице"""
+        old = f"{self.table}_unpartitioned"
+        seq = f"{self.table}_{key}_seq"
+        conn.execute(text(f"ALTER TABLE {self.table} RENAME TO {old}"))
+        for index_name, _ in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+        # Последовательность SERIAL переживает удаление старой таблицы
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS {seq} OWNED BY NONE"))
+        conn.execute(text(
+            f"CREATE TABLE {self.table} ({columns_ddl}, PRIMARY KEY ({key}, {self.ts})) PARTITION BY RANGE ({self.ts})"
+        ))
+        conn.execute(text(f"ALTER TABLE {self.table} ALTER COLUMN {key} SET DEFAULT nextval('{seq}')"))
+        conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {self.table}.{key}"))
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {self.table}_default PARTITION OF {self.table} DEFAULT"))
+        first = conn.execute(text(f"SELECT MIN({self.ts}) FROM {old}")).scalar()
+        month = _month_start((first or datetime.datetime.now(datetime.timezone.utc)).astimezone(datetime.timezone.utc).date())
+        created = []
+        last = _month_start(datetime.datetime.now(datetime.timezone.utc).date())
+        while month <= last:
+            created.append(self.create(conn, month))
+            month = _next_month(month)
+        created.extend(self.ensure(conn))
+        cols = ", ".join(columns)
+        conn.execute(text(f"INSERT INTO {self.table} ({cols}) SELECT {cols} FROM {old}"))
+        conn.execute(text(f"DROP TABLE {old}"))
+        for index_name, index_cols in indexes:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {self.table} ({index_cols})"))
+        return created
+
+
+class RetentionEngine:
+    """Удаление строк старше cutoff пачками по диапазону первичного ключа"""
+
+    def __init__(self, engine_factory, table: str = "events", key: str = "id", ts: str = "dt",
+                 columns=("id", "category_id", "dt"), dt_param=None, batch_size: int = None,
+                 pause: float = None, archive_dir: str = None, partitions: PostgresMonthlyPartitions = None,
+                 log=None):
+        self._engine_factory = engine_factory
+        self.table = table
+        self.key = key
+        self.ts = ts
+        self.columns = tuple(columns)
+        # Перевод datetime в формат колонки ts (например, unix epoch на SQLite)
+        self.dt_param = dt_param or (lambda dt: dt)
+        self.batch_size = batch_size or RETENTION_BATCH
+        self.pause = RETENTION_PAUSE if pause is None else pause
+        self.archive_dir = RETENTION_ARCHIVE_DIR if archive_dir is None else archive_dir
+        self.partitions = partitions or PostgresMonthlyPartitions(table, ts)
+        self.log = log or print_log
+        self.last_report = None
+
+    def _open_archive(self, started: datetime.datetime):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{self.table}-{started.strftime('%Y%m%dT%H%M%S')}.csv.gz")
+        f = gzip.open(path, "at", encoding="utf-8", newline="")
+        writer = csv.writer(f)
+        writer.writerow(self.columns)
+        return path, f, writer
+
+    def run(self, cutoff: datetime.datetime) -> dict:
+        """Удалить строки с ts < cutoff (aware datetime UTC); возвращает отчёт"""
+        engine = self._engine_factory()
+        started = datetime.datetime.now(datetime.timezone.utc)
+        t0 = time.perf_counter()
+        report = {"table": self.table, "cutoff": cutoff.isoformat(), "deleted": 0, "archived": 0,
+                  "batches": 0, "partitions_dropped": [], "partitions_created": [], "archive": None}
+
+        with engine.begin() as conn:
+            partitioned = self.partitions.is_partitioned(conn)
+            if partitioned:
+                report["partitions_created"] = self.partitions.ensure(conn)
+                if not self.archive_dir:
+                    # Без архива старые месяцы удаляются целиком, до пачек
+                    report["partitions_dropped"] = self.partitions.drop_older_than(conn, cutoff)
+            cutoff_param = self.dt_param(cutoff)
+            bounds = conn.execute(
+                text(f"SELECT MIN({self.key}), MAX({self.key}) FROM {self.table} WHERE {self.ts} < :cutoff"),
+                {"cutoff": cutoff_param},
+            ).first()
+        lo, hi = (bounds[0], bounds[1]) if bounds else (None, None)
+
+        archive = None
+        try:
+            if lo is not None:
+                cols = ", ".join(self.columns)
+                where = f"{self.key} >= :lo AND {self.key} < :hi AND {self.ts} < :cutoff"
+                while lo is not None and lo <= hi:
+                    params = {"lo": lo, "hi": lo + self.batch_size, "cutoff": cutoff_param}
+                    with engine.begin() as conn:
+                        if self.archive_dir:
+                            rows = conn.execute(text(f"SELECT {cols} FROM {self.table} WHERE {where} ORDER BY {self.key}"), params).all()
+                            if rows:
+                                if archive is None:
+                                    archive = self._open_archive(started)
+                                    report["archive"] = archive[0]
+                                archive[2].writerows(
+                                    [[v.isoformat() if isinstance(v, datetime.datetime) else v for v in row] for row in rows]
+                                )
+                                # Архив на диске раньше, чем строки удалены из БД
+                                archive[1].flush()
+                                report["archived"] += len(rows)
+                        res = conn.execute(text(f"DELETE FROM {self.table} WHERE {where}"), params)
+                        # Следующая пачка — с ближайшего старого ключа, пропуская пустые диапазоны
+                        lo = conn.execute(
+                            text(f"SELECT MIN({self.key}) FROM {self.table} WHERE {self.key} >= :hi AND {self.ts} < :cutoff"),
+                            params,
+                        ).scalar()
+                    report["deleted"] += max(res.rowcount or 0, 0)
+                    report["batches"] += 1
+                    if report["batches"] % 100 == 0:
+                        self.log(f"retention {self.table}: {report['deleted']} rows deleted, "
+                                 f"{report['batches']} batches, up to {self.key} {params['hi']}", 'INFO')
+                    if self.pause and lo is not None and lo <= hi:
+                        time.sleep(self.pause)
+            if partitioned and self.archive_dir:
+                # Строки заархивированы и удалены пачками — пустые секции больше не нужны
+                with engine.begin() as conn:
+                    report["partitions_dropped"] = self.partitions.drop_older_than(conn, cutoff)
+        finally:
+            if archive is not None:
+                archive[1].close()
+            report["seconds"] = round(time.perf_counter() - t0, 3)
+            self.last_report = report
+        if report["deleted"] or report["partitions_dropped"]:
+            self.log(f"retention {self.table}: deleted {report['deleted']} rows"
+                     f"{' (archived ' + str(report['archived']) + ')' if self.archive_dir else ''}"
+                     f" in {report['batches']} batches, {report['seconds']} s; "
+                     f"partitions dropped: {report['partitions_dropped'] or '-'}", 'INFO')
+        return report
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь исходящих вызовов Bot API с учётом лимитов Telegram.
+Обработчики ставят вызов в очередь и сразу получают Future; отправкой
+занимаются фоновые потоки. Глобальный token bucket (~30 msg/s) и по одному
+bucket на чат (~1 msg/s), порядок сообщений внутри чата сохраняется,
+ответ 429 ставит чат на паузу на retry_after секунд.
+"""
+import os
+import atexit
+import time
+import heapq
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from config import env_float, print_log
+
+
+SEND_QUEUE_WORKERS = int(env_float("SEND_QUEUE_WORKERS", 4))
+SEND_QUEUE_GLOBAL_RATE = env_float("SEND_QUEUE_GLOBAL_RATE", 30)
+SEND_QUEUE_CHAT_RATE = env_float("SEND_QUEUE_CHAT_RATE", 1)
+SEND_QUEUE_CHAT_BURST = env_float("SEND_QUEUE_CHAT_BURST", 3)
+SEND_QUEUE_MAX_ATTEMPTS = int(env_float("SEND_QUEUE_MAX_ATTEMPTS", 5))
+SEND_QUEUE_MAX_DEPTH = int(env_float("SEND_QUEUE_MAX_DEPTH", 10000))
+
+
+class TokenBucket:
+    """Классический token bucket; время — time.monotonic()"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def delay(self, now) -> float:
+        """Сколько ждать до появления целого токена (0 — можно сейчас)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def reserve(self, now) -> float:
+        """Забрать токен (допуская долг) и вернуть, сколько нужно подождать"""
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def is_full(self, now) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "tag", "future", "attempts", "enqueued")
+
+    def __init__(self, fn, args, kwargs, tag):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.tag = tag
+        self.future = Future()
+        self.attempts = 0
+        self.enqueued = time.monotonic()
+
+
+class _ChatState:
+    __slots__ = ("jobs", "bucket", "paused_until", "in_flight", "scheduled")
+
+    def __init__(self, rate, burst):
+        self.jobs = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.paused_until = 0.0
+        self.in_flight = False
+        self.scheduled = False
+
+
+def _retry_after(resp) -> float:
+    try:
+        params = resp.json().get("parameters") or {}
+        if "retry_after" in params:
+            return float(params["retry_after"])
+    except Exception:
+        pass
+    try:
+        return float(resp.headers.get("Retry-After", 1))
+    except Exception:
+        return 1.0
+
+
+class OutboundQueue:
+    """Диспетчер исходящих вызовов: submit() не блокируется на сети"""
+
+    def __init__(self, workers: int = None, global_rate: float = None, chat_rate: float = None,
+                 chat_burst: float = None, max_attempts: int = None, max_depth: int = None, log=None):
+        self.workers = workers or SEND_QUEUE_WORKERS
+        self.chat_rate = chat_rate or SEND_QUEUE_CHAT_RATE
+        self.chat_burst = chat_burst or SEND_QUEUE_CHAT_BURST
+        self.max_attempts = max_attempts or SEND_QUEUE_MAX_ATTEMPTS
+        self.max_depth = max_depth or SEND_QUEUE_MAX_DEPTH
+        self.log = log or print_log
+        global_rate = global_rate or SEND_QUEUE_GLOBAL_RATE
+        self._global = TokenBucket(global_rate, global_rate)
+        self._global_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._chats = {}
+        self._heap = []
+        self._seq = 0
+        self._depth = 0
+        self._threads = []
+        self._stopping = False
+        self._counters = {"submitted": 0, "sent": 0, "failed": 0, "rejected": 0, "retried_429": 0, "retried_error": 0}
+        self._max_wait = 0.0
+
+    # ---- публичный API ----
+
+    def submit(self, chat_id, fn, args=(), kwargs=None, tag='Помилка надсилання') -> Future:
+        """Поставить вызов fn(*args, **kwargs) в очередь чата и сразу вернуть Future"""
+        job = _Job(fn, args, kwargs or {}, tag)
+        with self._cond:
+            if not self._threads:
+                self._start()
+            if self._depth >= self.max_depth:
+                self._counters["rejected"] += 1
+                job.future.set_exception(RuntimeError("send queue is full"))
+                self.log(f"Send queue full, dropped call for chat {chat_id}", 'WARN')
+                return job.future
+            st = self._chats.get(chat_id)
+            if st is None:
+                st = _ChatState(self.chat_rate, self.chat_burst)
+                self._chats[chat_id] = st
+            st.jobs.append(job)
+            self._depth += 1
+            self._counters["submitted"] += 1
+            if self._counters["submitted"] % 1000 == 0:
+                self._prune(time.monotonic())
+            if not st.in_flight:
+                self._schedule(chat_id, st, time.monotonic())
+        return job.future
+
+    def depth(self) -> int:
+        with self._cond:
+            return self._depth
+
+    def stats(self) -> dict:
+        with self._cond:
+            busiest = sorted(((len(st.jobs), cid) for cid, st in self._chats.items() if st.jobs), reverse=True)[:5]
+            res = dict(self._counters)
+            res.update({
+                "depth": self._depth,
+                "chats_pending": sum(1 for st in self._chats.values() if st.jobs),
+                "in_flight": sum(1 for st in self._chats.values() if st.in_flight),
+                "max_wait_seconds": round(self._max_wait, 3),
+                "busiest_chats": [{"chat_id": cid, "depth": n} for n, cid in busiest],
+            })
+        return res
+
+    def stop(self, timeout: float = 10.0):
+        """Дождаться отправки очереди (не дольше timeout) и остановить потоки"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._depth and time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            self._stopping = True
+            self._cond.notify_all()
+        for th in self._threads:
+            th.join(max(deadline - time.monotonic(), 0.1))
+
+    # ---- внутреннее ----
+
+    def _start(self):
+        for i in range(self.workers):
+            th = threading.Thread(target=self._worker, name=f"send-queue-{i}", daemon=True)
+            th.start()
+            self._threads.append(th)
+        # Потоки daemon: без stop() при выходе очередь (ответы админу, алерты) терялась бы
+        atexit.register(self.stop)
+
+    def _prune(self, now):
+        # Вызывается под self._cond: убрать простаивающие чаты с полным bucket
+        idle = [cid for cid, st in self._chats.items()
+                if not st.jobs and not st.in_flight and st.bucket.is_full(now)]
+        for cid in idle:
+            del self._chats[cid]
+
+    def _schedule(self, chat_id, st, eligible):
+        # Вызывается под self._cond
+        if st.scheduled:
+            return
+        st.scheduled = True
+        self._seq += 1
+        heapq.heappush(self._heap, (eligible, self._seq, chat_id))
+        self._cond.notify()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None, None, None
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                eligible, _, chat_id = self._heap[0]
+                now = time.monotonic()
+                if eligible > now:
+                    self._cond.wait(eligible - now)
+                    continue
+                heapq.heappop(self._heap)
+                st = self._chats.get(chat_id)
+                if st is None:
+                    continue
+                st.scheduled = False
+                if not st.jobs or st.in_flight:
+                    continue
+                wait = max(st.bucket.delay(now), st.paused_until - now)
+                if wait > 0:
+                    self._schedule(chat_id, st, now + wait)
+                    continue
+                st.bucket.reserve(now)
+                st.in_flight = True
+                return chat_id, st, st.jobs[0]
+
+    def _worker(self):
+        while True:
+            chat_id, st, job = self._next_job()
+            if job is None:
+                return
+            with self._global_lock:
+                gwait = self._global.reserve(time.monotonic())
+            if gwait > 0:
+                time.sleep(gwait)
+            job.attempts += 1
+            # pause is None — окончательный результат; retry_after=0 — повтор без паузы
+            resp, error, pause = None, None, None
+            try:
+                resp = job.fn(*job.args, **job.kwargs)
+                if resp is not None and resp.status_code == 429 and job.attempts < self.max_attempts:
+                    pause = _retry_after(resp)
+            except Exception as e:
+                error = e
+                if job.attempts < self.max_attempts:
+                    pause = min(2 ** job.attempts, 30)
+            self._finish(chat_id, st, job, resp, error, pause)
+
+    def _finish(self, chat_id, st, job, resp, error, pause):
+        now = time.monotonic()
+        with self._cond:
+            st.in_flight = False
+            if pause is not None:
+                # Повтор: задание остаётся первым в очереди чата, порядок не нарушается
+                st.paused_until = now + pause
+                self._counters["retried_429" if error is None else "retried_error"] += 1
+            else:
+                st.jobs.popleft()
+                self._depth -= 1
+                self._max_wait = max(self._max_wait, now - job.enqueued)
+                if error is None and resp is not None and resp.ok:
+                    self._counters["sent"] += 1
+                else:
+                    self._counters["failed"] += 1
+            if st.jobs:
+                self._schedule(chat_id, st, max(now, st.paused_until))
+            elif st.bucket.is_full(now):
+                del self._chats[chat_id]
+            self._cond.notify_all()
+        if pause is not None:
+            if error is None:
+                self.log(f"429 for chat {chat_id}, retry in {pause}s", 'WARN')
+            return
+        if error is not None:
+            self.log(str(error), job.tag)
+            job.future.set_exception(error)
+            return
+        if resp is not None and not resp.ok:
+            self.log(f"{resp.status_code} {resp.text}", job.tag)
+        job.future.set_result(resp)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_send_queue(log=None) -> OutboundQueue:
+    """Общая очередь на процесс (после fork создаётся заново)"""
+    pid = os.getpid()
+    q = _queues.get(pid)
+    if q is None:
+        with _queues_lock:
+            q = _queues.get(pid)
+            if q is None:
+                q = OutboundQueue(log=log)
+                _queues[pid] = q
+    return q
+
+
+def set_send_queue(q):
+    """Подменить очередь текущего процесса (например, асинхронной реализацией)"""
+    with _queues_lock:
+        _queues[os.getpid()] = q
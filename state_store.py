@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище состояния диалогов (pending_media, pending_mode, языки и т.д.).
+Бэкенды:
+  - MemoryStateStore — в памяти процесса (один воркер);
+  - SqlStateStore — таблицы в той же БД (SQLAlchemy), общее для N воркеров.
+Поверх них — обёртки StateMap / StateSet / StateListMap с привычным API dict/set.
+
+Значения в SQL хранятся как JSON, поэтому изменения объекта, полученного
+через get(), нужно записывать обратно (set/append), а не мутировать на месте.
+"""
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+_MISSING = object()
+
+
+def _has_returning(engine) -> bool:
+    # DELETE ... RETURNING: Postgres и SQLite >= 3.35
+    return engine.dialect.name != "sqlite" or sqlite3.sqlite_version_info >= (3, 35)
+
+
+def _expiry(ttl):
+    return time.time() + ttl if ttl else None
+
+
+class MemoryStateStore:
+    """Словари в памяти процесса под одной блокировкой"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._values = {}
+        self._lists = {}
+
+    def _alive(self, entry, now):
+        return entry is not None and (entry[1] is None or entry[1] > now)
+
+    # ---- скалярные значения ----
+
+    def get(self, ns, key, default=None):
+        with self._lock:
+            entry = self._values.get(ns, {}).get(key)
+            if self._alive(entry, time.time()):
+                return entry[0]
+            return default
+
+    def set(self, ns, key, value, ttl=None):
+        with self._lock:
+            self._values.setdefault(ns, {})[key] = (value, _expiry(ttl))
+
+    def pop(self, ns, key, default=None):
+        with self._lock:
+            entry = self._values.get(ns, {}).pop(key, None)
+            return entry[0] if self._alive(entry, time.time()) else default
+
+    def contains(self, ns, key) -> bool:
+        return self.get(ns, key, _MISSING) is not _MISSING
+
+    def items(self, ns) -> list:
+        now = time.time()
+        with self._lock:
+            return [(k, e[0]) for k, e in self._values.get(ns, {}).items() if self._alive(e, now)]
+
+    def clear(self, ns):
+        with self._lock:
+            self._values.pop(ns, None)
+
+    # ---- списки (атомарные append / pop) ----
+
+    def append(self, ns, key, value, ttl=None) -> int:
+        with self._lock:
+            lists = self._lists.setdefault(ns, OrderedDict())
+            entry = lists.get(key)
+            if not self._alive(entry, time.time()):
+                entry = ([], None)
+            entry[0].append(value)
+            lists[key] = (entry[0], _expiry(ttl))
+            lists.move_to_end(key)
+            return len(entry[0])
+
+    def get_list(self, ns, key) -> list:
+        with self._lock:
+            entry = self._lists.get(ns, {}).get(key)
+            return list(entry[0]) if self._alive(entry, time.time()) else []
+
+    def pop_list(self, ns, key) -> list:
+        with self._lock:
+            entry = self._lists.get(ns, {}).pop(key, None)
+            return entry[0] if self._alive(entry, time.time()) else []
+
+    def list_keys(self, ns) -> list:
+        now = time.time()
+        with self._lock:
+            return [k for k, e in self._lists.get(ns, {}).items() if self._alive(e, now)]
+
+    # ---- обслуживание ----
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for bucket in list(self._values.values()) + list(self._lists.values()):
+                for k in [k for k, e in bucket.items() if not self._alive(e, now)]:
+                    del bucket[k]
+                    removed += 1
+        return removed
+
+
+def schema_ddl(dialect: str) -> list:
+    """DDL таблиц session_state / session_list (идемпотентный)"""
+    if dialect == "sqlite":
+        ddl = [
+            "CREATE TABLE IF NOT EXISTS session_state (ns TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, expires_at REAL, PRIMARY KEY (ns, k))",
+            "CREATE TABLE IF NOT EXISTS session_list (id INTEGER PRIMARY KEY AUTOINCREMENT, ns TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, expires_at REAL)",
+        ]
+    else:
+        ddl = [
+            "CREATE TABLE IF NOT EXISTS session_state (ns TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, expires_at DOUBLE PRECISION, PRIMARY KEY (ns, k))",
+            "CREATE TABLE IF NOT EXISTS session_list (id BIGSERIAL PRIMARY KEY, ns TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, expires_at DOUBLE PRECISION)",
+        ]
+    ddl.append("CREATE INDEX IF NOT EXISTS ix_session_list_key ON session_list (ns, k, id)")
+    return ddl
+
+
+class SqlStateStore:
+    """Состояние в таблицах session_state / session_list общей БД"""
+
+    def __init__(self, engine_factory, manage_schema: bool = True):
+        # engine_factory — get_engine из bot.py (движок создаётся лениво).
+        # manage_schema=False — таблицы создаёт внешний механизм миграций
+        self._engine_factory = engine_factory
+        self._schema_ready = not manage_schema
+
+    @property
+    def engine(self):
+        engine = self._engine_factory()
+        if not self._schema_ready:
+            self.ensure_schema(engine)
+            self._schema_ready = True
+        return engine
+
+    @staticmethod
+    def ensure_schema(engine):
+        with engine.begin() as conn:
+            for stmt in schema_ddl(engine.dialect.name):
+                conn.execute(text(stmt))
+
+    _ALIVE = "(expires_at IS NULL OR expires_at > :now)"
+
+    # ---- скалярные значения ----
+
+    def get(self, ns, key, default=None):
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text(f"SELECT v FROM session_state WHERE ns = :ns AND k = :k AND {self._ALIVE}"),
+                {"ns": ns, "k": str(key), "now": time.time()},
+            ).first()
+        return json.loads(row[0]) if row else default
+
+    def set(self, ns, key, value, ttl=None):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO session_state (ns, k, v, expires_at) VALUES (:ns, :k, :v, :exp) "
+                     "ON CONFLICT (ns, k) DO UPDATE SET v = excluded.v, expires_at = excluded.expires_at"),
+                {"ns": ns, "k": str(key), "v": json.dumps(value, ensure_ascii=False), "exp": _expiry(ttl)},
+            )
+
+    def pop(self, ns, key, default=None):
+        params = {"ns": ns, "k": str(key), "now": time.time()}
+        engine = self.engine
+        with engine.begin() as conn:
+            if _has_returning(engine):
+                row = conn.execute(
+                    text(f"DELETE FROM session_state WHERE ns = :ns AND k = :k RETURNING v, {self._ALIVE}"),
+                    params,
+                ).first()
+            else:
+                row = conn.execute(
+                    text(f"SELECT v, {self._ALIVE} FROM session_state WHERE ns = :ns AND k = :k"), params
+                ).first()
+                conn.execute(text("DELETE FROM session_state WHERE ns = :ns AND k = :k"), params)
+        if row and row[1]:
+            return json.loads(row[0])
+        return default
+
+    def contains(self, ns, key) -> bool:
+        return self.get(ns, key, _MISSING) is not _MISSING
+
+    def items(self, ns) -> list:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT k, v FROM session_state WHERE ns = :ns AND {self._ALIVE}"),
+                {"ns": ns, "now": time.time()},
+            ).all()
+        return [(r[0], json.loads(r[1])) for r in rows]
+
+    def clear(self, ns):
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM session_state WHERE ns = :ns"), {"ns": ns})
+
+    # ---- списки ----
+
+    def append(self, ns, key, value, ttl=None) -> int:
+        params = {"ns": ns, "k": str(key), "v": json.dumps(value, ensure_ascii=False),
+                  "exp": _expiry(ttl), "now": time.time()}
+        with self.engine.begin() as conn:
+            # Просроченный список начинается заново
+            conn.execute(text("DELETE FROM session_list WHERE ns = :ns AND k = :k AND NOT " + self._ALIVE), params)
+            conn.execute(text("INSERT INTO session_list (ns, k, v, expires_at) VALUES (:ns, :k, :v, :exp)"), params)
+            # TTL продлевается для всего списка
+            conn.execute(text("UPDATE session_list SET expires_at = :exp WHERE ns = :ns AND k = :k"), params)
+            count = conn.execute(text("SELECT COUNT(*) FROM session_list WHERE ns = :ns AND k = :k"), params).scalar()
+        return int(count)
+
+    def get_list(self, ns, key) -> list:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT v FROM session_list WHERE ns = :ns AND k = :k AND {self._ALIVE} ORDER BY id"),
+                {"ns": ns, "k": str(key), "now": time.time()},
+            ).all()
+        return [json.loads(r[0]) for r in rows]
+
+    def pop_list(self, ns, key) -> list:
+        """Атомарно забрать весь список: два воркера не получат одну и ту же пачку"""
+        params = {"ns": ns, "k": str(key), "now": time.time()}
+        engine = self.engine
+        with engine.begin() as conn:
+            if _has_returning(engine):
+                rows = conn.execute(
+                    text(f"DELETE FROM session_list WHERE ns = :ns AND k = :k RETURNING id, v, {self._ALIVE}"),
+                    params,
+                ).all()
+            else:
+                # Старый SQLite без RETURNING: запись в SQLite всё равно сериализуется
+                rows = conn.execute(
+                    text(f"SELECT id, v, {self._ALIVE} FROM session_list WHERE ns = :ns AND k = :k"), params
+                ).all()
+                if rows:
+                    params["max_id"] = max(r[0] for r in rows)
+                    conn.execute(text("DELETE FROM session_list WHERE ns = :ns AND k = :k AND id <= :max_id"), params)
+        return [json.loads(r[1]) for r in sorted(rows, key=lambda r: r[0]) if r[2]]
+
+    def list_keys(self, ns) -> list:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT DISTINCT k FROM session_list WHERE ns = :ns AND {self._ALIVE}"),
+                {"ns": ns, "now": time.time()},
+            ).all()
+        return [r[0] for r in rows]
+
+    # ---- обслуживание ----
+
+    def purge_expired(self) -> int:
+        params = {"now": time.time()}
+        with self.engine.begin() as conn:
+            a = conn.execute(text("DELETE FROM session_state WHERE expires_at IS NOT NULL AND expires_at <= :now"), params)
+            b = conn.execute(text("DELETE FROM session_list WHERE expires_at IS NOT NULL AND expires_at <= :now"), params)
+        return (a.rowcount or 0) + (b.rowcount or 0)
+
+
+def create_state_store(backend: str, engine_factory=None, manage_schema: bool = True):
+    """'memory' (по умолчанию) или 'sql'"""
+    if backend == "sql":
+        return SqlStateStore(engine_factory, manage_schema=manage_schema)
+    return MemoryStateStore()
+
+
+# ---- обёртки с API dict / set ----
+
+class StateMap:
+    """dict-подобный доступ к пространству имён хранилища (ключи — chat_id и т.п.)"""
+
+    def __init__(self, store, ns, ttl=None, key_type=int):
+        self.store = store
+        self.ns = ns
+        self.ttl = ttl
+        self.key_type = key_type
+
+    def _key(self, key):
+        # В SQL ключи хранятся строками — приводим к одному виду для обоих бэкендов
+        return str(key)
+
+    def _unkey(self, key):
+        try:
+            return self.key_type(key)
+        except (TypeError, ValueError):
+            return key
+
+    def get(self, key, default=None):
+        return self.store.get(self.ns, self._key(key), default)
+
+    def __getitem__(self, key):
+        value = self.store.get(self.ns, self._key(key), _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.ns, self._key(key), value, ttl=self.ttl)
+
+    def __delitem__(self, key):
+        if self.store.pop(self.ns, self._key(key), _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def pop(self, key, default=_MISSING):
+        value = self.store.pop(self.ns, self._key(key), _MISSING)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        return value
+
+    def setdefault(self, key, default=None):
+        value = self.store.get(self.ns, self._key(key), _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            return default
+        return value
+
+    def __contains__(self, key):
+        return self.store.contains(self.ns, self._key(key))
+
+    def keys(self):
+        return [self._unkey(k) for k, _ in self.store.items(self.ns)]
+
+    def items(self):
+        return [(self._unkey(k), v) for k, v in self.store.items(self.ns)]
+
+    def values(self):
+        return [v for _, v in self.store.items(self.ns)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.store.items(self.ns))
+
+    def clear(self):
+        self.store.clear(self.ns)
+
+
+class StateSet:
+    """set-подобный доступ (значение в хранилище — просто True)"""
+
+    def __init__(self, store, ns, ttl=None, key_type=int):
+        self._map = StateMap(store, ns, ttl=ttl, key_type=key_type)
+
+    def add(self, item):
+        self._map[item] = True
+
+    def discard(self, item):
+        self._map.pop(item, None)
+
+    def remove(self, item):
+        del self._map[item]
+
+    def __contains__(self, item):
+        return item in self._map
+
+    def __iter__(self):
+        return iter(self._map.keys())
+
+    def __len__(self):
+        return len(self._map)
+
+    def clear(self):
+        self._map.clear()
+
+
+class StateListMap:
+    """Ключ -> список с атомарными append / pop (пачки медиа по chat_id)"""
+
+    def __init__(self, store, ns, ttl=None, key_type=int):
+        self.store = store
+        self.ns = ns
+        self.ttl = ttl
+        self.key_type = key_type
+
+    def append(self, key, item) -> int:
+        """Добавить элемент; возвращает новую длину списка"""
+        return self.store.append(self.ns, str(key), item, ttl=self.ttl)
+
+    def get(self, key, default=None):
+        items = self.store.get_list(self.ns, str(key))
+        return items if items else default
+
+    def __getitem__(self, key):
+        items = self.store.get_list(self.ns, str(key))
+        if not items:
+            raise KeyError(key)
+        return items
+
+    def __setitem__(self, key, items):
+        self.store.pop_list(self.ns, str(key))
+        for item in items:
+            self.store.append(self.ns, str(key), item, ttl=self.ttl)
+
+    def pop(self, key, default=None):
+        items = self.store.pop_list(self.ns, str(key))
+        return items if items else default
+
+    def __contains__(self, key):
+        return bool(self.store.get_list(self.ns, str(key)))
+
+    def keys(self):
+        res = []
+        for k in self.store.list_keys(self.ns):
+            try:
+                res.append(self.key_type(k))
+            except (TypeError, ValueError):
+                res.append(k)
+        return res
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.store.list_keys(self.ns))
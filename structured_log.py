@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Неблокирующий журнал в формате JSON lines.
+Вызывающий поток только кладёт запись в ограниченную очередь (при
+переполнении запись отбрасывается и считается в dropped). Фоновый поток
+забирает записи пачками, пишет их в файлы и ротирует файл по размеру
+(log.txt -> log.txt.1 -> ... -> log.txt.N).
+
+Запись: {"ts": "2024-01-31T12:00:05.123Z", "level": "error", "tag": "ERROR", "msg": "..."}
+"""
+import os
+import json
+import queue
+import atexit
+import datetime
+import threading
+
+from config import env_int
+
+
+LOG_FILE = os.getenv("LOG_FILE", "log.txt")
+LOG_ERRORS_FILE = os.getenv("LOG_ERRORS_FILE", "critical_errors.log")
+LOG_SLOW_FILE = os.getenv("LOG_SLOW_FILE", "slow_updates.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").strip().lower()
+LOG_QUEUE_SIZE = env_int("LOG_QUEUE_SIZE", 10000)
+LOG_MAX_BYTES = env_int("LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_BACKUPS = env_int("LOG_BACKUPS", 5)
+try:
+    LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+except ValueError:
+    LOG_FLUSH_INTERVAL = 0.5
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "critical": 50}
+# Метки MainProtokol(ts=...) -> уровень; остальные метки — info
+TAG_LEVELS = {"DEBUG": "debug", "INFO": "info", "WARN": "warning", "WARNING": "warning",
+              "ERROR": "error", "CRITICAL": "critical",
+              # Метки ошибок отправки в bot.py (send_message, _call_api)
+              "Помилка надсилання": "error", "Помилка мережі": "error"}
+
+
+def level_for(tag: str) -> str:
+    tag = str(tag)
+    if tag in TAG_LEVELS:
+        return TAG_LEVELS[tag]
+    low = tag.lower()
+    if "error" in low or "fail" in low or "exception" in low:
+        return "error"
+    return "info"
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class RotatingFile:
+    """Файл с ротацией по размеру; не потокобезопасен — пишет под блокировкой AsyncJsonLogger"""
+
+    def __init__(self, path: str, max_bytes: int = None, backups: int = None):
+        self.path = path
+        self.max_bytes = LOG_MAX_BYTES if max_bytes is None else max_bytes
+        self.backups = LOG_BACKUPS if backups is None else backups
+        self._f = None
+        self._size = 0
+
+    def _open(self):
+        self._f = open(self.path, "a", encoding="utf-8")
+        self._size = self._f.tell()
+
+    def _rotate(self):
+        self.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, lines: list):
+        if self._f is None:
+            self._open()
+        chunk = []
+        for line in lines:
+            size = len(line.encode("utf-8"))
+            if self.max_bytes and self._size and self._size + size > self.max_bytes:
+                self._f.write("".join(chunk))
+                chunk = []
+                self._rotate()
+                self._open()
+            chunk.append(line)
+            self._size += size
+        self._f.write("".join(chunk))
+
+    def flush(self):
+        if self._f is not None:
+            self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class AsyncJsonLogger:
+    """Очередь записей + поток, пишущий их пачками в файлы (sink -> RotatingFile)"""
+
+    def __init__(self, files: dict = None, level: str = None, queue_size: int = None,
+                 flush_interval: float = None, batch_size: int = 500):
+        self.files = {name: RotatingFile(path) for name, path in (files or {"main": LOG_FILE}).items()}
+        self.min_level = LEVELS.get(level or LOG_LEVEL, LEVELS["info"])
+        self.flush_interval = flush_interval or LOG_FLUSH_INTERVAL
+        self.batch_size = batch_size
+        self._q = queue.Queue(maxsize=queue_size or LOG_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        # Обычно пишет только поток записи, но после close() — сами вызывающие потоки
+        self._write_lock = threading.Lock()
+        self._counters = {"written": 0, "dropped": 0, "filtered": 0, "write_errors": 0}
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def emit(self, record: dict, sink: str = "main"):
+        """Положить запись в очередь; не блокирует"""
+        if LEVELS.get(record.get("level"), LEVELS["info"]) < self.min_level:
+            self._count("filtered")
+            return
+        record.setdefault("ts", _now_iso())
+        if self._closed:
+            self._write({sink: [record]})
+            return
+        try:
+            self._q.put_nowait((sink, record))
+        except queue.Full:
+            self._count("dropped")
+
+    def log(self, msg, tag="Запис", level: str = None, **fields):
+        record = {"ts": _now_iso(), "level": level or level_for(tag), "tag": str(tag), "msg": str(msg)}
+        record.update(fields)
+        self.emit(record)
+
+    def _write(self, batch: dict):
+        for sink, records in batch.items():
+            f = self.files.get(sink) or self.files["main"]
+            lines = [json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records]
+            try:
+                with self._write_lock:
+                    f.write(lines)
+                    f.flush()
+                self._count("written", len(records))
+            except Exception as e:
+                self._count("write_errors")
+                print("Ошибка записи в лог:", e)
+
+    def _drain(self, first=None) -> dict:
+        batch = {}
+        item = first
+        n = 0
+        while True:
+            if item is not None:
+                batch.setdefault(item[0], []).append(item[1])
+                n += 1
+            if n >= self.batch_size:
+                break
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while not self._closed:
+            try:
+                first = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._write(self._drain(first))
+
+    def close(self):
+        """Дописать очередь и закрыть файлы (вызывается и из atexit)"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 1)
+        while not self._q.empty():
+            self._write(self._drain())
+        with self._write_lock:
+            for f in self.files.values():
+                f.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            res = dict(self._counters)
+        res["queued"] = self._q.qsize()
+        return res
+
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+def get_logger() -> AsyncJsonLogger:
+    """Общий журнал процесса: log.txt (main), critical_errors.log (errors), slow_updates.log (slow).
+    Свой на каждый pid — поток записи не переживает fork воркера"""
+    pid = os.getpid()
+    with _loggers_lock:
+        logger = _loggers.get(pid)
+        if logger is None:
+            logger = _loggers[pid] = AsyncJsonLogger(
+                {"main": LOG_FILE, "errors": LOG_ERRORS_FILE, "slow": LOG_SLOW_FILE}
+            ).start()
+        return logger
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Чтение конверта и полей апдейта регулярками codec.py без разбора тела"""
+import json
+import time
+import threading
+
+import codec
+
+
+def _body(update: dict) -> bytes:
+    """Как присылает Telegram: компактный JSON, перенос строки после update_id"""
+    raw = json.dumps(update, ensure_ascii=False, separators=(",", ":"))
+    return raw.replace(",", ",\n", 1).encode("utf-8")
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": "Тарас", "language_code": "uk"}
+
+
+def _message(chat_id: int, from_id: int, **content) -> dict:
+    return {"message_id": 7, "from": _user(from_id), "chat": {"id": chat_id, "type": "private"},
+            "date": 1700000000, **content}
+
+
+def _callback(from_id: int, data: str, **message_content) -> dict:
+    return {"id": "1", "from": _user(from_id),
+            "message": _message(from_id, 1000, text="…", **message_content),
+            "chat_instance": "1", "data": data}
+
+
+def test_envelope_reads_id_and_kind_without_loading():
+    update = codec.lazy_update(_body({"update_id": 42, "message": _message(5, 5, text="hi")}))
+    assert update is not None
+    assert update.get("update_id") == 42
+    assert update.kind == "message"
+    assert "message" in update and "callback_query" not in update
+    assert not update.loaded
+
+
+def test_envelope_allows_whitespace():
+    raw = b' { "update_id" : 3 ,\n  "edited_message" : {"message_id":1,"chat":{"id":9}}}\n'
+    update = codec.lazy_update(raw)
+    assert update is not None and update.kind == "edited_message"
+    assert update.peek_chat_id() == 9
+
+
+def test_unrecognized_envelope_is_not_lazy():
+    assert codec.lazy_update(b'{"message":{"chat":{"id":1}},"update_id":1}') is None
+    assert codec.lazy_update(b'{"update_id":1,"message":{"chat":{"id":1') is None
+    assert codec.lazy_update('{"update_id":1,"message":{}}') is None
+
+
+def test_peek_chat_id_message_skips_from_and_sender_chat():
+    msg = _message(-1001234567890, 777, text="x")
+    msg = {"message_id": 1, "from": _user(777), "sender_chat": {"id": -100555, "type": "channel"},
+           **{k: v for k, v in msg.items() if k not in ("message_id", "from")}}
+    update = codec.lazy_update(_body({"update_id": 1, "message": msg}))
+    assert update.peek_chat_id() == -1001234567890
+    assert not update.loaded
+
+
+def test_peek_chat_id_callback_is_presser():
+    update = codec.lazy_update(_body({"update_id": 1, "callback_query": _callback(555, "stats")}))
+    assert update.peek_chat_id() == 555
+
+
+def test_peek_chat_id_unknown_kind():
+    update = codec.lazy_update(_body({"update_id": 1, "poll": {"id": "1", "chat": {"id": 5}}}))
+    assert update.peek_chat_id() is None
+
+
+def test_peek_callback_data_takes_last_field():
+    # "data" встречается в сообщении раньше (web_app_data), но data нажатой кнопки — последнее поле
+    cq = _callback(555, "confirm_addstat|10000001|42|3", web_app_data={"data": "other", "button_text": "b"})
+    update = codec.lazy_update(_body({"update_id": 1, "callback_query": cq}))
+    assert update.peek_callback_data() == "confirm_addstat|10000001|42|3"
+    assert not update.loaded
+
+
+def test_peek_callback_data_ignores_escaped_text():
+    cq = _callback(555, "reply_5_7")
+    cq["message"]["text"] = 'see "data":"evil_x"'
+    update = codec.lazy_update(_body({"update_id": 1, "callback_query": cq}))
+    assert update.peek_callback_data() == "reply_5_7"
+
+
+def test_peek_callback_data_other_kinds():
+    update = codec.lazy_update(_body({"update_id": 1, "message": _message(5, 5, text='"data":"x"')}))
+    assert update.peek_callback_data() is None
+
+
+def test_peeks_match_loaded_values():
+    for payload in ({"message": _message(-100777, 5, text="a")},
+                    {"callback_query": _callback(31337, "addstat_-100777_12")}):
+        raw = _body({"update_id": 9, **payload})
+        update = codec.lazy_update(raw)
+        chat_id, data = update.peek_chat_id(), update.peek_callback_data()
+        full = json.loads(raw)
+        assert update == full
+        if "message" in full:
+            assert chat_id == full["message"]["chat"]["id"]
+        else:
+            assert chat_id == full["callback_query"]["from"]["id"]
+            assert data == full["callback_query"]["data"]
+        # После разбора peek_* ничего не ищут
+        assert update.peek_chat_id() is None
+
+
+def test_broken_body_loads_as_empty_update():
+    update = codec.lazy_update(b'{"update_id":5,\n"message":{"chat":{"id":1},}')
+    assert update is not None
+    assert update.load() is False
+    assert update.error
+    assert dict(update) == {"update_id": 5}
+
+
+def test_concurrent_load_parses_once(monkeypatch):
+    # Медленный разбор: без блокировки второй поток успел бы начать свой
+    calls = []
+    real_loads = codec.loads
+
+    def slow_loads(raw):
+        calls.append(raw)
+        time.sleep(0.05)
+        return real_loads(raw)
+
+    monkeypatch.setattr(codec, "loads", slow_loads)
+    update = codec.lazy_update(_body({"update_id": 1, "message": _message(5, 5, text="x")}))
+    barrier = threading.Barrier(4)
+    seen = []
+
+    def reader():
+        barrier.wait()
+        seen.append(id(update["message"]))
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert len(calls) == 1
+    assert len(set(seen)) == 1
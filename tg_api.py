@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Клиент Telegram Bot API с постоянным пулом соединений.
+Один экземпляр на процесс (воркер): все исходящие запросы идут через общий
+requests.Session, поэтому TCP/TLS-рукопожатие делается один раз на соединение.
+Запросы без файлов уходят телом application/json (codec.encode_body): вложенные
+reply_markup и media кодируются вместе с остальными полями за один проход.
+"""
+import os
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe_api_call
+from tracing import add_span
+from codec import encode_body
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").strip().rstrip("/")
+
+try:
+    TG_POOL_SIZE = int(os.getenv("TG_POOL_SIZE", "20"))
+except ValueError:
+    TG_POOL_SIZE = 20
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class BotApiMethods:
+    """Типизированные обёртки над методами Bot API; транспорт — call() наследника (token, base_url задаёт он же)"""
+
+    def method_url(self, method: str) -> str:
+        return f"{self.base_url}/bot{self.token}/{method}"
+
+    def call(self, method: str, data=None, files=None, timeout=10):
+        raise NotImplementedError
+
+    # ---- типизированные методы ----
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode=None,
+                     disable_web_page_preview=None, timeout=8):
+        payload = {'chat_id': chat_id, 'text': text}
+        if reply_markup:
+            # dict кодируется вместе с телом; keyboards.EncodedMarkup вклеивается как есть
+            payload['reply_markup'] = reply_markup
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        if disable_web_page_preview is not None:
+            payload['disable_web_page_preview'] = disable_web_page_preview
+        return self.call("sendMessage", data=payload, timeout=timeout)
+
+    def _send_file(self, method, field, chat_id, file_id, caption=None, parse_mode=None, timeout=10):
+        payload = {"chat_id": chat_id, field: file_id}
+        if caption:
+            payload["caption"] = caption
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        return self.call(method, data=payload, timeout=timeout)
+
+    def send_photo(self, chat_id, photo, caption=None, parse_mode=None, timeout=10):
+        return self._send_file("sendPhoto", "photo", chat_id, photo, caption, parse_mode, timeout)
+
+    def send_video(self, chat_id, video, caption=None, parse_mode=None, timeout=10):
+        return self._send_file("sendVideo", "video", chat_id, video, caption, parse_mode, timeout)
+
+    def send_document(self, chat_id, document, caption=None, parse_mode=None, timeout=10):
+        return self._send_file("sendDocument", "document", chat_id, document, caption, parse_mode, timeout)
+
+    def send_media_group(self, chat_id, media: list, timeout=10):
+        payload = {"chat_id": chat_id, "media": media}
+        return self.call("sendMediaGroup", data=payload, timeout=timeout)
+
+    def send_chat_action(self, chat_id, action='typing', timeout=3):
+        return self.call("sendChatAction", data={'chat_id': chat_id, 'action': action}, timeout=timeout)
+
+    def set_webhook(self, url: str, timeout=5):
+        return self.call("setWebhook", data={"url": url}, timeout=timeout)
+
+
+class BotApiClient(BotApiMethods):
+    """Типизированные обёртки над методами Bot API поверх пула keep-alive соединений"""
+
+    def __init__(self, token: str, base_url: str = None, pool_size: int = None):
+        self.token = token
+        self.base_url = (base_url or TELEGRAM_API_URL).rstrip("/")
+        self.pool_size = pool_size or TG_POOL_SIZE
+        self.session = requests.Session()
+        # Один хост (api.telegram.org), поэтому важен именно pool_maxsize
+        self._adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size, pool_block=False)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._by_method = {}
+
+    def call(self, method: str, data=None, files=None, timeout=10):
+        """POST на метод Bot API. Сетевые ошибки пробрасываются вызывающему коду."""
+        headers = None
+        if files is None and isinstance(data, dict):
+            data = encode_body(data)
+            headers = JSON_HEADERS
+        with self._lock:
+            self._requests += 1
+            self._by_method[method] = self._by_method.get(method, 0) + 1
+        started = time.perf_counter()
+        try:
+            r = self.session.post(self.method_url(method), data=data, files=files, headers=headers, timeout=timeout)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            observe_api_call(method, started, "error")
+            add_span(f"api:{method}", started, status="error")
+            raise
+        observe_api_call(method, started, r.status_code)
+        add_span(f"api:{method}", started, status=r.status_code)
+        return r
+
+    # ---- статистика ----
+
+    def stats(self) -> dict:
+        """Счётчики запросов и переиспользования соединений"""
+        opened = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += getattr(pool, "num_connections", 0)
+        with self._lock:
+            total = self._requests
+            errors = self._errors
+            by_method = dict(self._by_method)
+        return {
+            "requests": total,
+            "errors": errors,
+            "connections_opened": opened,
+            "connections_reused": max(total - opened, 0),
+            "pool_size": self.pool_size,
+            "by_method": by_method,
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(token: str = None) -> BotApiClient:
+    """Общий клиент на процесс; после fork (gunicorn) создаётся заново"""
+    token = token or os.getenv("API_TOKEN")
+    key = (token, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = BotApiClient(token)
+                _clients[key] = client
+    return client
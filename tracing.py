@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Лёгкая трассировка обработки апдейта.
+trace("webhook") открывает трассу с trace id (contextvars — своя в каждом
+потоке), span("save_event") внутри неё замеряет фазу. Вне трассы span()
+почти ничего не стоит, поэтому его можно ставить в общие модули (БД, Bot API,
+блокировки). Трасса дольше SLOW_UPDATE_MS целиком уходит в on_slow(record).
+"""
+import os
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    SLOW_UPDATE_MS = int(os.getenv("SLOW_UPDATE_MS", "1000"))
+except ValueError:
+    SLOW_UPDATE_MS = 1000
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1").strip() == "1"
+# Больше спанов в одной трассе не записываем (циклы по медиа и т.п.)
+TRACE_MAX_SPANS = 200
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "attrs", "started", "spans", "depth", "dropped")
+
+    def __init__(self, name: str, attrs: dict):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.dropped = 0
+
+    def record(self) -> dict:
+        total = time.perf_counter() - self.started
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "total_ms": round(total * 1000, 2),
+            **self.attrs,
+            "spans": [
+                {"name": n, "depth": d, "start_ms": round(s * 1000, 2), "ms": round(dur * 1000, 2), **a}
+                for n, d, s, dur, a in self.spans
+            ],
+            "spans_dropped": self.dropped,
+        }
+
+
+_on_slow = None
+
+
+def set_slow_handler(fn):
+    """fn(record: dict) вызывается для каждой трассы дольше порога"""
+    global _on_slow
+    _on_slow = fn
+
+
+def current_trace_id():
+    tr = _current.get()
+    return tr.trace_id if tr is not None else None
+
+
+@contextmanager
+def trace(name: str, threshold_ms: int = None, **attrs):
+    """Корневая трасса; если трасса уже открыта (вложенный вызов) — работает как span()"""
+    if not TRACE_ENABLED:
+        yield None
+        return
+    if _current.get() is not None:
+        with span(name, **attrs):
+            yield _current.get()
+        return
+    tr = Trace(name, attrs)
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+        threshold = SLOW_UPDATE_MS if threshold_ms is None else threshold_ms
+        if _on_slow is not None and (time.perf_counter() - tr.started) * 1000 >= threshold:
+            try:
+                _on_slow(tr.record())
+            except Exception:
+                pass
+
+
+@contextmanager
+def span(name: str, **attrs):
+    tr = _current.get()
+    if tr is None:
+        yield
+        return
+    started = time.perf_counter()
+    tr.depth += 1
+    try:
+        yield
+    finally:
+        tr.depth -= 1
+        if len(tr.spans) < TRACE_MAX_SPANS:
+            tr.spans.append((name, tr.depth, started - tr.started, time.perf_counter() - started, attrs))
+        else:
+            tr.dropped += 1
+
+
+def add_span(name: str, started: float, **attrs):
+    """Спан задним числом (started — time.perf_counter()), например для ожидания блокировки"""
+    tr = _current.get()
+    if tr is None:
+        return
+    if len(tr.spans) < TRACE_MAX_SPANS:
+        tr.spans.append((name, tr.depth, started - tr.started, time.perf_counter() - started, attrs))
+    else:
+        tr.dropped += 1
+
+
+def traced(name: str = None):
+    """Декоратор: вызов функции — спан текущей трассы"""
+    def deco(fn):
+        span_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
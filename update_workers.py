@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Пул воркеров для режима ack-first: webhook только кладёт апдейт в очередь и
+сразу отвечает Telegram, обработка идёт в фоновых потоках.
+Апдейты шардируются по chat_id: один чат всегда попадает в один поток
+(порядок сохраняется), разные чаты обрабатываются параллельно.
+"""
+import os
+import time
+import queue
+import threading
+
+from config import print_log
+
+try:
+    UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+except ValueError:
+    UPDATE_WORKERS = 8
+try:
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+except ValueError:
+    UPDATE_QUEUE_SIZE = 1000
+
+_UPDATE_KINDS = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+
+def update_chat_id(update: dict):
+    """chat_id апдейта (для callback_query — id пользователя, как в webhook())"""
+    peek = getattr(update, 'peek_chat_id', None)
+    if peek is not None:
+        # codec.LazyUpdate: id без разбора тела — разбор останется воркеру
+        chat_id = peek()
+        if chat_id is not None:
+            return chat_id
+    call = update.get('callback_query')
+    if isinstance(call, dict):
+        return (call.get('from') or {}).get('id')
+    for kind in _UPDATE_KINDS:
+        msg = update.get(kind)
+        if isinstance(msg, dict):
+            return (msg.get('chat') or {}).get('id')
+    return None
+
+
+class ShardedUpdatePool:
+    """N потоков, у каждого своя ограниченная очередь; шард = chat_id % N"""
+
+    def __init__(self, handler, workers: int = None, queue_size: int = None, log=None):
+        self.handler = handler
+        self.workers = workers or UPDATE_WORKERS
+        # Общий лимит делится между шардами
+        self.queue_size = queue_size or UPDATE_QUEUE_SIZE
+        per_shard = max(self.queue_size // self.workers, 1)
+        self.log = log or print_log
+        self._queues = [queue.Queue(maxsize=per_shard) for _ in range(self.workers)]
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "processed": 0, "rejected": 0, "errors": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._busy_total = 0.0
+        self._threads = []
+        for i, q in enumerate(self._queues):
+            th = threading.Thread(target=self._worker, args=(q,), name=f"update-worker-{i}", daemon=True)
+            th.start()
+            self._threads.append(th)
+
+    def shard_for(self, update: dict) -> int:
+        chat_id = update_chat_id(update)
+        if chat_id is None:
+            chat_id = update.get('update_id', 0)
+        return hash(chat_id) % self.workers
+
+    def submit(self, update: dict) -> bool:
+        """Поставить апдейт в очередь шарда; False — очередь переполнена (backpressure)"""
+        q = self._queues[self.shard_for(update)]
+        try:
+            q.put_nowait((time.monotonic(), update))
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            return False
+        with self._lock:
+            self._counters["submitted"] += 1
+        return True
+
+    def _worker(self, q):
+        while True:
+            enqueued, update = q.get()
+            if update is None:
+                return
+            started = time.monotonic()
+            try:
+                self.handler(update)
+                failed = False
+            except Exception as e:
+                failed = True
+                self.log(f"update {update.get('update_id')} failed: {e}", 'ERROR')
+            finished = time.monotonic()
+            with self._lock:
+                self._counters["processed"] += 1
+                if failed:
+                    self._counters["errors"] += 1
+                wait = started - enqueued
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._busy_total += finished - started
+
+    def stats(self) -> dict:
+        depths = [q.qsize() for q in self._queues]
+        with self._lock:
+            res = dict(self._counters)
+            processed = res["processed"] or 1
+            res.update({
+                "workers": self.workers,
+                "queue_capacity": sum(q.maxsize for q in self._queues),
+                "depth": sum(depths),
+                "depth_by_shard": depths,
+                "avg_queue_wait_ms": round(self._wait_total / processed * 1000, 2),
+                "max_queue_wait_ms": round(self._wait_max * 1000, 2),
+                "avg_handle_ms": round(self._busy_total / processed * 1000, 2),
+            })
+        return res
+
+    def stop(self, timeout: float = 10.0):
+        """Обработать уже принятые апдейты и остановить потоки"""
+        for q in self._queues:
+            q.put((time.monotonic(), None))
+        deadline = time.monotonic() + timeout
+        for th in self._threads:
+            th.join(max(deadline - time.monotonic(), 0.1))